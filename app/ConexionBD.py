@@ -1,30 +1,521 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
 import psycopg2.extensions
+from flask import g, has_app_context
+
+from instrumentacion import CursorInstrumentado
+
+# Parámetros de conexión (se pueden sobrescribir con variables de entorno)
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'database': os.environ.get('DB_NAME', 'Gobierno2'),
+    'user': os.environ.get('DB_USER', 'postgres'),
+    'password': os.environ.get('DB_PASSWORD', '070905'),
+}
+
+# Configuración del pool de conexiones
+POOL_MIN_CONEXIONES = int(os.environ.get('DB_POOL_MIN', 2))
+POOL_MAX_CONEXIONES = int(os.environ.get('DB_POOL_MAX', 20))
+POOL_TIEMPO_INACTIVO = float(os.environ.get('DB_POOL_IDLE_TIMEOUT', 300))   # segundos antes de cerrar una conexión ociosa
+POOL_TIEMPO_ESPERA = float(os.environ.get('DB_POOL_WAIT_TIMEOUT', 10))      # segundos de espera cuando el pool está agotado
+POOL_VERIFICAR_TRAS = float(os.environ.get('DB_POOL_CHECK_AFTER', 30))      # ociosidad tras la cual se hace ping (SELECT 1)
+
+
+def _crear_conexion_fisica():
+    """Abre una conexión real a PostgreSQL y configura UTF-8 una sola vez"""
+    conexion = psycopg2.connect(client_encoding='UTF8', **DB_CONFIG)
+
+    # Todas las consultas pasan por el cursor instrumentado (latencia, consultas lentas, N+1)
+    conexion.cursor_factory = CursorInstrumentado
+
+    # Establecer el encoding del cliente explícitamente
+    conexion.set_client_encoding('UTF8')
+
+    cursor = conexion.cursor()
+    cursor.execute("SET CLIENT_ENCODING TO 'UTF8';")
+    cursor.execute("SET NAMES 'UTF8';")
+    conexion.commit()
+    cursor.close()
+
+    return conexion
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones thread-safe.
+    - Mantiene entre `minimo` y `maximo` conexiones físicas
+    - Cierra las conexiones ociosas por encima del mínimo tras `tiempo_inactivo`
+    - Verifica la salud de la conexión al prestarla
+    - Lleva métricas de uso y de agotamiento
+    """
+
+    def __init__(self, minimo=POOL_MIN_CONEXIONES, maximo=POOL_MAX_CONEXIONES,
+                 tiempo_inactivo=POOL_TIEMPO_INACTIVO, tiempo_espera=POOL_TIEMPO_ESPERA,
+                 verificar_tras=POOL_VERIFICAR_TRAS):
+        self.minimo = minimo
+        self.maximo = maximo
+        self.tiempo_inactivo = tiempo_inactivo
+        self.tiempo_espera = tiempo_espera
+        self.verificar_tras = verificar_tras
+
+        self._condicion = threading.Condition()
+        self._libres = []       # lista de (conexion, instante_devolucion)
+        self._en_uso = 0
+        self._total = 0         # conexiones físicas abiertas (libres + en uso)
+
+        self._metricas = {
+            'conexiones_creadas': 0,
+            'conexiones_cerradas': 0,
+            'conexiones_descartadas': 0,
+            'prestamos': 0,
+            'esperas': 0,
+            'agotamientos': 0,
+            'tiempo_espera_total': 0.0,
+            'max_en_uso': 0,
+        }
+
+    def obtener(self):
+        """Presta una conexión física; devuelve None si no hay disponibles a tiempo"""
+        limite = time.monotonic() + self.tiempo_espera
+        inicio = time.monotonic()
+        espero = False
+
+        while True:
+            with self._condicion:
+                self._cerrar_ociosas()
+
+                # 1. Reutilizar una conexión libre (la más reciente primero)
+                if self._libres:
+                    candidata = self._libres.pop()
+                # 2. Abrir una nueva si no se alcanzó el máximo
+                elif self._total < self.maximo:
+                    self._total += 1
+                    break
+                # 3. Pool agotado: esperar a que alguien devuelva una conexión
+                else:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self._metricas['agotamientos'] += 1
+                        print(f"⚠️ Pool de conexiones agotado ({self._en_uso}/{self.maximo} en uso)")
+                        return None
+                    if not espero:
+                        espero = True
+                        self._metricas['esperas'] += 1
+                    self._condicion.wait(restante)
+                    continue
+
+            # Verificar la candidata fuera del lock: un ping a una conexión caída
+            # puede tardar hasta que venza el socket y no debe frenar al resto
+            conexion, devuelta_en = candidata
+            sana = self._esta_sana(conexion, devuelta_en)
+            with self._condicion:
+                if sana:
+                    return self._registrar_prestamo(conexion, inicio, espero)
+                self._descartar(conexion)
+                self._condicion.notify()
+
+        # Abrir la conexión física fuera del lock
+        try:
+            conexion = _crear_conexion_fisica()
+        except Exception:
+            with self._condicion:
+                self._total -= 1
+                self._condicion.notify()
+            raise
+
+        with self._condicion:
+            self._metricas['conexiones_creadas'] += 1
+            return self._registrar_prestamo(conexion, inicio, espero)
+
+    def devolver(self, conexion):
+        """Devuelve una conexión al pool, limpiando cualquier transacción abierta"""
+        reutilizable = not conexion.closed
+        if reutilizable:
+            try:
+                if conexion.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conexion.rollback()
+            except Exception:
+                reutilizable = False
+
+        with self._condicion:
+            self._en_uso -= 1
+            if reutilizable:
+                self._libres.append((conexion, time.monotonic()))
+            else:
+                self._descartar(conexion)
+            self._condicion.notify()
+
+    def metricas(self):
+        """Retorna una copia de las métricas actuales del pool"""
+        with self._condicion:
+            datos = dict(self._metricas)
+            datos.update({
+                'en_uso': self._en_uso,
+                'libres': len(self._libres),
+                'total': self._total,
+                'minimo': self.minimo,
+                'maximo': self.maximo,
+            })
+            return datos
+
+    def cerrar_todas(self):
+        """Cierra todas las conexiones libres (las prestadas se cierran al devolverse)"""
+        with self._condicion:
+            while self._libres:
+                conexion, _ = self._libres.pop()
+                self._descartar(conexion)
+
+    # ----- Auxiliares (se llaman con el lock tomado, salvo _esta_sana) -----
+
+    def _registrar_prestamo(self, conexion, inicio, espero):
+        self._en_uso += 1
+        self._metricas['prestamos'] += 1
+        self._metricas['max_en_uso'] = max(self._metricas['max_en_uso'], self._en_uso)
+        if espero:
+            self._metricas['tiempo_espera_total'] += time.monotonic() - inicio
+        return conexion
+
+    def _esta_sana(self, conexion, devuelta_en):
+        if conexion.closed:
+            return False
+        if time.monotonic() - devuelta_en < self.verificar_tras:
+            return True
+        # Conexión ociosa por un tiempo: hacer ping antes de prestarla
+        try:
+            with conexion.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conexion.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _cerrar_ociosas(self):
+        if len(self._libres) == 0 or self._total <= self.minimo:
+            return
+        ahora = time.monotonic()
+        conservar = []
+        # _libres está ordenada de más antigua a más reciente
+        for conexion, devuelta_en in self._libres:
+            if self._total > self.minimo and ahora - devuelta_en > self.tiempo_inactivo:
+                self._total -= 1
+                self._metricas['conexiones_cerradas'] += 1
+                try:
+                    conexion.close()
+                except Exception:
+                    pass
+            else:
+                conservar.append((conexion, devuelta_en))
+        self._libres = conservar
+
+    def _descartar(self, conexion):
+        self._total -= 1
+        self._metricas['conexiones_descartadas'] += 1
+        try:
+            conexion.close()
+        except Exception:
+            pass
+
+
+class ConexionAgrupada:
+    """
+    Envoltorio de una conexión prestada por el pool.
+    Se comporta como una conexión de psycopg2, pero close() la devuelve al pool
+    en lugar de cerrarla (los controladores no necesitan cambios).
+    """
+
+    def __init__(self, conexion, pool):
+        object.__setattr__(self, '_conexion', conexion)
+        object.__setattr__(self, '_pool', pool)
+
+    def close(self):
+        conexion = self._conexion
+        if conexion is None:
+            return
+        object.__setattr__(self, '_conexion', None)
+        self._pool.devolver(conexion)
+
+    @property
+    def closed(self):
+        return self._conexion is None or self._conexion.closed
+
+    def __getattr__(self, nombre):
+        conexion = self._conexion
+        if conexion is None:
+            raise psycopg2.InterfaceError('connection already closed')
+        return getattr(conexion, nombre)
+
+    def __setattr__(self, nombre, valor):
+        setattr(self._conexion, nombre, valor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        # Mismo comportamiento que psycopg2: commit si no hubo error, rollback si lo hubo
+        if tipo is None:
+            self._conexion.commit()
+        else:
+            self._conexion.rollback()
+        return False
+
+    def __del__(self):
+        # Red de seguridad: si un controlador no llamó a close(), devolver la conexión
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class _ConexionPeticion:
+    """Estado de la conexión de la unidad de trabajo en curso (ligada a g o al hilo)"""
+
+    def __init__(self, conexion):
+        self.conexion = conexion        # ConexionAgrupada prestada por el pool
+        self.profundidad = 0            # nivel de anidamiento de transaccion()
+        self.fallida = False            # la unidad de trabajo debe deshacerse
+        self.al_confirmar = []          # funciones a ejecutar tras el COMMIT de la unidad
+
+    @property
+    def en_transaccion(self):
+        return self.profundidad > 0
+
+    def estado_transaccion(self):
+        return self.conexion.get_transaction_status()
+
+
+class ConexionCompartida:
+    """
+    Conexión entregada por get_connection() dentro de transaccion().
+    Todas las llamadas de la unidad de trabajo comparten la misma conexión
+    física; commit() y close() se difieren hasta que termina, de modo que los
+    controladores anidados se unen a ella. Si se sigue usando después de la
+    unidad, commit() confirma y close() descarta lo no confirmado.
+    """
+
+    def __init__(self, estado):
+        object.__setattr__(self, '_estado', estado)
+        object.__setattr__(self, '_cerrada', False)
+
+    def commit(self):
+        if self._estado.en_transaccion:
+            return
+        self._estado.conexion.commit()
+
+    def rollback(self):
+        self._estado.conexion.rollback()
+        if self._estado.en_transaccion:
+            self._estado.fallida = True
+
+    def close(self):
+        if self._cerrada:
+            return
+        object.__setattr__(self, '_cerrada', True)
+        estado = self._estado
+        if estado.en_transaccion or estado.conexion.closed:
+            return
+        if estado.estado_transaccion() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            estado.conexion.rollback()
+
+    @property
+    def closed(self):
+        return self._cerrada or self._estado.conexion.closed
+
+    def __getattr__(self, nombre):
+        if self._cerrada:
+            raise psycopg2.InterfaceError('connection already closed')
+        return getattr(self._estado.conexion, nombre)
+
+    def __setattr__(self, nombre, valor):
+        setattr(self._estado.conexion, nombre, valor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        if tipo is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+
+class UnidadTrabajo:
+    """Resultado de un bloque transaccion(): permite saber si se confirmó"""
+
+    def __init__(self):
+        self.confirmada = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_hilo_local = threading.local()
+
+
+def obtener_pool():
+    """Retorna el pool global, creándolo en el primer uso"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolConexiones()
+    return _pool
+
+
+def obtener_metricas_pool():
+    """Métricas del pool: uso actual, esperas y agotamientos"""
+    return obtener_pool().metricas()
+
+
+def _prestar_conexion():
+    pool = obtener_pool()
+    conexion = pool.obtener()
+    if conexion is None:
+        return None
+    return ConexionAgrupada(conexion, pool)
+
+
+def _estado_actual():
+    if has_app_context():
+        return g.get('_conexion_bd')
+    return getattr(_hilo_local, 'conexion_bd', None)
+
+
+def _ligar_estado(estado):
+    if has_app_context():
+        g._conexion_bd = estado
+    else:
+        _hilo_local.conexion_bd = estado
+
+
+def _desligar_estado():
+    if has_app_context():
+        g.pop('_conexion_bd', None)
+    else:
+        _hilo_local.conexion_bd = None
+
+
+def _obtener_o_crear_estado():
+    estado = _estado_actual()
+    if estado is not None and not estado.conexion.closed:
+        return estado, False
+    conexion = _prestar_conexion()
+    if conexion is None:
+        return None, False
+    estado = _ConexionPeticion(conexion)
+    _ligar_estado(estado)
+    return estado, True
+
 
 def get_connection():
     try:
-        # Configurar conexión con UTF-8 explícitamente
-        conexion = psycopg2.connect(
-            host="localhost",
-            database="Gobierno2",
-            user="postgres",
-            password="070905",
-            client_encoding='UTF8'
-        )
-        
-        # Establecer el encoding del cliente explícitamente
-        conexion.set_client_encoding('UTF8')
-        
-        # Obtener el cursor y asegurar que use UTF-8
-        cursor = conexion.cursor()
-        cursor.execute("SET CLIENT_ENCODING TO 'UTF8';")
-        cursor.execute("SET NAMES 'UTF8';")
-        conexion.commit()
-        cursor.close()
-        
-        return conexion
+        # Dentro de transaccion(): la conexión compartida de la unidad de trabajo
+        estado = _estado_actual()
+        if estado is not None and estado.en_transaccion and not estado.conexion.closed:
+            return ConexionCompartida(estado)
+
+        # Fuera de ella cada llamada tiene su propia conexión del pool: un helper
+        # anidado no puede confirmar ni deshacer lo que quien lo llamó aún no confirmó
+        return _prestar_conexion()
     except Exception as e:
         print(f"Error al conectar con PostgreSQL: {e}")
         import traceback
         traceback.print_exc()
         return None
+
+
+@contextmanager
+def transaccion():
+    """
+    Unidad de trabajo: todo lo que se ejecute dentro del bloque (incluidas las
+    llamadas anidadas a otros controladores) usa la misma conexión y se confirma
+    con un único COMMIT al salir. Si se lanza una excepción, una consulta falla
+    o alguien llama a rollback(), se deshace todo.
+
+    Uso:
+        with transaccion() as unidad:
+            ...
+        if not unidad.confirmada:
+            ...
+    """
+    estado, creado_aqui = _obtener_o_crear_estado()
+    if estado is None:
+        raise psycopg2.OperationalError('No se pudo obtener una conexión a la base de datos')
+
+    if estado.profundidad == 0:
+        # Descartar lecturas o restos no confirmados antes de abrir la unidad
+        if estado.estado_transaccion() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            estado.conexion.rollback()
+        estado.fallida = False
+        estado.al_confirmar = []
+
+    unidad = UnidadTrabajo()
+    estado.profundidad += 1
+    try:
+        yield unidad
+    except Exception:
+        estado.fallida = True
+        raise
+    finally:
+        estado.profundidad -= 1
+        en_error = estado.conexion.closed or \
+            estado.estado_transaccion() == psycopg2.extensions.TRANSACTION_STATUS_INERROR
+        if en_error:
+            estado.fallida = True
+
+        if estado.profundidad > 0:
+            # Bloque anidado: la confirmación la hace el bloque externo
+            unidad.confirmada = not estado.fallida
+        else:
+            try:
+                if estado.fallida:
+                    if not estado.conexion.closed:
+                        estado.conexion.rollback()
+                    print("⚠️ Transacción deshecha: una de las operaciones falló")
+                    unidad.confirmada = False
+                else:
+                    estado.conexion.commit()
+                    unidad.confirmada = True
+                    for funcion in estado.al_confirmar:
+                        try:
+                            funcion()
+                        except Exception as e:
+                            print(f"⚠️ Error tras confirmar la transacción => {e}")
+            finally:
+                estado.fallida = False
+                estado.al_confirmar = []
+                # La conexión compartida solo vive lo que dura la unidad de trabajo
+                if creado_aqui:
+                    _desligar_estado()
+                    estado.conexion.close()
+
+
+def al_confirmar(funcion):
+    """
+    Ejecuta funcion cuando los cambios ya son visibles para otras conexiones:
+    dentro de transaccion() espera al COMMIT de la unidad (y se descarta si se
+    deshace); fuera de ella se ejecuta de inmediato.
+    """
+    estado = _estado_actual()
+    if estado is not None and estado.en_transaccion:
+        estado.al_confirmar.append(funcion)
+    else:
+        funcion()
+
+
+def liberar_conexion_peticion(excepcion=None):
+    """Devuelve al pool una conexión de transaccion() que quedó ligada a la petición (registrar en teardown_appcontext)"""
+    estado = _estado_actual()
+    if estado is None:
+        return
+    _desligar_estado()
+    try:
+        if not estado.conexion.closed and \
+                estado.estado_transaccion() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            estado.conexion.rollback()
+    except Exception:
+        pass
+    estado.conexion.close()
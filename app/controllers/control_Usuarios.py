@@ -1,4 +1,16 @@
-from ConexionBD import get_connection
+from ConexionBD import al_confirmar, get_connection
+from services.perfil_service import PerfilService
+from services.cache_service import CacheTTL
+from controllers.controlador_rol import cache_roles
+
+# Roles que firman contratos
+ROLES_FIRMANTES = [8, 10, 11, 9, 12]
+NOMBRE_ROL_JEFE_TI = 'Jefe de Tecnología de la Información y Comunicaciones'
+
+# Tablas de referencia cacheadas en memoria
+cache_areas = CacheTTL('areas', ttl=600, max_entradas=16)
+# Depende también de USUARIO: se invalida al insertar o editar usuarios
+cache_jefes = CacheTTL('jefes_por_area', ttl=300, max_entradas=16)
 
 class controlUsuarios:
     
@@ -23,6 +35,7 @@ class controlUsuarios:
                 conexion.commit()
             
             conexion.close()
+            cache_jefes.invalidar()
             print(f"Usuario '{nombre} {ape_pat}' agregado correctamente.")
             return True
         
@@ -54,6 +67,56 @@ class controlUsuarios:
         except Exception as e:
             print(f"Error al buscar_por_ID => {e}")
             return None
+
+    @staticmethod
+    def obtener_perfil(id_usuario):
+        """
+        Obtiene en una sola consulta el rol del usuario, todos sus permisos y
+        el número de notificaciones no leídas (usado por el context processor).
+        No usar directamente desde las vistas: PerfilService lo cachea.
+
+        Returns:
+            dict: perfil del usuario o None si no existe
+        """
+        try:
+            sql = """
+                SELECT u.id_usuario, u.id_rol, r.tipo, r.id_area, r.nombre,
+                       (SELECT COUNT(*) FROM NOTIFICACION n
+                        WHERE n.id_usuario = u.id_usuario AND n.leida = FALSE) AS no_leidas
+                FROM USUARIO u
+                LEFT JOIN ROL r ON u.id_rol = r.id_rol
+                WHERE u.id_usuario = %s
+            """
+            conexion = get_connection()
+            if not conexion:
+                return None
+
+            with conexion.cursor() as cursor:
+                cursor.execute(sql, (id_usuario,))
+                fila = cursor.fetchone()
+
+            conexion.close()
+            if not fila:
+                return None
+
+            id_usuario, id_rol, tipo, id_area, nombre_rol, no_leidas = fila
+            tiene_rol = tipo is not None
+            return {
+                'id_usuario': id_usuario,
+                'id_rol': id_rol,
+                'tipo_rol': tipo,
+                'es_jefe': tipo == 'J',
+                'es_jefe_ti': tipo == 'J' and id_area == 1 and nombre_rol == NOMBRE_ROL_JEFE_TI,
+                'es_jefe_ti_rol_1': tipo == 'J' and id_area == 1 and id_rol == 1,
+                'es_tecnico': tipo == 'T',
+                'es_tecnico_area_1': tipo == 'T' and id_area == 1,
+                'es_rol_firmante': tiene_rol and id_rol in ROLES_FIRMANTES,
+                'puede_crear_contratos': tipo == 'J',
+                'notificaciones_no_leidas': no_leidas or 0
+            }
+        except Exception as e:
+            print(f"Error en obtener_perfil => {e}")
+            return None
         
     @staticmethod
     def buscar_todos():
@@ -106,6 +169,8 @@ class controlUsuarios:
                 conexion.commit()
 
             conexion.close()
+            al_confirmar(lambda: PerfilService.invalidar(id_usuario))
+            al_confirmar(cache_jefes.invalidar)
             print(f"Usuario {id_usuario} actualizado correctamente.")
             return True
 
@@ -228,6 +293,7 @@ class controlUsuarios:
             return False
 
     @staticmethod
+    @cache_roles.memorizar
     def obtener_id_jefe_ti():
         """Obtiene el ID del rol del Jefe de TI"""
         try:
@@ -343,8 +409,9 @@ class controlUsuarios:
         try:
             sql = """
                 SELECT COUNT(*)
-                FROM INCIDENTE
-                WHERE id_tecnico_asignado = %s
+                FROM ASIGNACION_TECNICO
+                WHERE id_usuario = %s
+                AND origen = 'A'
                 AND estado IN ('P', 'A')
             """
             conexion = get_connection()
@@ -366,11 +433,11 @@ class controlUsuarios:
         """Cuenta los tickets activos donde el usuario está en el equipo técnico (excluyendo Terminados)"""
         try:
             sql = """
-                SELECT COUNT(DISTINCT et.id_incidente)
-                FROM EQUIPO_TECNICO et
-                JOIN INCIDENTE i ON et.id_incidente = i.id_incidente
-                WHERE et.id_usuario = %s
-                AND i.estado IN ('P', 'A')
+                SELECT COUNT(DISTINCT id_incidente)
+                FROM ASIGNACION_TECNICO
+                WHERE id_usuario = %s
+                AND origen = 'E'
+                AND estado IN ('P', 'A')
             """
             conexion = get_connection()
             if not conexion:
@@ -387,6 +454,7 @@ class controlUsuarios:
             return 0
     
     @staticmethod
+    @cache_jefes.memorizar
     def obtener_jefes_por_area():
         """
         Obtiene todos los usuarios con rol de tipo 'J' (Jefe) agrupados por área
@@ -459,8 +527,7 @@ class controlUsuarios:
             if not usuario:
                 return False
             
-            roles_firmantes = [8, 10, 11, 9, 12]
-            return usuario.get('id_rol') in roles_firmantes
+            return usuario.get('id_rol') in ROLES_FIRMANTES
             
         except Exception as e:
             print(f"Error en es_rol_firmante => {e}")
@@ -620,6 +687,7 @@ class controlUsuarios:
             return []
     
     @staticmethod
+    @cache_areas.memorizar
     def obtener_todas_areas():
         """
         Obtiene todas las áreas de la organización
@@ -0,0 +1,203 @@
+import math
+from ConexionBD import get_connection
+
+
+class ControlAnomalias:
+    """
+    Detector de anomalías en línea (migración 008).
+    Por categoría mantiene la media y varianza exponenciales (EWMA) de
+    incidentes por día. insertar_incidentes llama a registrar_incidente dentro
+    de su transacción: el conteo del día se compara al instante con la media,
+    así un pico queda registrado con el incidente que lo produce.
+    """
+
+    SUAVIZADO = 0.1             # peso del último día en la media (lambda de EWMA)
+    DIAS_MINIMOS = 7            # días observados antes de evaluar
+    PUNTAJE_REGISTRO = 1.5      # puntaje z desde el que se guarda un evento (con un threshold menor la API usa el historial)
+    MAX_DIAS_SIN_DATOS = 365    # días vacíos que se pliegan como máximo
+
+    @staticmethod
+    def _plegar_dia(media, varianza, observados, cantidad):
+        """Incorpora un día cerrado a la media y varianza exponenciales"""
+        if observados == 0:
+            return float(cantidad), 0.0, 1
+        diferencia = cantidad - media
+        media += ControlAnomalias.SUAVIZADO * diferencia
+        varianza = (1 - ControlAnomalias.SUAVIZADO) * (varianza + ControlAnomalias.SUAVIZADO * diferencia ** 2)
+        return media, varianza, observados + 1
+
+    @staticmethod
+    def _cerrar_dias(media, varianza, observados, cantidad, dias_transcurridos):
+        """Cierra el día con `cantidad` y los días siguientes sin incidentes"""
+        media, varianza, observados = ControlAnomalias._plegar_dia(media, varianza, observados, cantidad)
+        for _ in range(min(dias_transcurridos, ControlAnomalias.MAX_DIAS_SIN_DATOS) - 1):
+            media, varianza, observados = ControlAnomalias._plegar_dia(media, varianza, observados, 0)
+        return media, varianza, observados
+
+    @staticmethod
+    def desviacion(media, varianza):
+        """Desviación usada en el puntaje: al menos la de Poisson y al menos 1 incidente"""
+        return max(math.sqrt(max(varianza, media)), 1.0)
+
+    @staticmethod
+    def registrar_incidente(cursor, id_categoria):
+        """
+        Suma un incidente al día en curso de la categoría y evalúa si es anómalo.
+        Usa el cursor de quien llama (misma transacción); si algo falla, solo se
+        deshace lo del detector y el incidente se guarda igual.
+        """
+        cursor.execute("SAVEPOINT detector_anomalias")
+        try:
+            cursor.execute("""
+                INSERT INTO ANOMALIA_ESTADO (id_categoria, dia)
+                VALUES (%s, CURRENT_DATE)
+                ON CONFLICT (id_categoria) DO NOTHING
+            """, (id_categoria,))
+            cursor.execute("""
+                SELECT dia, cantidad_dia, media, varianza, dias_observados, CURRENT_DATE
+                FROM ANOMALIA_ESTADO
+                WHERE id_categoria = %s
+                FOR UPDATE
+            """, (id_categoria,))
+            dia, cantidad, media, varianza, observados, hoy = cursor.fetchone()
+
+            if dia < hoy:
+                media, varianza, observados = ControlAnomalias._cerrar_dias(
+                    media, varianza, observados, cantidad, (hoy - dia).days)
+                cantidad = 0
+            cantidad += 1
+
+            cursor.execute("""
+                UPDATE ANOMALIA_ESTADO
+                SET dia = %s, cantidad_dia = %s, media = %s, varianza = %s,
+                    dias_observados = %s, actualizado = NOW()
+                WHERE id_categoria = %s
+            """, (hoy, cantidad, media, varianza, observados, id_categoria))
+
+            if observados >= ControlAnomalias.DIAS_MINIMOS:
+                desviacion = ControlAnomalias.desviacion(media, varianza)
+                puntaje = (cantidad - media) / desviacion
+                if puntaje >= ControlAnomalias.PUNTAJE_REGISTRO:
+                    cursor.execute("""
+                        INSERT INTO ANOMALIA_EVENTO AS e
+                            (id_categoria, dia, cantidad, media, desviacion, puntaje_z)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                        ON CONFLICT (id_categoria, dia) DO UPDATE
+                        SET cantidad = EXCLUDED.cantidad,
+                            media = EXCLUDED.media,
+                            desviacion = EXCLUDED.desviacion,
+                            puntaje_z = EXCLUDED.puntaje_z,
+                            fecha_deteccion = NOW()
+                    """, (id_categoria, hoy, cantidad, media, desviacion, puntaje))
+                    print(f"⚠️ Anomalía: categoría {id_categoria} con {cantidad} incidentes hoy "
+                          f"(media {media:.1f}, z={puntaje:.1f})")
+
+            cursor.execute("RELEASE SAVEPOINT detector_anomalias")
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT detector_anomalias")
+            print(f"⚠️ Error en el detector de anomalías => {e}")
+
+    @staticmethod
+    def obtener_eventos(dias=30, puntaje_minimo=2.0):
+        """
+        Eventos de los últimos `dias` días con puntaje >= puntaje_minimo, más
+        recientes primero. Solo se guardan eventos desde PUNTAJE_REGISTRO.
+
+        Returns:
+            list | None: None si el detector aún no tiene estado (sin datos)
+        """
+        try:
+            conexion = get_connection()
+            if not conexion:
+                return None
+
+            with conexion.cursor() as cursor:
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM ANOMALIA_ESTADO WHERE dias_observados >= %s)",
+                               (ControlAnomalias.DIAS_MINIMOS,))
+                if not cursor.fetchone()[0]:
+                    conexion.close()
+                    return None
+
+                cursor.execute("""
+                    SELECT e.dia, e.cantidad, e.media, e.desviacion, e.puntaje_z,
+                           COALESCE(c.nombre, 'Sin categoría'), e.fecha_deteccion
+                    FROM ANOMALIA_EVENTO e
+                    LEFT JOIN CATEGORIA c ON e.id_categoria = c.id_categoria
+                    WHERE e.dia >= CURRENT_DATE - %s AND e.puntaje_z >= %s
+                    ORDER BY e.dia DESC, e.puntaje_z DESC
+                """, (dias, puntaje_minimo))
+                filas = cursor.fetchall()
+
+            conexion.close()
+
+            return [{
+                'dia': fila[0],
+                'cantidad': fila[1],
+                'media': float(fila[2]),
+                'desviacion': float(fila[3]),
+                'puntaje_z': float(fila[4]),
+                'categoria': fila[5],
+                'fecha_deteccion': fila[6]
+            } for fila in filas]
+
+        except Exception as e:
+            print(f"Error en obtener_eventos => {e}")
+            return None
+
+    @staticmethod
+    def reconstruir_estado(dias=90):
+        """
+        Recalcula el estado de todas las categorías recorriendo los conteos
+        diarios de los últimos `dias` días (carga inicial o reparación).
+        No genera eventos históricos.
+        """
+        try:
+            conexion = get_connection()
+            if not conexion:
+                print("No se pudo conectar a la base de datos.")
+                return False
+
+            with conexion.cursor() as cursor:
+                # Bloquear antes de contar: quien registre un incidente mientras tanto
+                # espera y aplica su suma sobre el estado reconstruido
+                cursor.execute("LOCK TABLE ANOMALIA_ESTADO IN EXCLUSIVE MODE")
+                cursor.execute("""
+                    SELECT c.id_categoria, d.dia::date, COUNT(i.id_incidente)
+                    FROM CATEGORIA c
+                    CROSS JOIN generate_series(CURRENT_DATE - %s, CURRENT_DATE, INTERVAL '1 day') AS d(dia)
+                    LEFT JOIN INCIDENTE i
+                        ON i.id_categoria = c.id_categoria
+                       AND i.fecha_reporte >= d.dia AND i.fecha_reporte < d.dia + INTERVAL '1 day'
+                    GROUP BY c.id_categoria, d.dia
+                    ORDER BY c.id_categoria, d.dia
+                """, (dias,))
+                filas = cursor.fetchall()
+
+                # Los días anteriores se pliegan; el último (hoy) queda como día en curso
+                estados = {}
+                for id_categoria, dia, cantidad in filas:
+                    estado = estados.get(id_categoria)
+                    if estado is None:
+                        estados[id_categoria] = [dia, cantidad, 0.0, 0.0, 0]
+                        continue
+                    media, varianza, observados = ControlAnomalias._plegar_dia(
+                        estado[2], estado[3], estado[4], estado[1])
+                    estados[id_categoria] = [dia, cantidad, media, varianza, observados]
+
+                cursor.execute("DELETE FROM ANOMALIA_ESTADO")
+                cursor.executemany("""
+                    INSERT INTO ANOMALIA_ESTADO
+                        (id_categoria, dia, cantidad_dia, media, varianza, dias_observados)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, [(id_categoria, *estado) for id_categoria, estado in estados.items()])
+                conexion.commit()
+
+            conexion.close()
+            print(f"✅ Estado del detector de anomalías reconstruido: {len(estados)} categorías, {dias} días")
+            return True
+
+        except Exception as e:
+            print(f"Error en reconstruir_estado => {e}")
+            import traceback
+            traceback.print_exc()
+            return False
@@ -8,10 +8,11 @@ Guarda los rostros y hace comparación por histogramas.
 import numpy as np
 import cv2
 import base64
-import pickle
 from io import BytesIO
 from PIL import Image
 from ConexionBD import get_connection
+from services.motor_biometrico import MotorBiometrico
+from services.plantilla_facial import PlantillaFacial
 
 
 class ControlBiometria:
@@ -72,11 +73,8 @@ class ControlBiometria:
             # Convertir a escala de grises
             gray = cv2.cvtColor(imagen_rgb, cv2.COLOR_RGB2GRAY)
             
-            # Cargar clasificador Haar Cascade
-            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-            
-            # Detectar rostros (configuración permisiva)
-            rostros = face_cascade.detectMultiScale(
+            # Detectar rostros con la cascada precargada (configuración permisiva)
+            rostros = MotorBiometrico.detectar_rostros(
                 gray,
                 scaleFactor=1.1,
                 minNeighbors=3,
@@ -131,16 +129,8 @@ class ControlBiometria:
             numpy.ndarray: Histograma normalizado
         """
         try:
-            # Convertir a HSV para mejor representación de color
-            hsv = cv2.cvtColor(rostro, cv2.COLOR_RGB2HSV)
-            
-            # Calcular histograma 3D (Hue, Saturation, Value)
-            hist = cv2.calcHist([hsv], [0, 1, 2], None, [8, 8, 8], [0, 180, 0, 256, 0, 256])
-            
-            # Normalizar
-            hist = cv2.normalize(hist, hist).flatten()
-            
-            return hist
+            # Histograma 3D (Hue, Saturation, Value), el mismo de la plantilla facial
+            return PlantillaFacial.calcular_histograma(rostro, cv2.COLOR_RGB2HSV)
             
         except Exception as e:
             print(f"❌ Error al calcular histograma: {e}")
@@ -177,6 +167,31 @@ class ControlBiometria:
             print(f"❌ Error al comparar rostros: {e}")
             return 0.0
     
+    @staticmethod
+    def comparar_con_plantilla(plantilla, rostro):
+        """
+        Compara un rostro con el histograma precalculado de una plantilla
+        
+        Args:
+            plantilla: PlantillaFacial enrolada
+            rostro: Rostro actual (numpy array RGB 200x200)
+            
+        Returns:
+            float: Similitud (0-1, donde 1 es idéntico)
+        """
+        try:
+            hist = ControlBiometria.calcular_histograma(rostro)
+            if hist is None:
+                return 0.0
+            
+            similitud = max(0.0, cv2.compareHist(plantilla.histograma, hist, cv2.HISTCMP_CORREL))
+            print(f"📊 Similitud calculada: {similitud:.4f}")
+            return similitud
+            
+        except Exception as e:
+            print(f"❌ Error al comparar con plantilla: {e}")
+            return 0.0
+    
     @staticmethod
     def registrar_rostro(id_usuario, imagen_base64):
         """
@@ -204,8 +219,8 @@ class ControlBiometria:
             if rostro is None:
                 return {'exito': False, 'mensaje': 'No se detectó ningún rostro en la imagen'}
             
-            # Serializar el rostro
-            rostro_serializado = pickle.dumps(rostro)
+            # Plantilla facial (la imagen de este controlador es RGB)
+            rostro_serializado = PlantillaFacial.desde_rostro(cv2.cvtColor(rostro, cv2.COLOR_RGB2BGR)).empaquetar()
             
             # Guardar en base de datos
             conexion = get_connection()
@@ -312,7 +327,9 @@ class ControlBiometria:
                     if not rostro_almacenado_bytes:
                         return {'exito': False, 'mensaje': 'Datos biométricos no encontrados', 'usuario': None}
                     
-                    rostro_almacenado = pickle.loads(rostro_almacenado_bytes)
+                    plantilla = PlantillaFacial.desempaquetar(rostro_almacenado_bytes)
+                    if plantilla is None:
+                        return {'exito': False, 'mensaje': 'Datos biométricos dañados', 'usuario': None}
                     
                     # Detectar rostro en imagen actual
                     imagen = ControlBiometria.base64_a_imagen(imagen_base64)
@@ -323,8 +340,8 @@ class ControlBiometria:
                     if rostro_actual is None:
                         return {'exito': False, 'mensaje': 'No se detectó ningún rostro', 'usuario': None}
                     
-                    # Comparar rostros
-                    similitud = ControlBiometria.comparar_rostros(rostro_almacenado, rostro_actual)
+                    # Comparar con el histograma de la plantilla
+                    similitud = ControlBiometria.comparar_con_plantilla(plantilla, rostro_actual)
                     
                     print(f"📊 Similitud: {similitud:.2%}, Umbral: {ControlBiometria.UMBRAL_SIMILITUD:.2%}")
                     
@@ -2,15 +2,16 @@
 Controlador de Biometría Facial - Solo OpenCV (Sin dlib)
 =========================================================
 Sistema simple y funcional usando únicamente OpenCV.
-Enrolamiento: Captura foto → Detecta rostro → Guarda imagen en BD
-Login: Video streaming → Compara cada frame con imagen guardada
+Enrolamiento: Captura foto → Detecta rostro → Guarda plantilla (ORB + histograma) en BD
+Login: Video streaming → Compara cada frame con la plantilla guardada
 """
 
 import numpy as np
 import cv2
 import base64
-import pickle
 from ConexionBD import get_connection
+from services.motor_biometrico import MotorBiometrico
+from services.plantilla_facial import PlantillaFacial
 
 
 class ControlBiometriaOpenCV:
@@ -22,6 +23,13 @@ class ControlBiometriaOpenCV:
     # Número de frames consecutivos requeridos para login
     FRAMES_REQUERIDOS = 30  # Reducido porque OpenCV es más rápido
     
+    # Lado mínimo del rostro en el frame (px), también al seguirlo entre frames
+    LADO_MINIMO = 100
+    
+    # Seguimiento entre frames: se busca alrededor de la última caja, en una copia reducida
+    MARGEN_ROI = 0.5            # ampliación de la caja por lado (fracción de su tamaño)
+    LADO_ROSTRO_ROI = 64        # tamaño del rostro en la región reducida (px)
+    
     @staticmethod
     def base64_a_imagen(base64_string):
         """Convierte base64 a imagen OpenCV (BGR)"""
@@ -33,6 +41,16 @@ class ControlBiometriaOpenCV:
             # Decodificar base64
             img_bytes = base64.b64decode(base64_string)
             
+            return ControlBiometriaOpenCV.bytes_a_imagen(img_bytes)
+            
+        except Exception as e:
+            print(f"❌ Error: {e}")
+            return None
+    
+    @staticmethod
+    def bytes_a_imagen(img_bytes):
+        """Convierte los bytes de un JPEG/PNG a imagen OpenCV (BGR)"""
+        try:
             # Convertir a numpy array
             nparr = np.frombuffer(img_bytes, np.uint8)
             
@@ -51,52 +69,113 @@ class ControlBiometriaOpenCV:
             return None
     
     @staticmethod
-    def detectar_rostro(imagen_bgr):
+    def _buscar_en_roi(gray, caja):
+        """
+        Busca el rostro solo alrededor de la caja anterior, en una copia reducida
+        de esa región y con tamaños cercanos al anterior (nunca menores que
+        LADO_MINIMO del frame completo).
+        
+        Returns:
+            tuple: (x, y, w, h) en coordenadas del frame, o None
+        """
+        x, y, w, h = caja
+        alto, ancho = gray.shape[:2]
+        margen_x = int(w * ControlBiometriaOpenCV.MARGEN_ROI)
+        margen_y = int(h * ControlBiometriaOpenCV.MARGEN_ROI)
+        x0, y0 = max(0, x - margen_x), max(0, y - margen_y)
+        x1, y1 = min(ancho, x + w + margen_x), min(alto, y + h + margen_y)
+        
+        escala = min(1.0, ControlBiometriaOpenCV.LADO_ROSTRO_ROI / w)
+        region = gray[y0:y1, x0:x1]
+        if escala < 1.0:
+            region = cv2.resize(region, None, fx=escala, fy=escala, interpolation=cv2.INTER_AREA)
+        
+        lado = w * escala
+        minimo = max(int(lado * 0.7), int(ControlBiometriaOpenCV.LADO_MINIMO * escala))
+        maximo = int(lado * 1.4) + 1
+        if minimo >= maximo:
+            return None
+        rostros = MotorBiometrico.detectar_rostros(
+            region,
+            scaleFactor=1.1,
+            minNeighbors=5,
+            minSize=(minimo, minimo),
+            maxSize=(maximo, maximo)
+        )
+        if len(rostros) == 0:
+            return None
+        
+        xr, yr, wr, hr = max(rostros, key=lambda r: r[2] * r[3])
+        caja = (x0 + int(xr / escala), y0 + int(yr / escala), int(wr / escala), int(hr / escala))
+        if min(caja[2], caja[3]) < ControlBiometriaOpenCV.LADO_MINIMO:
+            return None
+        return caja
+    
+    @staticmethod
+    def localizar_rostro(gray, caja_previa=None):
+        """
+        Caja (x, y, w, h) del rostro principal. Con caja_previa (frame anterior)
+        busca primero en esa región; el frame completo se recorre si ahí no lo
+        encuentra o si la caja previa es menor que LADO_MINIMO.
+        
+        Returns:
+            tuple: (caja o None, 'roi' | 'completo')
+        """
+        if caja_previa is not None and min(caja_previa[2], caja_previa[3]) >= ControlBiometriaOpenCV.LADO_MINIMO:
+            caja = ControlBiometriaOpenCV._buscar_en_roi(gray, caja_previa)
+            if caja is not None:
+                return caja, 'roi'
+        
+        # Detectar rostros (cascada Haar precargada del motor biométrico)
+        rostros = MotorBiometrico.detectar_rostros(
+            gray,
+            scaleFactor=1.1,
+            minNeighbors=5,
+            minSize=(ControlBiometriaOpenCV.LADO_MINIMO, ControlBiometriaOpenCV.LADO_MINIMO)
+        )
+        if len(rostros) == 0:
+            return None, 'completo'
+        
+        # Si hay múltiples rostros, tomar el más grande
+        x, y, w, h = max(rostros, key=lambda r: r[2] * r[3])
+        return (int(x), int(y), int(w), int(h)), 'completo'
+    
+    @staticmethod
+    def detectar_rostro(imagen_bgr, seguimiento=None):
         """
         Detecta y recorta el rostro principal en una imagen
         
+        Args:
+            imagen_bgr: Imagen en formato BGR
+            seguimiento: dict opcional que se conserva entre frames de una misma
+                verificación; guarda en 'caja' la última caja encontrada
+        
         Returns:
             numpy.ndarray: Imagen del rostro recortado, o None si no se detecta
         """
         try:
-            print("🔍 Detectando rostro con OpenCV...")
+            seguimiento = {} if seguimiento is None else seguimiento
             
             # Convertir a escala de grises
             gray = cv2.cvtColor(imagen_bgr, cv2.COLOR_BGR2GRAY)
             
-            # Cargar clasificador Haar Cascade
-            face_cascade = cv2.CascadeClassifier(
-                cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-            )
+            caja, modo = ControlBiometriaOpenCV.localizar_rostro(gray, seguimiento.get('caja'))
             
-            # Detectar rostros
-            rostros = face_cascade.detectMultiScale(
-                gray,
-                scaleFactor=1.1,
-                minNeighbors=5,
-                minSize=(100, 100)
-            )
-            
-            if len(rostros) == 0:
+            if caja is None:
+                seguimiento.pop('caja', None)
                 print("❌ No se detectó ningún rostro")
                 return None
             
-            print(f"✅ Detectados {len(rostros)} rostro(s)")
-            
-            # Si hay múltiples rostros, tomar el más grande
-            if len(rostros) > 1:
-                rostro = max(rostros, key=lambda r: r[2] * r[3])
-            else:
-                rostro = rostros[0]
+            seguimiento['caja'] = caja
             
             # Recortar rostro
-            x, y, w, h = rostro
+            x, y, w, h = caja
             rostro_img = imagen_bgr[y:y+h, x:x+w]
             
             # Redimensionar a tamaño estándar (importante para comparación)
             rostro_std = cv2.resize(rostro_img, (200, 200))
             
-            print(f"✅ Rostro recortado: {rostro_std.shape}")
+            print(f"✅ Rostro recortado ({modo}): {rostro_std.shape}")
             
             return rostro_std
             
@@ -107,35 +186,29 @@ class ControlBiometriaOpenCV:
             return None
     
     @staticmethod
-    def comparar_rostros_orb(rostro1, rostro2):
+    def comparar_con_plantilla(plantilla, rostro):
         """
-        Compara dos rostros usando ORB (Oriented FAST and Rotated BRIEF)
-        Método robusto y rápido para matching de características
+        Compara un rostro con una plantilla enrolada usando ORB (Oriented FAST and Rotated BRIEF)
+        Solo se calculan las características del rostro recibido
         
         Returns:
             tuple: (bool coincide, float distancia_promedio)
         """
         try:
-            # Convertir a escala de grises
-            gray1 = cv2.cvtColor(rostro1, cv2.COLOR_BGR2GRAY)
-            gray2 = cv2.cvtColor(rostro2, cv2.COLOR_BGR2GRAY)
-            
-            # Crear detector ORB
-            orb = cv2.ORB_create(nfeatures=500)
+            if plantilla.descriptores is None:
+                print("⚠️ La plantilla no tiene características")
+                return False, 100.0
             
-            # Detectar keypoints y descriptores
-            kp1, des1 = orb.detectAndCompute(gray1, None)
-            kp2, des2 = orb.detectAndCompute(gray2, None)
+            # Detectar keypoints y descriptores (ORB precargado)
+            gray = cv2.cvtColor(rostro, cv2.COLOR_BGR2GRAY)
+            kp, des = MotorBiometrico.caracteristicas(gray)
             
-            if des1 is None or des2 is None:
+            if des is None:
                 print("⚠️ No se encontraron características")
                 return False, 100.0
             
-            # Crear matcher BFMatcher
-            bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-            
-            # Emparejar descriptores
-            matches = bf.match(des1, des2)
+            # Emparejar descriptores (BFMatcher Hamming precargado)
+            matches = MotorBiometrico.emparejar(plantilla.descriptores, des)
             
             if len(matches) < 10:
                 print(f"⚠️ Muy pocas coincidencias: {len(matches)}")
@@ -156,6 +229,16 @@ class ControlBiometriaOpenCV:
             print(f"❌ Error al comparar: {e}")
             return False, 100.0
     
+    @staticmethod
+    def comparar_rostros_orb(rostro1, rostro2):
+        """
+        Compara dos rostros recortados usando ORB
+        
+        Returns:
+            tuple: (bool coincide, float distancia_promedio)
+        """
+        return ControlBiometriaOpenCV.comparar_con_plantilla(PlantillaFacial.desde_rostro(rostro1), rostro2)
+    
     @staticmethod
     def registrar_rostro(id_usuario, imagen_base64):
         """
@@ -183,8 +266,8 @@ class ControlBiometriaOpenCV:
             if rostro is None:
                 return {'exito': False, 'mensaje': 'No se detectó ningún rostro'}
             
-            # Serializar la imagen del rostro
-            rostro_bytes = pickle.dumps(rostro)
+            # Extraer la plantilla (ORB + histograma) una sola vez
+            rostro_bytes = PlantillaFacial.desde_rostro(rostro).empaquetar()
             
             # Guardar en base de datos
             conexion = get_connection()
@@ -218,17 +301,17 @@ class ControlBiometriaOpenCV:
     @staticmethod
     def obtener_rostro_usuario(correo, contrasena):
         """
-        Obtiene el rostro guardado de un usuario
+        Obtiene la plantilla facial guardada de un usuario
         
         Returns:
-            dict: {'exito': bool, 'rostro': array, 'usuario': dict, 'mensaje': str}
+            dict: {'exito': bool, 'plantilla': PlantillaFacial, 'usuario': dict, 'mensaje': str}
         """
         try:
             conexion = get_connection()
             if not conexion:
                 return {
                     'exito': False,
-                    'rostro': None,
+                    'plantilla': None,
                     'usuario': None,
                     'mensaje': 'Error de conexión a BD'
                 }
@@ -248,7 +331,7 @@ class ControlBiometriaOpenCV:
                     if not usuario:
                         return {
                             'exito': False,
-                            'rostro': None,
+                            'plantilla': None,
                             'usuario': None,
                             'mensaje': 'Credenciales incorrectas'
                         }
@@ -256,22 +339,29 @@ class ControlBiometriaOpenCV:
                     if not usuario[8]:  # tiene_biometria
                         return {
                             'exito': False,
-                            'rostro': None,
+                            'plantilla': None,
                             'usuario': None,
                             'mensaje': 'Usuario no tiene biometría registrada'
                         }
                     
-                    # Deserializar imagen del rostro
+                    # Leer la plantilla facial
                     rostro_bytes = usuario[7]
                     if not rostro_bytes:
                         return {
                             'exito': False,
-                            'rostro': None,
+                            'plantilla': None,
                             'usuario': None,
                             'mensaje': 'Datos biométricos no encontrados'
                         }
                     
-                    rostro = pickle.loads(rostro_bytes)
+                    plantilla = PlantillaFacial.desempaquetar(rostro_bytes)
+                    if plantilla is None:
+                        return {
+                            'exito': False,
+                            'plantilla': None,
+                            'usuario': None,
+                            'mensaje': 'Datos biométricos dañados'
+                        }
                     
                     usuario_dict = {
                         'id_usuario': usuario[0],
@@ -285,7 +375,7 @@ class ControlBiometriaOpenCV:
                     
                     return {
                         'exito': True,
-                        'rostro': rostro,
+                        'plantilla': plantilla,
                         'usuario': usuario_dict,
                         'mensaje': 'OK'
                     }
@@ -297,26 +387,31 @@ class ControlBiometriaOpenCV:
             print(f"❌ Error al obtener rostro: {e}")
             return {
                 'exito': False,
-                'rostro': None,
+                'plantilla': None,
                 'usuario': None,
                 'mensaje': str(e)
             }
     
     @staticmethod
-    def verificar_frame(rostro_guardado, frame_base64):
+    def verificar_frame(plantilla, frame, seguimiento=None):
         """
-        Verifica un frame del video contra el rostro guardado
+        Verifica un frame del video contra la plantilla guardada
         
         Args:
-            rostro_guardado: Imagen del rostro del usuario (desde BD)
-            frame_base64: Frame actual del video en base64
+            plantilla: PlantillaFacial del usuario (desde BD)
+            frame: Frame actual del video, JPEG en bytes o en base64
+            seguimiento: dict de la verificación en curso (ver detectar_rostro)
             
         Returns:
-            dict: {'coincide': bool, 'distancia': float, 'mensaje': str}
+            dict: {'coincide': bool, 'distancia': float, 'mensaje': str,
+                   'face_location': [top, right, bottom, left] si se detectó}
         """
         try:
-            # Convertir frame base64 a imagen
-            frame = ControlBiometriaOpenCV.base64_a_imagen(frame_base64)
+            # Convertir frame a imagen
+            if isinstance(frame, (bytes, bytearray, memoryview)):
+                frame = ControlBiometriaOpenCV.bytes_a_imagen(frame)
+            else:
+                frame = ControlBiometriaOpenCV.base64_a_imagen(frame)
             
             if frame is None:
                 return {
@@ -325,8 +420,9 @@ class ControlBiometriaOpenCV:
                     'mensaje': 'Error al procesar frame'
                 }
             
-            # Detectar rostro en el frame actual
-            rostro_actual = ControlBiometriaOpenCV.detectar_rostro(frame)
+            # Detectar rostro en el frame actual (alrededor del anterior si lo hay)
+            seguimiento = {} if seguimiento is None else seguimiento
+            rostro_actual = ControlBiometriaOpenCV.detectar_rostro(frame, seguimiento)
             
             if rostro_actual is None:
                 return {
@@ -335,16 +431,19 @@ class ControlBiometriaOpenCV:
                     'mensaje': 'No se detectó rostro'
                 }
             
+            x, y, w, h = seguimiento['caja']
+            
             # Comparar usando ORB
-            coincide, distancia = ControlBiometriaOpenCV.comparar_rostros_orb(
-                rostro_guardado,
+            coincide, distancia = ControlBiometriaOpenCV.comparar_con_plantilla(
+                plantilla,
                 rostro_actual
             )
             
             return {
                 'coincide': coincide,
                 'distancia': distancia,
-                'mensaje': 'Match' if coincide else 'No match'
+                'mensaje': 'Match' if coincide else 'No match',
+                'face_location': [y, x + w, y + h, x]
             }
             
         except Exception as e:
@@ -364,7 +463,7 @@ class ControlBiometriaOpenCV:
             dict: {'exito': bool, 'mensaje': str, 'usuario': dict or None}
         """
         try:
-            # Obtener rostro guardado del usuario
+            # Obtener plantilla guardada del usuario
             resultado_usuario = ControlBiometriaOpenCV.obtener_rostro_usuario(correo, contrasena)
             
             if not resultado_usuario['exito']:
@@ -374,7 +473,7 @@ class ControlBiometriaOpenCV:
                     'usuario': None
                 }
             
-            rostro_guardado = resultado_usuario['rostro']
+            plantilla = resultado_usuario['plantilla']
             usuario = resultado_usuario['usuario']
             
             # Convertir imagen actual
@@ -395,9 +494,9 @@ class ControlBiometriaOpenCV:
                     'usuario': None
                 }
             
-            # Comparar rostros
-            coincide, distancia = ControlBiometriaOpenCV.comparar_rostros_orb(
-                rostro_guardado,
+            # Comparar con la plantilla
+            coincide, distancia = ControlBiometriaOpenCV.comparar_con_plantilla(
+                plantilla,
                 rostro_actual
             )
             
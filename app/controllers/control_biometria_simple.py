@@ -12,6 +12,7 @@ import pickle
 from io import BytesIO
 from PIL import Image
 from ConexionBD import get_connection
+from services.motor_biometrico import MotorBiometrico
 
 
 class ControlBiometria:
@@ -72,11 +73,8 @@ class ControlBiometria:
             # Convertir a escala de grises
             gray = cv2.cvtColor(imagen_rgb, cv2.COLOR_RGB2GRAY)
             
-            # Cargar clasificador Haar Cascade
-            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-            
-            # Detectar rostros (configuración permisiva)
-            rostros = face_cascade.detectMultiScale(
+            # Detectar rostros con la cascada precargada (configuración permisiva)
+            rostros = MotorBiometrico.detectar_rostros(
                 gray,
                 scaleFactor=1.1,
                 minNeighbors=3,
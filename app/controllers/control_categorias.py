@@ -1,4 +1,8 @@
 from ConexionBD import get_connection
+from services.cache_service import CacheTTL
+
+# Catálogo de categorías cacheado en memoria; las escrituras lo invalidan
+cache_categorias = CacheTTL('categorias', ttl=600, max_entradas=64)
 
 class controlCategorias:
     @staticmethod
@@ -22,6 +26,7 @@ class controlCategorias:
                 conexion.commit()
             
             conexion.close()
+            cache_categorias.invalidar()
             print(f"Categoría '{nombre}' agregada correctamente.")
             return True
 
@@ -31,6 +36,7 @@ class controlCategorias:
 
 
     @staticmethod
+    @cache_categorias.memorizar
     def buscar_por_ID(id_categoria):
         """
         Busca una categoría por su ID.
@@ -61,6 +67,7 @@ class controlCategorias:
 
 
     @staticmethod
+    @cache_categorias.memorizar
     def buscar_todos():
         """
         Retorna todas las categorías registradas en la base de datos.
@@ -111,6 +118,7 @@ class controlCategorias:
                 conexion.commit()
             
             conexion.close()
+            cache_categorias.invalidar()
             print(f"Categoría con ID {id_categoria} actualizada correctamente.")
             return True
         
@@ -139,6 +147,7 @@ class controlCategorias:
                 conexion.commit()
             
             conexion.close()
+            cache_categorias.invalidar()
             print(f"Categoría con ID {id_categoria} eliminada correctamente.")
             return True
         
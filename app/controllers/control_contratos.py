@@ -1,7 +1,7 @@
 """
 Controlador para gestión de contratos y firmas electrónicas
 """
-from ConexionBD import get_connection
+from ConexionBD import get_connection, transaccion
 from services.catbox_service import CatboxService
 from services.firma_service import FirmaService
 from controllers.control_notificaciones import ControlNotificaciones
@@ -389,95 +389,99 @@ class ControlContratos:
             if not url_firmado:
                 return {'success': False, 'message': 'Error al subir el PDF firmado'}
             
-            # Actualizar la BD
-            conexion = get_connection()
-            if not conexion:
-                return {'success': False, 'message': 'Error de conexión a la BD'}
+            # Actualizar la BD y notificar en una sola transacción
+            with transaccion() as unidad:
+                conexion = get_connection()
+                if not conexion:
+                    return {'success': False, 'message': 'Error de conexión a la BD'}
             
-            with conexion.cursor() as cursor:
-                # Actualizar URL del contrato
-                sql_update_contrato = """
-                    UPDATE CONTRATO SET url_archivo = %s WHERE id_contrato = %s
-                """
-                cursor.execute(sql_update_contrato, (url_firmado, id_contrato))
-                
-                # Marcar como firmado
-                sql_update_firma = """
-                    UPDATE CONTRATO_FIRMA_PENDIENTE
-                    SET firmado = TRUE, fecha_firma = NOW()
-                    WHERE id_contrato = %s AND id_usuario = %s
-                """
-                cursor.execute(sql_update_firma, (id_contrato, id_usuario))
+                with conexion.cursor() as cursor:
+                    # Actualizar URL del contrato
+                    sql_update_contrato = """
+                        UPDATE CONTRATO SET url_archivo = %s WHERE id_contrato = %s
+                    """
+                    cursor.execute(sql_update_contrato, (url_firmado, id_contrato))
                 
-                # Verificar si hay más firmantes
-                sql_siguiente = """
-                    SELECT id_usuario, orden FROM CONTRATO_FIRMA_PENDIENTE
-                    WHERE id_contrato = %s AND orden > %s AND firmado = FALSE
-                    ORDER BY orden ASC LIMIT 1
-                """
-                cursor.execute(sql_siguiente, (id_contrato, orden_firma))
-                siguiente_firmante = cursor.fetchone()
+                    # Marcar como firmado
+                    sql_update_firma = """
+                        UPDATE CONTRATO_FIRMA_PENDIENTE
+                        SET firmado = TRUE, fecha_firma = NOW()
+                        WHERE id_contrato = %s AND id_usuario = %s
+                    """
+                    cursor.execute(sql_update_firma, (id_contrato, id_usuario))
                 
-                # Si no hay más firmantes, marcar contrato como firmado completo
-                if not siguiente_firmante:
-                    sql_finalizar = """
-                        UPDATE CONTRATO SET estado = 'F' WHERE id_contrato = %s
+                    # Verificar si hay más firmantes
+                    sql_siguiente = """
+                        SELECT id_usuario, orden FROM CONTRATO_FIRMA_PENDIENTE
+                        WHERE id_contrato = %s AND orden > %s AND firmado = FALSE
+                        ORDER BY orden ASC LIMIT 1
                     """
-                    cursor.execute(sql_finalizar, (id_contrato,))
+                    cursor.execute(sql_siguiente, (id_contrato, orden_firma))
+                    siguiente_firmante = cursor.fetchone()
+                
+                    # Si no hay más firmantes, marcar contrato como firmado completo
+                    if not siguiente_firmante:
+                        sql_finalizar = """
+                            UPDATE CONTRATO SET estado = 'F' WHERE id_contrato = %s
+                        """
+                        cursor.execute(sql_finalizar, (id_contrato,))
                     
-                    # Notificar a todos los firmantes
-                    sql_todos_firmantes = """
-                        SELECT DISTINCT id_usuario FROM CONTRATO_FIRMA_PENDIENTE
-                        WHERE id_contrato = %s
-                    """
-                    cursor.execute(sql_todos_firmantes, (id_contrato,))
-                    todos_firmantes = cursor.fetchall()
+                        # Notificar a todos los firmantes
+                        sql_todos_firmantes = """
+                            SELECT DISTINCT id_usuario FROM CONTRATO_FIRMA_PENDIENTE
+                            WHERE id_contrato = %s
+                        """
+                        cursor.execute(sql_todos_firmantes, (id_contrato,))
+                        todos_firmantes = cursor.fetchall()
                     
-                    conexion.commit()
+                        conexion.commit()
                     
-                    for (id_firmante,) in todos_firmantes:
-                        ControlNotificaciones.crear_notificacion(
-                            id_usuario=id_firmante,
-                            titulo=f"✅ Contrato Completado: {contrato['titulo']}",
-                            mensaje=f"Todos los firmantes han firmado el contrato. El proceso está completo.",
-                            tipo="contrato",
-                            id_referencia=id_contrato
-                        )
+                        for (id_firmante,) in todos_firmantes:
+                            ControlNotificaciones.crear_notificacion(
+                                id_usuario=id_firmante,
+                                titulo=f"✅ Contrato Completado: {contrato['titulo']}",
+                                mensaje=f"Todos los firmantes han firmado el contrato. El proceso está completo.",
+                                tipo="contrato",
+                                id_referencia=id_contrato
+                            )
                     
-                    mensaje_resultado = 'Contrato firmado completamente'
-                else:
-                    # Notificar al siguiente firmante
-                    # Obtener nombre del rol del siguiente firmante
-                    sql_rol_siguiente = """
-                        SELECT r.nombre
-                        FROM CONTRATO_FIRMA_PENDIENTE cfp
-                        INNER JOIN USUARIO u ON cfp.id_usuario = u.id_usuario
-                        INNER JOIN ROL r ON u.id_rol = r.id_rol
-                        WHERE cfp.id_contrato = %s AND cfp.id_usuario = %s
-                    """
-                    cursor.execute(sql_rol_siguiente, (id_contrato, siguiente_firmante[0]))
-                    nombre_rol_siguiente = cursor.fetchone()
-                    nombre_rol_siguiente_text = nombre_rol_siguiente[0] if nombre_rol_siguiente else ''
+                        mensaje_resultado = 'Contrato firmado completamente'
+                    else:
+                        # Notificar al siguiente firmante
+                        # Obtener nombre del rol del siguiente firmante
+                        sql_rol_siguiente = """
+                            SELECT r.nombre
+                            FROM CONTRATO_FIRMA_PENDIENTE cfp
+                            INNER JOIN USUARIO u ON cfp.id_usuario = u.id_usuario
+                            INNER JOIN ROL r ON u.id_rol = r.id_rol
+                            WHERE cfp.id_contrato = %s AND cfp.id_usuario = %s
+                        """
+                        cursor.execute(sql_rol_siguiente, (id_contrato, siguiente_firmante[0]))
+                        nombre_rol_siguiente = cursor.fetchone()
+                        nombre_rol_siguiente_text = nombre_rol_siguiente[0] if nombre_rol_siguiente else ''
                     
-                    conexion.commit()
+                        conexion.commit()
                     
-                    mensaje_notif = f"{nombre_completo} ha firmado el contrato. Ahora es tu turno (Firma #{siguiente_firmante[1]})"
-                    if nombre_rol_siguiente_text:
-                        mensaje_notif += f" como {nombre_rol_siguiente_text}."
-                    else:
-                        mensaje_notif += "."
+                        mensaje_notif = f"{nombre_completo} ha firmado el contrato. Ahora es tu turno (Firma #{siguiente_firmante[1]})"
+                        if nombre_rol_siguiente_text:
+                            mensaje_notif += f" como {nombre_rol_siguiente_text}."
+                        else:
+                            mensaje_notif += "."
                     
-                    ControlNotificaciones.crear_notificacion(
-                        id_usuario=siguiente_firmante[0],
-                        titulo=f"Tu Turno para Firmar: {contrato['titulo']}",
-                        mensaje=mensaje_notif,
-                        tipo="contrato",
-                        id_referencia=id_contrato
-                    )
+                        ControlNotificaciones.crear_notificacion(
+                            id_usuario=siguiente_firmante[0],
+                            titulo=f"Tu Turno para Firmar: {contrato['titulo']}",
+                            mensaje=mensaje_notif,
+                            tipo="contrato",
+                            id_referencia=id_contrato
+                        )
                     
-                    mensaje_resultado = f'Firma registrada. Notificando al siguiente firmante.'
+                        mensaje_resultado = f'Firma registrada. Notificando al siguiente firmante.'
             
-            conexion.close()
+                conexion.close()
+            
+            if not unidad.confirmada:
+                return {'success': False, 'message': 'Error al registrar la firma en la BD'}
             
             print(f"✅ Contrato firmado exitosamente por {nombre_completo}")
             return {'success': True, 'message': mensaje_resultado}
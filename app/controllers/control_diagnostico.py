@@ -1,4 +1,5 @@
-from ConexionBD import get_connection
+from ConexionBD import get_connection, transaccion
+from services.busqueda_service import BusquedaService
 
 class ControlDiagnosticos:
     @staticmethod
@@ -68,6 +69,49 @@ class ControlDiagnosticos:
         except Exception as e:
             print(f"Error en tiene_diagnostico_pendiente => {e}")
             return False
+
+    @staticmethod
+    def tiene_diagnosticos_pendientes(ids_incidentes, id_usuario):
+        """
+        Versión por lotes de tiene_diagnostico_pendiente: en una sola consulta
+        retorna el conjunto de ids de incidentes (de ids_incidentes) en los que
+        el usuario tiene un diagnóstico pendiente.
+        """
+        ids_incidentes = [int(i) for i in ids_incidentes if i is not None]
+        if not ids_incidentes:
+            return set()
+        try:
+            conexion = get_connection()
+            if not conexion:
+                return set()
+            
+            sql = """
+                SELECT DISTINCT d.id_incidente
+                FROM DIAGNOSTICO d
+                LEFT JOIN REVISION_DIAGNOSTICO rd ON d.id_diagnosticos = rd.id_diagnostico
+                WHERE d.id_incidente = ANY(%s)
+                AND d.id_usuario = %s
+                AND (
+                    rd.id_revision IS NULL
+                    OR (
+                        rd.id_revision IS NOT NULL 
+                        AND d.fecha_actualizacion IS NOT NULL
+                        AND d.fecha_actualizacion > rd.fecha_rechazo
+                    )
+                )
+            """
+            
+            with conexion.cursor() as cursor:
+                cursor.execute(sql, (ids_incidentes, id_usuario))
+                filas = cursor.fetchall()
+            
+            conexion.close()
+            
+            return {fila[0] for fila in filas}
+            
+        except Exception as e:
+            print(f"Error en tiene_diagnosticos_pendientes => {e}")
+            return set()
     
     @staticmethod
     def insertar_diagnostico(id_incidente, descripcion, causa_raiz, solucion, comentario=None, usuario_id=None):
@@ -277,22 +321,7 @@ class ControlDiagnosticos:
                 print("No se pudo conectar a la base de datos.")
                 return []
 
-            # Primero, crear la tabla REVISION_DIAGNOSTICO si no existe
-            sql_create_table = """
-                CREATE TABLE IF NOT EXISTS REVISION_DIAGNOSTICO (
-                    id_revision SERIAL PRIMARY KEY,
-                    id_diagnostico INTEGER NOT NULL,
-                    fecha_rechazo TIMESTAMP DEFAULT NOW(),
-                    id_usuario INTEGER,
-                    FOREIGN KEY (id_diagnostico) REFERENCES DIAGNOSTICO(id_diagnosticos),
-                    FOREIGN KEY (id_usuario) REFERENCES USUARIO(id_usuario)
-                );
-            """
-            
-            with conexion.cursor() as cursor:
-                cursor.execute(sql_create_table)
-                conexion.commit()
-
+            # La tabla REVISION_DIAGNOSTICO la crea la migración 001 (ver migraciones.py)
             # Consulta para obtener diagnósticos pendientes de revisión
             sql = """
                 SELECT DISTINCT d.id_diagnosticos, 
@@ -436,7 +465,19 @@ class ControlDiagnosticos:
     
     @staticmethod
     def aceptar_revision(id_diagnostico, id_incidente):
-        from controllers.control_incidentes import ControlIncidentes
+        """Acepta el diagnóstico y termina el incidente en una sola transacción (estado, historial y notificaciones)"""
+        try:
+            with transaccion() as unidad:
+                resultado = ControlDiagnosticos._aceptar_revision(id_diagnostico, id_incidente)
+            return resultado and bool(unidad.confirmada)
+        except Exception as e:
+            print(f"Error en aceptar_revision => {e}")
+            return False
+
+    @staticmethod
+    def _aceptar_revision(id_diagnostico, id_incidente):
+        from controllers.control_incidentes import ControlIncidentes, datos_incidentes_modificados
+        from controllers.control_mttr import ControlMTTR
         from controllers.control_notificaciones import ControlNotificaciones
         
         try:
@@ -465,10 +506,14 @@ class ControlDiagnosticos:
 
             with conexion.cursor() as cursor:
                 cursor.execute(sql, (id_incidente,))
-                conexion.commit()
                 afectadas = cursor.rowcount
+                if afectadas > 0:
+                    ControlMTTR.sincronizar_incidente(cursor, id_incidente)
+                conexion.commit()
 
             conexion.close()
+            # Se aplica al COMMIT de la unidad de trabajo de aceptar_revision
+            datos_incidentes_modificados()
             
             # Obtener información completa del diagnóstico aceptado
             diagnostico = ControlDiagnosticos.buscar_por_IDDiagnostico(id_diagnostico)
@@ -586,22 +631,7 @@ class ControlDiagnosticos:
                 print("No se pudo conectar a la base de datos.")
                 return False
 
-            # Crear la tabla si no existe
-            sql_create_table = """
-                CREATE TABLE IF NOT EXISTS REVISION_DIAGNOSTICO (
-                    id_revision SERIAL PRIMARY KEY,
-                    id_diagnostico INTEGER NOT NULL,
-                    fecha_rechazo TIMESTAMP DEFAULT NOW(),
-                    id_usuario INTEGER,
-                    FOREIGN KEY (id_diagnostico) REFERENCES DIAGNOSTICO(id_diagnosticos),
-                    FOREIGN KEY (id_usuario) REFERENCES USUARIO(id_usuario)
-                );
-            """
-            
             with conexion.cursor() as cursor:
-                cursor.execute(sql_create_table)
-                conexion.commit()
-                
                 # Verificar si ya existe un rechazo para este diagnóstico
                 sql_check = """
                     SELECT id_revision FROM REVISION_DIAGNOSTICO 
@@ -681,9 +711,9 @@ class ControlDiagnosticos:
     def obtener_diagnosticos_filtrados(self, id_usuario, titulo='', causa=''):
         conexion = None
         try:
-            # Asegurar que los parámetros sean strings
-            titulo = str(titulo) if titulo else ''
-            causa = str(causa) if causa else ''
+            # Normalizar el texto de búsqueda
+            titulo = BusquedaService.normalizar(titulo)
+            causa = BusquedaService.normalizar(causa)
             
             conexion = get_connection()
             if not conexion:
@@ -692,7 +722,31 @@ class ControlDiagnosticos:
             
             cursor = conexion.cursor()
 
-            query = """
+            # Búsqueda por texto completo con ranking (ver BusquedaService)
+            condiciones = ["d.id_usuario = %s", "i.estado = 'A'"]
+            params_where = [id_usuario]
+            rangos = []
+            params_rango = []
+            if titulo:
+                condicion, params = BusquedaService.condicion(titulo, 'i.busqueda', ['i.titulo', 'i.descripcion'])
+                condiciones.append(condicion)
+                params_where.extend(params)
+                rango, params = BusquedaService.ranking(titulo, 'i.busqueda', 'i.titulo')
+                rangos.append(rango)
+                params_rango.extend(params)
+            if causa:
+                condicion, params = BusquedaService.condicion(causa, 'd.busqueda', ['d.causa_raiz'])
+                condiciones.append(condicion)
+                params_where.extend(params)
+                rango, params = BusquedaService.ranking(causa, 'd.busqueda', 'd.causa_raiz')
+                rangos.append(rango)
+                params_rango.extend(params)
+
+            orden = "d.fecha_diagnostico DESC"
+            if rangos:
+                orden = f"({' + '.join(rangos)}) DESC, " + orden
+
+            query = f"""
                 SELECT 
                     d.id_diagnosticos, 
                     d.id_incidente, 
@@ -707,14 +761,10 @@ class ControlDiagnosticos:
                 FROM DIAGNOSTICO d
                 JOIN INCIDENTE i ON d.id_incidente = i.id_incidente
                 JOIN USUARIO u ON d.id_usuario = u.id_usuario
-                WHERE (%s = '' OR i.titulo ILIKE %s OR i.descripcion ILIKE %s)
-                AND (%s = '' OR d.causa_raiz ILIKE %s)
-                AND d.id_usuario = %s
-                AND i.estado = 'A'
-                ORDER BY d.fecha_diagnostico DESC;
+                WHERE {' AND '.join(condiciones)}
+                ORDER BY {orden};
             """
-            valores = (titulo, f"%{titulo}%", f"%{titulo}%", causa, f"%{causa}%", id_usuario)
-            cursor.execute(query, valores)
+            cursor.execute(query, params_where + params_rango)
             diagnosticos = cursor.fetchall()
 
             lista = []
@@ -1,4 +1,43 @@
-from ConexionBD import get_connection
+from ConexionBD import al_confirmar, get_connection, transaccion
+from datetime import datetime, timedelta
+from services.cache_service import CacheTTL, CacheVersionada
+from services.busqueda_service import BusquedaService
+from controllers.control_mttr import ControlMTTR
+from controllers.control_anomalias import ControlAnomalias
+import re
+
+# Códigos de estado del incidente y su texto en pantalla
+ESTADOS_INCIDENTE = {
+    'P': 'Pendiente',
+    'A': 'Activo',
+    'T': 'Terminado',
+    'C': 'Cancelado'
+}
+
+# MTTR en horas a partir de las sumas del resumen MTTR_RESUMEN (alias r)
+MTTR_HORAS_SQL = "ROUND((SUM(r.suma_horas) / NULLIF(SUM(r.cantidad_medida), 0))::numeric, 2)"
+
+# Conteos del dashboard: TTL corto y se invalidan en cada cambio de estado
+cache_estadisticas = CacheTTL('estadisticas_dashboard', ttl=30, max_entradas=4)
+
+# Respuestas JSON de MTTR y predicciones (ver run.py): cambian solo cuando un
+# incidente cambia de estado, y en ese momento sube su versión
+cache_respuestas = CacheVersionada('respuestas_api', ttl=120, max_entradas=256)
+
+
+def _invalidar_caches_incidentes():
+    cache_estadisticas.invalidar()
+    cache_respuestas.incrementar_version()
+
+
+def datos_incidentes_modificados():
+    """
+    Invalida las cachés derivadas de INCIDENTE (llamar después del commit).
+    Dentro de transaccion() se aplaza hasta el COMMIT real de la unidad.
+    """
+    al_confirmar(_invalidar_caches_incidentes)
+
+
 class ControlIncidentes:
     @staticmethod
 
@@ -41,12 +80,13 @@ class ControlIncidentes:
                 RETURNING id_incidente;
             """
             with conexion.cursor() as cursor:
-                # Asegurar encoding UTF-8 antes de ejecutar
-                cursor.execute("SET CLIENT_ENCODING TO 'UTF8';")
                 cursor.execute(sql, (titulo, descripcion, id_categoria, id_usuario, nivel))
                 id_incidente = cursor.fetchone()[0]
+                # Detector de anomalías en línea: conteo del día de la categoría
+                ControlAnomalias.registrar_incidente(cursor, id_categoria)
                 conexion.commit()
             conexion.close()
+            datos_incidentes_modificados()
             print(f"✅ Incidente creado con nivel '{nivel}' (ID: {id_incidente})")
             return id_incidente
                 
@@ -81,105 +121,107 @@ class ControlIncidentes:
             print(f"Error en buscar_por_ID => {e}")
             return None
         
-    def listar_incidentes(id_usuario=None, id_rol=None):
+    def listar_incidentes(id_usuario=None, id_rol=None, filtros=None, cursor_pagina=None, tamano_pagina=None):
         """
         Lista incidentes según el usuario y rol.
         - Si id_rol == 1 (Jefe de TI): todos los incidentes
         - Si es jefe (tipo J): solo los que creó (id_usuario)
         - Si es técnico (tipo T): solo los asignados (id_tecnico_asignado) o en equipo técnico
+
+        filtros (opcional): dict con buscar, categoria, estado, fecha_desde, fecha_hasta
+        (los mismos parámetros del formulario de gestión de incidentes).
+
+        Paginación por id_incidente (keyset): si se indica tamano_pagina se retorna
+        {'incidentes': [...], 'total': n, 'siguiente_cursor': id o None} y la
+        siguiente página se pide con cursor_pagina=siguiente_cursor.
+        Sin tamano_pagina se retorna la lista completa (comportamiento anterior).
         """
+        vacio = {'incidentes': [], 'total': 0, 'siguiente_cursor': None} if tamano_pagina else []
         try:
-            conexion = get_connection()
-            if not conexion:
-                print("No se pudo conectar a la base de datos.")
-                return []
-
-            # Construir la consulta según el rol
+            # Condiciones de visibilidad según el rol
+            condiciones = []
+            params = []
             if id_rol == 1:
                 # Jefe de TI: ver todos los incidentes
-                sql = """
-                    SELECT 
-                        i.id_incidente,
-                        i.titulo,
-                        i.descripcion,
-                        COALESCE(c.nombre, 'Sin categoría') AS categoria,
-                        i.estado,
-                        i.nivel,
-                        i.fecha_reporte,
-                        i.fecha_resolucion,
-                        i.tiempo_reparacion,
-                        i.id_usuario,
-                        i.id_tecnico_asignado
-                    FROM INCIDENTE i
-                    LEFT JOIN CATEGORIA c ON i.id_categoria = c.id_categoria
-                    ORDER BY i.id_incidente DESC;
-                """
-                params = ()
-            elif id_usuario:
-                # Para jefes o técnicos: filtrar según corresponda
-                # Primero verificamos si es jefe o técnico consultando el rol
+                pass
+            elif id_usuario and id_rol:
                 from controllers.controlador_rol import ControlRol
-                if id_rol:
-                    rol = ControlRol.buscar_por_IDRol(id_rol)
-                    tipo_rol = rol.get('tipo') if rol else None
-                    
-                    if tipo_rol == 'J':
-                        # Jefe: solo los que creó
-                        sql = """
-                            SELECT 
-                                i.id_incidente,
-                                i.titulo,
-                                i.descripcion,
-                                COALESCE(c.nombre, 'Sin categoría') AS categoria,
-                                i.estado,
-                                i.nivel,
-                                i.fecha_reporte,
-                                i.fecha_resolucion,
-                                i.tiempo_reparacion,
-                                i.id_usuario,
-                                i.id_tecnico_asignado
-                            FROM INCIDENTE i
-                            LEFT JOIN CATEGORIA c ON i.id_categoria = c.id_categoria
-                            WHERE i.id_usuario = %s
-                            ORDER BY i.id_incidente DESC;
-                        """
-                        params = (id_usuario,)
-                    elif tipo_rol == 'T':
-                        # Técnico: los asignados directamente o en equipo técnico
-                        sql = """
-                            SELECT DISTINCT
-                                i.id_incidente,
-                                i.titulo,
-                                i.descripcion,
-                                COALESCE(c.nombre, 'Sin categoría') AS categoria,
-                                i.estado,
-                                i.nivel,
-                                i.fecha_reporte,
-                                i.fecha_resolucion,
-                                i.tiempo_reparacion,
-                                i.id_usuario,
-                                i.id_tecnico_asignado
-                            FROM INCIDENTE i
-                            LEFT JOIN CATEGORIA c ON i.id_categoria = c.id_categoria
-                            LEFT JOIN EQUIPO_TECNICO et ON i.id_incidente = et.id_incidente
-                            WHERE i.id_tecnico_asignado = %s OR et.id_usuario = %s
-                            ORDER BY i.id_incidente DESC;
-                        """
-                        params = (id_usuario, id_usuario)
-                    else:
-                        # Otro tipo de rol: sin incidentes
-                        return []
+                rol = ControlRol.buscar_por_IDRol(id_rol)
+                tipo_rol = rol.get('tipo') if rol else None
+
+                if tipo_rol == 'J':
+                    # Jefe: solo los que creó
+                    condiciones.append("i.id_usuario = %s")
+                    params.append(id_usuario)
+                elif tipo_rol == 'T':
+                    # Técnico: los asignados directamente o en equipo técnico
+                    condiciones.append("""i.id_incidente IN (
+                            SELECT a.id_incidente FROM ASIGNACION_TECNICO a
+                            WHERE a.id_usuario = %s)""")
+                    params.append(id_usuario)
                 else:
-                    # Sin rol definido: sin incidentes
-                    return []
+                    # Otro tipo de rol: sin incidentes
+                    return vacio
             else:
-                # Sin usuario: sin incidentes
-                return []
+                # Sin usuario o sin rol definido: sin incidentes
+                return vacio
+
+            ControlIncidentes._agregar_filtros(filtros or {}, condiciones, params)
+
+            where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+            sql = f"""
+                SELECT 
+                    i.id_incidente,
+                    i.titulo,
+                    i.descripcion,
+                    COALESCE(c.nombre, 'Sin categoría') AS categoria,
+                    i.estado,
+                    i.nivel,
+                    i.fecha_reporte,
+                    i.fecha_resolucion,
+                    i.tiempo_reparacion,
+                    i.id_usuario,
+                    i.id_tecnico_asignado
+                FROM INCIDENTE i
+                LEFT JOIN CATEGORIA c ON i.id_categoria = c.id_categoria
+                {where}
+            """
+
+            conexion = get_connection()
+            if not conexion:
+                print("No se pudo conectar a la base de datos.")
+                return vacio
 
+            total = None
             with conexion.cursor() as cursor:
-                cursor.execute(sql, params)
+                if tamano_pagina:
+                    cursor.execute(f"""
+                        SELECT COUNT(*)
+                        FROM INCIDENTE i
+                        LEFT JOIN CATEGORIA c ON i.id_categoria = c.id_categoria
+                        {where}
+                    """, params)
+                    total = cursor.fetchone()[0]
+
+                    params_pagina = list(params)
+                    if cursor_pagina:
+                        sql += (" AND " if where else " WHERE ") + "i.id_incidente < %s"
+                        params_pagina.append(int(cursor_pagina))
+                    # Se pide una fila extra para saber si hay página siguiente
+                    sql += " ORDER BY i.id_incidente DESC LIMIT %s"
+                    params_pagina.append(int(tamano_pagina) + 1)
+                    cursor.execute(sql, params_pagina)
+                else:
+                    cursor.execute(sql + " ORDER BY i.id_incidente DESC", params)
                 filas = cursor.fetchall()
 
+            conexion.close()
+
+            siguiente_cursor = None
+            if tamano_pagina and len(filas) > int(tamano_pagina):
+                filas = filas[:int(tamano_pagina)]
+                siguiente_cursor = filas[-1][0]
+
             atributos = [
                 'id_incidente', 'titulo', 'descripcion',
                 'categoria', 'estado', 'nivel', 'fecha_reporte',
@@ -188,32 +230,122 @@ class ControlIncidentes:
 
             incidentes = [dict(zip(atributos, fila)) for fila in filas]
 
-            # Traducir estado corto a texto completo
-            estado_map = {
-                'P': 'Pendiente',
-                'A': 'Activo',
-                'T': 'Terminado',
-                'C': 'Cancelado'
-            }
-
             for inc in incidentes:
                 if inc.get('estado'):
                     estado_corto = inc['estado'].upper()
-                    inc['estado'] = estado_map.get(estado_corto, inc['estado'])
+                    inc['estado'] = ESTADOS_INCIDENTE.get(estado_corto, inc['estado'])
                     inc['estado_corto'] = estado_corto  # Guardar también el código corto
                 if inc.get('fecha_reporte'):
                     inc['fecha_reporte'] = inc['fecha_reporte'].strftime('%Y-%m-%d')
 
-            conexion.close()
+            if tamano_pagina:
+                return {'incidentes': incidentes, 'total': total, 'siguiente_cursor': siguiente_cursor}
             return incidentes
 
         except Exception as e:
             print(f"Error en listar_incidentes => {e}")
             import traceback
             traceback.print_exc()
-            return []
+            return vacio
+
+    @staticmethod
+    def _agregar_filtros(filtros, condiciones, params):
+        """Traduce los filtros del formulario a condiciones SQL parametrizadas"""
+        buscar = BusquedaService.normalizar(filtros.get('buscar'))
+        if buscar:
+            # Texto completo en título/descripción, parcial en título, o número de incidente (INC-012)
+            condicion, params_busqueda = BusquedaService.condicion(buscar, 'i.busqueda', ['i.titulo'])
+            numero = re.fullmatch(r'(?:inc-?)?0*(\d{1,9})', buscar, re.IGNORECASE)
+            if numero:
+                condicion = f"(i.id_incidente = %s OR {condicion})"
+                params_busqueda = [int(numero.group(1))] + params_busqueda
+            condiciones.append(condicion)
+            params.extend(params_busqueda)
+
+        categoria = (filtros.get('categoria') or '').strip().lower()
+        if categoria:
+            condiciones.append("LOWER(COALESCE(c.nombre, 'Sin categoría')) = %s")
+            params.append(categoria)
+
+        estado = (filtros.get('estado') or '').strip().lower()
+        if estado:
+            codigos = {nombre.lower(): codigo for codigo, nombre in ESTADOS_INCIDENTE.items()}
+            condiciones.append("i.estado = %s")
+            params.append(codigos.get(estado, estado.upper()))
+
+        for clave, operador in (('fecha_desde', '>='), ('fecha_hasta', '<')):
+            valor = (filtros.get(clave) or '').strip()
+            if not valor:
+                continue
+            try:
+                fecha = datetime.strptime(valor, '%Y-%m-%d').date()
+            except ValueError:
+                print(f"⚠️ Fecha de filtro inválida ({clave}): {valor}")
+                continue
+            if clave == 'fecha_hasta':
+                # Incluir todo el día indicado
+                fecha += timedelta(days=1)
+            condiciones.append(f"i.fecha_reporte {operador} %s")
+            params.append(fecha)
+
+    @staticmethod
+    @cache_estadisticas.memorizar
+    def obtener_estadisticas_dashboard():
+        """
+        Estadísticas del dashboard sin traer toda la tabla: conteos por estado
+        (un GROUP BY) y los 5 incidentes más recientes.
+        """
+        try:
+            conexion = get_connection()
+            if not conexion:
+                return None
+
+            with conexion.cursor() as cursor:
+                cursor.execute("""
+                    SELECT estado, COUNT(*)
+                    FROM INCIDENTE
+                    GROUP BY estado
+                """)
+                conteos = {(estado or '').upper(): cantidad for estado, cantidad in cursor.fetchall()}
+
+                cursor.execute("""
+                    SELECT 
+                        i.id_incidente,
+                        i.titulo,
+                        COALESCE(c.nombre, 'Sin categoría') AS categoria,
+                        i.estado,
+                        i.nivel,
+                        i.fecha_reporte
+                    FROM INCIDENTE i
+                    LEFT JOIN CATEGORIA c ON i.id_categoria = c.id_categoria
+                    ORDER BY i.id_incidente DESC
+                    LIMIT 5
+                """)
+                filas = cursor.fetchall()
+
+            conexion.close()
+
+            atributos = ['id_incidente', 'titulo', 'categoria', 'estado', 'nivel', 'fecha_reporte']
+            recientes = [dict(zip(atributos, fila)) for fila in filas]
+            for inc in recientes:
+                estado_corto = (inc['estado'] or '').upper()
+                inc['estado'] = ESTADOS_INCIDENTE.get(estado_corto, inc['estado'])
+                inc['estado_corto'] = estado_corto
+                if inc.get('fecha_reporte'):
+                    inc['fecha_reporte'] = inc['fecha_reporte'].strftime('%Y-%m-%d')
+
+            return {
+                'total_incidentes': sum(conteos.values()),
+                'incidentes_abiertos': conteos.get('P', 0),
+                'incidentes_proceso': conteos.get('A', 0),
+                'incidentes_resueltos': conteos.get('T', 0),
+                'incidentes_cancelados': conteos.get('C', 0),
+                'incidentes_recientes': recientes
+            }
+        except Exception as e:
+            print(f"Error en obtener_estadisticas_dashboard => {e}")
+            return None
 
-        
     def actualizar_incidentes(id_incidente, titulo, descripcion, id_categoria, id_usuario, estado, nivel=None):
         try:
             if nivel:
@@ -246,9 +378,12 @@ class ControlIncidentes:
 
             with conexion.cursor() as cursor:
                 cursor.execute(sql, params)
+                # La categoría, el nivel o el estado pueden cambiar la fila del resumen MTTR
+                ControlMTTR.sincronizar_incidente(cursor, id_incidente)
                 conexion.commit()
 
             conexion.close()
+            datos_incidentes_modificados()
             return 0  
         except Exception as e:
             print(f"Error en actualizar => {e}")
@@ -281,9 +416,12 @@ class ControlIncidentes:
 
             with conexion.cursor() as cursor:
                 cursor.execute(sql, (nuevo_estado, nuevo_estado, nuevo_estado, id_incidente))
+                # Mantener el resumen MTTR en la misma transacción
+                ControlMTTR.sincronizar_incidente(cursor, id_incidente)
                 conexion.commit()
 
             conexion.close()
+            datos_incidentes_modificados()
             
             # Registrar en historial si cambió el estado
             if estado_anterior != nuevo_estado:
@@ -328,10 +466,13 @@ class ControlIncidentes:
             
             with conexion.cursor() as cursor:
                 cursor.execute(sql, (nuevo_estado, nuevo_estado, nuevo_estado, id_incidente))
-                conexion.commit()
                 afectadas = cursor.rowcount
+                if afectadas > 0 and nuevo_estado == 'C':
+                    ControlMTTR.sincronizar_incidente(cursor, id_incidente)
+                conexion.commit()
             
             conexion.close()
+            datos_incidentes_modificados()
             
             # Registrar en historial si se actualizó correctamente
             if afectadas > 0 and estado_anterior != nuevo_estado:
@@ -371,6 +512,8 @@ class ControlIncidentes:
                 afectadas = cursor.rowcount
             
             conexion.close()
+            if afectadas > 0:
+                datos_incidentes_modificados()
             
             # Registrar en historial si se actualizó correctamente
             if afectadas > 0 and prioridad_anterior != nivel:
@@ -412,6 +555,8 @@ class ControlIncidentes:
                 afectadas = cursor.rowcount
             
             conexion.close()
+            if afectadas > 0:
+                datos_incidentes_modificados()
             
             # Registrar en historial si se actualizó correctamente
             if afectadas > 0 and tecnico_anterior != id_tecnico:
@@ -468,6 +613,7 @@ class ControlIncidentes:
                 conexion.commit()
             
             conexion.close()
+            datos_incidentes_modificados()
             
             # Registrar en historial
             tecnico = controlUsuarios.buscar_por_ID(id_usuario)
@@ -606,6 +752,19 @@ class ControlIncidentes:
     @staticmethod
     def tomar_incidente_disponible(id_incidente, id_usuario):
         """Permite a un técnico tomar un incidente disponible"""
+        try:
+            # Equipo técnico, historial y notificación se confirman juntos o no se confirma nada
+            with transaccion() as unidad:
+                resultado = ControlIncidentes._tomar_incidente_disponible(id_incidente, id_usuario)
+            if resultado.get('exito') and not unidad.confirmada:
+                return {'exito': False, 'mensaje': 'No se pudo registrar la asignación. Intenta nuevamente'}
+            return resultado
+        except Exception as e:
+            print(f"Error en tomar_incidente_disponible => {e}")
+            return {'exito': False, 'mensaje': f'Error: {str(e)}'}
+
+    @staticmethod
+    def _tomar_incidente_disponible(id_incidente, id_usuario):
         try:
             from controllers.control_Usuarios import controlUsuarios
             from controllers.control_notificaciones import ControlNotificaciones
@@ -672,6 +831,7 @@ class ControlIncidentes:
                 conexion.commit()
             
             conexion.close()
+            datos_incidentes_modificados()
             
             # Obtener información del técnico
             tecnico = controlUsuarios.buscar_por_ID(id_usuario)
@@ -1016,27 +1176,20 @@ class ControlIncidentes:
                 print("❌ No se pudo conectar a la base de datos.")
                 return []
 
-            # Consulta que calcula MTTR usando el campo tiempo_reparacion o calculándolo
-            # Solo considera incidentes Terminados ('T') o Cancelados ('C')
-            sql = """
+            # Se lee del resumen MTTR_RESUMEN (incidentes Terminados 'T' o Cancelados 'C')
+            sql = f"""
                 SELECT 
                     COALESCE(c.nombre, 'Sin categoría') AS categoria,
-                    CASE 
-                        WHEN COUNT(CASE WHEN i.tiempo_reparacion IS NOT NULL THEN 1 END) > 0 THEN
-                            ROUND(AVG(EXTRACT(EPOCH FROM i.tiempo_reparacion) / 3600), 2)
-                        WHEN COUNT(CASE WHEN i.fecha_resolucion IS NOT NULL AND i.fecha_reporte IS NOT NULL THEN 1 END) > 0 THEN
-                            ROUND(AVG(EXTRACT(EPOCH FROM (i.fecha_resolucion - i.fecha_reporte)) / 3600), 2)
-                        ELSE 0
-                    END AS mttr_horas,
-                    COUNT(i.id_incidente) AS total_incidentes
+                    {MTTR_HORAS_SQL} AS mttr_horas,
+                    SUM(r.cantidad) AS total_incidentes
                 FROM 
-                    INCIDENTE i
+                    MTTR_RESUMEN r
                 LEFT JOIN 
-                    CATEGORIA c ON i.id_categoria = c.id_categoria
-                WHERE 
-                    i.estado IN ('T', 'C')
+                    CATEGORIA c ON r.id_categoria = c.id_categoria
                 GROUP BY 
                     c.nombre
+                HAVING 
+                    SUM(r.cantidad) > 0
                 ORDER BY 
                     mttr_horas ASC;
             """
@@ -1065,143 +1218,113 @@ class ControlIncidentes:
 
     def obtener_estadisticas_mttr(self):
         """Obtiene las métricas de MTTR global y por categoría SOLO con datos reales"""
+        return self.calcular_mttr()['estadisticas']
+
+    def calcular_mttr(self, categoria=None, periodo_meses=None):
+        """
+        Motor de estadísticas MTTR: en una sola consulta (CTE + funciones de
+        ventana sobre MTTR_RESUMEN) calcula el MTTR por categoría, el MTTR global
+        ponderado, el total de incidentes y la mejor y peor categoría. Agrega los
+        percentiles p50/p90/p99 por categoría y por nivel (ver ControlMTTR.obtener_percentiles).
+
+        Sin filtros, total_incidentes cuenta todos los incidentes registrados;
+        con filtros, los incidentes cerrados del período/categoría.
+
+        Returns:
+            dict: {'mttr_data': [...], 'estadisticas': {...}, 'percentiles_nivel': [...]}
+        """
         try:
             conexion = get_connection()
             if not conexion:
                 print("❌ No se pudo conectar a la base de datos.")
-                return self._estadisticas_vacias()
+                return {'mttr_data': [], 'estadisticas': self._estadisticas_vacias(), 'percentiles_nivel': []}
 
-            with conexion.cursor() as cursor:
-                # MTTR Global usando tiempo_reparacion o calculando
-                # Solo incidentes Terminados ('T') o Cancelados ('C')
-                cursor.execute("""
-                    SELECT 
-                        CASE 
-                            WHEN COUNT(CASE WHEN tiempo_reparacion IS NOT NULL THEN 1 END) > 0 THEN
-                                ROUND(AVG(EXTRACT(EPOCH FROM tiempo_reparacion) / 3600), 2)
-                            WHEN COUNT(CASE WHEN fecha_resolucion IS NOT NULL AND fecha_reporte IS NOT NULL THEN 1 END) > 0 THEN
-                                ROUND(AVG(EXTRACT(EPOCH FROM (fecha_resolucion - fecha_reporte)) / 3600), 2)
-                            ELSE 0
-                        END AS mttr_global
-                    FROM INCIDENTE
-                    WHERE estado IN ('T', 'C');
-                """)
-                resultado = cursor.fetchone()
-                mttr_global = float(resultado[0]) if resultado and resultado[0] else 0.0
+            where_conditions, params = ControlMTTR.condiciones_filtro(categoria, periodo_meses)
+            filtrado = bool(params)
 
-                # Total de incidentes
-                cursor.execute("SELECT COUNT(*) FROM INCIDENTE;")
-                total_incidentes = cursor.fetchone()[0] or 0
+            total_sql = "SUM(medidas) OVER ()" if filtrado else "(SELECT COUNT(*) FROM INCIDENTE)"
 
-                # Mejor categoría (menor MTTR) con datos reales
-                cursor.execute("""
+            sql = f"""
+                WITH por_categoria AS (
                     SELECT 
-                        COALESCE(c.nombre, 'Sin categoría') AS nombre, 
-                        CASE 
-                            WHEN COUNT(CASE WHEN i.tiempo_reparacion IS NOT NULL THEN 1 END) > 0 THEN
-                                ROUND(AVG(EXTRACT(EPOCH FROM i.tiempo_reparacion) / 3600), 2)
-                            WHEN COUNT(CASE WHEN i.fecha_resolucion IS NOT NULL AND i.fecha_reporte IS NOT NULL THEN 1 END) > 0 THEN
-                                ROUND(AVG(EXTRACT(EPOCH FROM (i.fecha_resolucion - i.fecha_reporte)) / 3600), 2)
-                            ELSE 999999
-                        END AS mttr
-                    FROM INCIDENTE i
-                    LEFT JOIN CATEGORIA c ON i.id_categoria = c.id_categoria
-                    WHERE i.estado IN ('T', 'C')
+                        COALESCE(c.nombre, 'Sin categoría') AS categoria,
+                        SUM(r.cantidad) AS cantidad,
+                        SUM(r.cantidad_medida) AS medidas,
+                        SUM(r.suma_horas) AS suma_horas
+                    FROM MTTR_RESUMEN r
+                    LEFT JOIN CATEGORIA c ON r.id_categoria = c.id_categoria
+                    WHERE {" AND ".join(where_conditions)}
                     GROUP BY c.nombre
-                    HAVING COUNT(i.id_incidente) > 0
-                    ORDER BY mttr ASC
-                    LIMIT 1;
-                """)
-                mejor_categoria = cursor.fetchone()
-                mejor_nombre = mejor_categoria[0] if mejor_categoria else "N/A"
-                mejor_mttr = float(mejor_categoria[1]) if mejor_categoria and mejor_categoria[1] < 999999 else 0.0
+                    HAVING SUM(r.cantidad_medida) > 0
+                )
+                SELECT 
+                    categoria,
+                    ROUND((suma_horas / medidas)::numeric, 2) AS mttr_horas,
+                    medidas AS total_incidentes,
+                    ROUND((SUM(suma_horas) OVER () / SUM(medidas) OVER ())::numeric, 2) AS mttr_global,
+                    {total_sql} AS total,
+                    ROW_NUMBER() OVER (ORDER BY suma_horas / medidas DESC, categoria) AS posicion_peor
+                FROM por_categoria
+                ORDER BY mttr_horas ASC, categoria;
+            """
 
-                # Categoría crítica (mayor MTTR) con datos reales
-                cursor.execute("""
-                    SELECT 
-                        COALESCE(c.nombre, 'Sin categoría') AS nombre, 
-                        CASE 
-                            WHEN COUNT(CASE WHEN i.tiempo_reparacion IS NOT NULL THEN 1 END) > 0 THEN
-                                ROUND(AVG(EXTRACT(EPOCH FROM i.tiempo_reparacion) / 3600), 2)
-                            WHEN COUNT(CASE WHEN i.fecha_resolucion IS NOT NULL AND i.fecha_reporte IS NOT NULL THEN 1 END) > 0 THEN
-                                ROUND(AVG(EXTRACT(EPOCH FROM (i.fecha_resolucion - i.fecha_reporte)) / 3600), 2)
-                            ELSE 0
-                        END AS mttr
-                    FROM INCIDENTE i
-                    LEFT JOIN CATEGORIA c ON i.id_categoria = c.id_categoria
-                    WHERE i.estado IN ('T', 'C')
-                    GROUP BY c.nombre
-                    HAVING COUNT(i.id_incidente) > 0
-                    ORDER BY mttr DESC
-                    LIMIT 1;
-                """)
-                categoria_critica = cursor.fetchone()
-                crit_nombre = categoria_critica[0] if categoria_critica else "N/A"
-                crit_mttr = float(categoria_critica[1]) if categoria_critica and categoria_critica[1] else 0.0
+            with conexion.cursor() as cursor:
+                cursor.execute(sql, params)
+                resultados = cursor.fetchall()
 
             conexion.close()
 
-            return {
-                "mttr_global": mttr_global,
-                "total_incidentes": total_incidentes,
-                "mejor_categoria": mejor_nombre,
-                "mejor_mttr": mejor_mttr,
-                "categoria_critica": crit_nombre,
-                "crit_mttr": crit_mttr
+            if not resultados:
+                estadisticas = self._estadisticas_vacias()
+                if not filtrado:
+                    estadisticas['total_incidentes'] = ControlIncidentes._contar_incidentes()
+                return {'mttr_data': [], 'estadisticas': estadisticas, 'percentiles_nivel': []}
+
+            # Percentiles del mismo período, combinando los sketches mensuales
+            percentiles = ControlMTTR.obtener_percentiles(categoria, periodo_meses)
+            sin_datos = {'p50': None, 'p90': None, 'p99': None}
+
+            mttr_data = [dict({
+                'categoria': fila[0] or 'Sin categoría',
+                'mttr_horas': float(fila[1]) if fila[1] else 0.0,
+                'total_incidentes': int(fila[2]) if fila[2] else 0
+            }, **percentiles['por_categoria'].get(fila[0], sin_datos)) for fila in resultados]
+
+            # La primera fila es la de menor MTTR; la de posicion_peor = 1, la de mayor
+            mejor = resultados[0]
+            peor = next(fila for fila in resultados if fila[5] == 1)
+            estadisticas = {
+                "mttr_global": float(mejor[3]) if mejor[3] else 0.0,
+                "total_incidentes": int(mejor[4]) if mejor[4] else 0,
+                "mejor_categoria": mejor[0],
+                "mejor_mttr": float(mejor[1]) if mejor[1] else 0.0,
+                "categoria_critica": peor[0],
+                "crit_mttr": float(peor[1]) if peor[1] else 0.0
             }
+            return {'mttr_data': mttr_data, 'estadisticas': estadisticas, 'percentiles_nivel': percentiles['por_nivel']}
 
         except Exception as e:
-            print(f"⚠️ Error al obtener estadísticas MTTR => {e}")
-            return self._estadisticas_vacias()
+            print(f"⚠️ Error al calcular estadísticas MTTR => {e}")
+            return {'mttr_data': [], 'estadisticas': self._estadisticas_vacias(), 'percentiles_nivel': []}
 
-    def obtener_mttr_completo_por_categoria(self):
-        """Obtiene MTTR y conteo de incidentes por categoría SOLO con datos reales"""
+    @staticmethod
+    def _contar_incidentes():
         try:
             conexion = get_connection()
             if not conexion:
-                print("❌ No se pudo conectar a la base de datos.")
-                return []
-
-            sql = """
-                SELECT 
-                    COALESCE(c.nombre, 'Sin categoría') AS categoria,
-                    CASE 
-                        WHEN COUNT(CASE WHEN i.tiempo_reparacion IS NOT NULL THEN 1 END) > 0 THEN
-                            ROUND(AVG(EXTRACT(EPOCH FROM i.tiempo_reparacion) / 3600), 2)
-                        WHEN COUNT(CASE WHEN i.fecha_resolucion IS NOT NULL AND i.fecha_reporte IS NOT NULL THEN 1 END) > 0 THEN
-                            ROUND(AVG(EXTRACT(EPOCH FROM (i.fecha_resolucion - i.fecha_reporte)) / 3600), 2)
-                        ELSE 0
-                    END AS mttr_horas,
-                    COUNT(i.id_incidente) AS total_incidentes
-                FROM 
-                    INCIDENTE i
-                LEFT JOIN 
-                    CATEGORIA c ON i.id_categoria = c.id_categoria
-                WHERE 
-                    i.estado IN ('T', 'C')
-                GROUP BY 
-                    c.nombre
-                ORDER BY 
-                    mttr_horas ASC;
-            """
-
+                return 0
             with conexion.cursor() as cursor:
-                cursor.execute(sql)
-                resultados = cursor.fetchall()
-
+                cursor.execute("SELECT COUNT(*) FROM INCIDENTE;")
+                total = cursor.fetchone()[0] or 0
             conexion.close()
-
-            mttr_list = [{
-                'categoria': fila[0] or 'Sin categoría', 
-                'mttr_horas': float(fila[1]) if fila[1] else 0.0, 
-                'total_incidentes': int(fila[2]) if fila[2] else 0
-            } for fila in resultados]
-            
-            return mttr_list
-
+            return total
         except Exception as e:
-            print(f"⚠️ Error al calcular MTTR completo => {e}")
-            return []
+            print(f"⚠️ Error al contar incidentes => {e}")
+            return 0
+
+    def obtener_mttr_completo_por_categoria(self):
+        """Obtiene MTTR y conteo de incidentes por categoría SOLO con datos reales"""
+        return self.obtener_mttr_por_categoria()
 
     def obtener_tendencia_mttr(self, meses=6):
         """Obtiene la tendencia de MTTR por mes SOLO con datos reales"""
@@ -1211,25 +1334,21 @@ class ControlIncidentes:
                 print("❌ No se pudo conectar a la base de datos.")
                 return []
 
-            sql = """
+            # El resumen está agregado por mes: se toman los meses completos del período
+            sql = f"""
                 SELECT 
-                    TO_CHAR(COALESCE(fecha_resolucion, fecha_reporte), 'YYYY-MM') AS mes,
-                    CASE 
-                        WHEN COUNT(CASE WHEN tiempo_reparacion IS NOT NULL THEN 1 END) > 0 THEN
-                            ROUND(AVG(EXTRACT(EPOCH FROM tiempo_reparacion) / 3600), 2)
-                        WHEN COUNT(CASE WHEN fecha_resolucion IS NOT NULL AND fecha_reporte IS NOT NULL THEN 1 END) > 0 THEN
-                            ROUND(AVG(EXTRACT(EPOCH FROM (fecha_resolucion - fecha_reporte)) / 3600), 2)
-                        ELSE 0
-                    END AS mttr_horas
+                    TO_CHAR(r.mes, 'YYYY-MM') AS mes,
+                    COALESCE({MTTR_HORAS_SQL}, 0) AS mttr_horas
                 FROM 
-                    INCIDENTE
+                    MTTR_RESUMEN r
                 WHERE 
-                    estado IN ('T', 'C')
-                    AND COALESCE(fecha_resolucion, fecha_reporte) >= CURRENT_DATE - make_interval(months => %s)
+                    r.mes >= DATE_TRUNC('month', CURRENT_DATE - make_interval(months => %s))
                 GROUP BY 
-                    TO_CHAR(COALESCE(fecha_resolucion, fecha_reporte), 'YYYY-MM')
+                    r.mes
+                HAVING 
+                    SUM(r.cantidad) > 0
                 ORDER BY 
-                    mes;
+                    r.mes;
             """
 
             with conexion.cursor() as cursor:
@@ -1292,81 +1411,7 @@ class ControlIncidentes:
 
     def obtener_mttr_filtrado(self, categoria=None, periodo_meses=6):
         """Obtiene MTTR filtrado por categoría y período SOLO con datos reales"""
-        try:
-            conexion = get_connection()
-            if not conexion:
-                print("❌ No se pudo conectar a la base de datos.")
-                return []
-
-            # Construir query dinámicamente
-            # Solo considerar incidentes Terminados ('T') o Cancelados ('C')
-            # Y que tengan fecha_resolucion o tiempo_reparacion para calcular MTTR
-            where_conditions = [
-                "i.estado IN ('T', 'C')",
-                "(i.tiempo_reparacion IS NOT NULL OR (i.fecha_resolucion IS NOT NULL AND i.fecha_reporte IS NOT NULL))"
-            ]
-            params = []
-
-            if categoria and categoria.strip() and categoria.lower() != 'todas':
-                where_conditions.append("c.nombre = %s")
-                params.append(categoria)
-
-            if periodo_meses:
-                # Construir el intervalo correctamente para PostgreSQL
-                where_conditions.append("COALESCE(i.fecha_resolucion, i.fecha_reporte) >= CURRENT_DATE - make_interval(months => %s)")
-                params.append(periodo_meses)
-
-            where_clause = " AND ".join(where_conditions)
-            
-            print(f"🔍 Consulta MTTR filtrado - Categoría: {categoria}, Período: {periodo_meses} meses")
-            print(f"📋 WHERE clause: {where_clause}")
-            print(f"📋 Parámetros: {params}")
-
-            sql = f"""
-                SELECT 
-                    COALESCE(c.nombre, 'Sin categoría') AS categoria,
-                    CASE 
-                        WHEN COUNT(CASE WHEN i.tiempo_reparacion IS NOT NULL THEN 1 END) > 0 THEN
-                            ROUND(AVG(EXTRACT(EPOCH FROM i.tiempo_reparacion) / 3600), 2)
-                        WHEN COUNT(CASE WHEN i.fecha_resolucion IS NOT NULL AND i.fecha_reporte IS NOT NULL THEN 1 END) > 0 THEN
-                            ROUND(AVG(EXTRACT(EPOCH FROM (i.fecha_resolucion - i.fecha_reporte)) / 3600), 2)
-                        ELSE 0
-                    END AS mttr_horas,
-                    COUNT(i.id_incidente) AS total_incidentes
-                FROM 
-                    INCIDENTE i
-                LEFT JOIN 
-                    CATEGORIA c ON i.id_categoria = c.id_categoria
-                WHERE 
-                    {where_clause}
-                GROUP BY 
-                    c.nombre
-                ORDER BY 
-                    mttr_horas ASC;
-            """
-
-            with conexion.cursor() as cursor:
-                cursor.execute(sql, params)
-                resultados = cursor.fetchall()
-                
-                print(f"✅ Consulta ejecutada. Resultados encontrados: {len(resultados)}")
-                if len(resultados) > 0:
-                    print(f"📊 Primer resultado: {resultados[0]}")
-
-            conexion.close()
-
-            mttr_list = [{
-                'categoria': fila[0] or 'Sin categoría', 
-                'mttr_horas': float(fila[1]) if fila[1] else 0.0, 
-                'total_incidentes': int(fila[2]) if fila[2] else 0
-            } for fila in resultados]
-            
-            print(f"📦 Lista MTTR generada: {len(mttr_list)} elementos")
-            return mttr_list
-
-        except Exception as e:
-            print(f"⚠️ Error al obtener MTTR filtrado => {e}")
-            return []
+        return self.calcular_mttr(categoria, periodo_meses)['mttr_data']
 
     def _estadisticas_vacias(self):
         """Retorna estadísticas vacías cuando no hay conexión"""
@@ -0,0 +1,213 @@
+from ConexionBD import get_connection
+from services.sketch_service import SketchService
+
+# Horas de reparación de un incidente cerrado: columna generada (migración 006)
+# con tiempo_reparacion o, si falta, la diferencia entre resolución y reporte
+HORAS_REPARACION_SQL = "horas_reparacion::float8"
+
+MES_RESOLUCION_SQL = "DATE_TRUNC('month', COALESCE(fecha_resolucion, fecha_reporte))::date"
+
+NIVELES = {'B': 'Bajo', 'M': 'Medio', 'A': 'Alto', 'C': 'Crítico'}
+
+
+class ControlMTTR:
+    """
+    Mantenimiento del resumen MTTR_RESUMEN (ver migración 004) y de los
+    sketches de percentiles MTTR_SKETCH (ver migración 005).
+    Cada cambio de estado de un incidente llama a sincronizar_incidente dentro
+    de la misma transacción, así el resumen siempre coincide con INCIDENTE.
+    """
+
+    @staticmethod
+    def condiciones_filtro(categoria=None, periodo_meses=None, alias='r'):
+        """
+        Condiciones WHERE sobre las tablas resumen (alias con columna mes y
+        CATEGORIA unida como c).
+
+        Returns:
+            tuple: (lista de condiciones, params)
+        """
+        condiciones = ["TRUE"]
+        params = []
+
+        if categoria and categoria.strip() and categoria.lower() != 'todas':
+            condiciones.append("c.nombre = %s")
+            params.append(categoria)
+
+        if periodo_meses:
+            # El resumen está agregado por mes: se toman los meses completos del período
+            condiciones.append(f"{alias}.mes >= DATE_TRUNC('month', CURRENT_DATE - make_interval(months => %s))")
+            params.append(periodo_meses)
+
+        return condiciones, params
+
+    @staticmethod
+    def obtener_percentiles(categoria=None, periodo_meses=None):
+        """
+        Percentiles p50/p90/p99 de horas de reparación por categoría y por nivel,
+        combinando los sketches mensuales del período.
+
+        Returns:
+            dict: {'por_categoria': {nombre: {...}}, 'por_nivel': [{'nivel', 'nombre', 'cantidad', 'p50', ...}]}
+        """
+        try:
+            conexion = get_connection()
+            if not conexion:
+                print("No se pudo conectar a la base de datos.")
+                return {'por_categoria': {}, 'por_nivel': []}
+
+            condiciones, params = ControlMTTR.condiciones_filtro(categoria, periodo_meses, alias='s')
+            with conexion.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT COALESCE(c.nombre, 'Sin categoría'), s.nivel, s.indice, SUM(s.cantidad)
+                    FROM MTTR_SKETCH s
+                    LEFT JOIN CATEGORIA c ON s.id_categoria = c.id_categoria
+                    WHERE {" AND ".join(condiciones)}
+                    GROUP BY c.nombre, s.nivel, s.indice
+                    HAVING SUM(s.cantidad) > 0
+                """, params)
+                filas = cursor.fetchall()
+            conexion.close()
+
+            # Combinar cubetas: sumar contadores del mismo índice
+            por_categoria = {}
+            por_nivel = {}
+            for nombre, nivel, indice, cantidad in filas:
+                cubetas = por_categoria.setdefault(nombre, {})
+                cubetas[indice] = cubetas.get(indice, 0) + cantidad
+                cubetas = por_nivel.setdefault(nivel, {})
+                cubetas[indice] = cubetas.get(indice, 0) + cantidad
+
+            return {
+                'por_categoria': {
+                    nombre: SketchService.cuantiles(cubetas)
+                    for nombre, cubetas in por_categoria.items()
+                },
+                'por_nivel': [
+                    dict(SketchService.cuantiles(por_nivel[nivel]), nivel=nivel, nombre=nombre,
+                         cantidad=sum(por_nivel[nivel].values()))
+                    for nivel, nombre in NIVELES.items() if nivel in por_nivel
+                ]
+            }
+
+        except Exception as e:
+            print(f"Error en obtener_percentiles => {e}")
+            return {'por_categoria': {}, 'por_nivel': []}
+
+    @staticmethod
+    def sincronizar_incidente(cursor, id_incidente):
+        """
+        Actualiza el aporte de un incidente al resumen según su estado actual:
+        resta el aporte anterior (si lo había) y suma el nuevo si está cerrado (T/C).
+        Usa el cursor de quien llama para quedar en su transacción.
+        """
+        # Retirar el aporte anterior
+        cursor.execute("""
+            DELETE FROM MTTR_RESUMEN_INCIDENTE
+            WHERE id_incidente = %s
+            RETURNING id_categoria, mes, nivel, horas
+        """, (id_incidente,))
+        anterior = cursor.fetchone()
+        if anterior:
+            id_categoria, mes, nivel, horas = anterior
+            cursor.execute("""
+                UPDATE MTTR_RESUMEN
+                SET cantidad = cantidad - 1,
+                    cantidad_medida = cantidad_medida - CASE WHEN %s::float8 IS NULL THEN 0 ELSE 1 END,
+                    suma_horas = suma_horas - COALESCE(%s::float8, 0),
+                    suma_cuadrados = suma_cuadrados - COALESCE(%s::float8 * %s::float8, 0)
+                WHERE id_categoria = %s AND mes = %s AND nivel = %s
+            """, (horas, horas, horas, horas, id_categoria, mes, nivel))
+            if horas is not None:
+                cursor.execute(f"""
+                    UPDATE MTTR_SKETCH
+                    SET cantidad = cantidad - 1
+                    WHERE id_categoria = %s AND mes = %s AND nivel = %s
+                      AND indice = {SketchService.indice_sql('%s::float8')}
+                """, (id_categoria, mes, nivel, horas))
+
+        # Sumar el aporte actual si el incidente está cerrado
+        cursor.execute(f"""
+            INSERT INTO MTTR_RESUMEN_INCIDENTE (id_incidente, id_categoria, mes, nivel, horas)
+            SELECT id_incidente, id_categoria, {MES_RESOLUCION_SQL}, nivel, {HORAS_REPARACION_SQL}
+            FROM INCIDENTE
+            WHERE id_incidente = %s AND estado IN ('T', 'C')
+            RETURNING id_categoria, mes, nivel, horas
+        """, (id_incidente,))
+        actual = cursor.fetchone()
+        if actual:
+            id_categoria, mes, nivel, horas = actual
+            cursor.execute("""
+                INSERT INTO MTTR_RESUMEN AS r
+                    (id_categoria, mes, nivel, cantidad, cantidad_medida, suma_horas, suma_cuadrados)
+                VALUES (%s, %s, %s, 1,
+                        CASE WHEN %s::float8 IS NULL THEN 0 ELSE 1 END,
+                        COALESCE(%s::float8, 0),
+                        COALESCE(%s::float8 * %s::float8, 0))
+                ON CONFLICT (id_categoria, mes, nivel) DO UPDATE
+                SET cantidad = r.cantidad + EXCLUDED.cantidad,
+                    cantidad_medida = r.cantidad_medida + EXCLUDED.cantidad_medida,
+                    suma_horas = r.suma_horas + EXCLUDED.suma_horas,
+                    suma_cuadrados = r.suma_cuadrados + EXCLUDED.suma_cuadrados
+            """, (id_categoria, mes, nivel, horas, horas, horas, horas))
+            if horas is not None:
+                cursor.execute(f"""
+                    INSERT INTO MTTR_SKETCH AS s (id_categoria, mes, nivel, indice, cantidad)
+                    VALUES (%s, %s, %s, {SketchService.indice_sql('%s::float8')}, 1)
+                    ON CONFLICT (id_categoria, mes, nivel, indice) DO UPDATE
+                    SET cantidad = s.cantidad + 1
+                """, (id_categoria, mes, nivel, horas))
+
+    @staticmethod
+    def reconstruir_resumen():
+        """
+        Recalcula el resumen completo desde INCIDENTE (carga inicial o reparación).
+        Se hace en una sola transacción: los lectores ven el resumen anterior
+        hasta que termina.
+        """
+        try:
+            conexion = get_connection()
+            if not conexion:
+                print("No se pudo conectar a la base de datos.")
+                return False
+
+            with conexion.cursor() as cursor:
+                cursor.execute("LOCK TABLE MTTR_RESUMEN, MTTR_RESUMEN_INCIDENTE, MTTR_SKETCH IN EXCLUSIVE MODE")
+                cursor.execute("DELETE FROM MTTR_RESUMEN_INCIDENTE")
+                cursor.execute("DELETE FROM MTTR_RESUMEN")
+                cursor.execute("DELETE FROM MTTR_SKETCH")
+                cursor.execute(f"""
+                    INSERT INTO MTTR_RESUMEN_INCIDENTE (id_incidente, id_categoria, mes, nivel, horas)
+                    SELECT id_incidente, id_categoria, {MES_RESOLUCION_SQL}, nivel, {HORAS_REPARACION_SQL}
+                    FROM INCIDENTE
+                    WHERE estado IN ('T', 'C')
+                """)
+                incidentes = cursor.rowcount
+                cursor.execute("""
+                    INSERT INTO MTTR_RESUMEN
+                        (id_categoria, mes, nivel, cantidad, cantidad_medida, suma_horas, suma_cuadrados)
+                    SELECT id_categoria, mes, nivel,
+                           COUNT(*), COUNT(horas),
+                           COALESCE(SUM(horas), 0), COALESCE(SUM(horas * horas), 0)
+                    FROM MTTR_RESUMEN_INCIDENTE
+                    GROUP BY id_categoria, mes, nivel
+                """)
+                filas = cursor.rowcount
+                cursor.execute(f"""
+                    INSERT INTO MTTR_SKETCH (id_categoria, mes, nivel, indice, cantidad)
+                    SELECT id_categoria, mes, nivel, {SketchService.indice_sql('horas')}, COUNT(*)
+                    FROM MTTR_RESUMEN_INCIDENTE
+                    WHERE horas IS NOT NULL
+                    GROUP BY 1, 2, 3, 4
+                """)
+                conexion.commit()
+
+            conexion.close()
+            print(f"✅ Resumen MTTR reconstruido: {incidentes} incidentes en {filas} filas")
+            return True
+
+        except Exception as e:
+            print(f"Error en reconstruir_resumen => {e}")
+            import traceback
+            traceback.print_exc()
+            return False
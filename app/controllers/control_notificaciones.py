@@ -1,4 +1,5 @@
-from ConexionBD import get_connection
+from ConexionBD import al_confirmar, get_connection
+from services.perfil_service import PerfilService
 
 class ControlNotificaciones:
     
@@ -21,6 +22,8 @@ class ControlNotificaciones:
                 conexion.commit()
             
             conexion.close()
+            # Dentro de transaccion() espera al COMMIT para no cachear el conteo anterior
+            al_confirmar(lambda: PerfilService.invalidar(id_usuario))
             return True
         except Exception as e:
             print(f"Error al crear notificación => {e}")
@@ -104,6 +107,7 @@ class ControlNotificaciones:
                 conexion.commit()
             
             conexion.close()
+            al_confirmar(lambda: PerfilService.invalidar(id_usuario))
             return True
         except Exception as e:
             print(f"Error al marcar notificación como leída => {e}")
@@ -128,6 +132,7 @@ class ControlNotificaciones:
                 conexion.commit()
             
             conexion.close()
+            al_confirmar(lambda: PerfilService.invalidar(id_usuario))
             return True
         except Exception as e:
             print(f"Error al marcar todas como leídas => {e}")
@@ -3,40 +3,150 @@ Controlador de Predicciones con IA
 Utiliza Machine Learning para predecir patrones y tendencias de incidentes
 """
 from ConexionBD import get_connection
+from controllers.control_anomalias import ControlAnomalias
+from services.pronostico_service import PronosticoService
+from datetime import date, timedelta
 import numpy as np
-from datetime import datetime, timedelta
-from collections import Counter
+import pandas as pd
+
+# Nombres de los días según EXTRACT(DOW) de PostgreSQL (0=Domingo, 6=Sábado)
+DIAS_SEMANA = ['Domingo', 'Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado']
+
+
+class HistorialIncidentes:
+    """
+    Historial de incidentes en columnas (pandas), cargado con una sola consulta
+    y compartido por todas las predicciones de una misma petición.
+
+    - incidentes: id_incidente, categoria, nivel, estado, fecha_reporte, horas_reparacion
+    - asignaciones: (id_incidente, id_usuario) técnico asignado o miembro del equipo
+    - tecnicos: técnicos activos (id_usuario, nombre)
+    - meses: meses cargados (los incidentes empiezan en inicio())
+    """
+
+    def __init__(self, incidentes, asignaciones, tecnicos, meses):
+        self.incidentes = incidentes
+        self.asignaciones = asignaciones
+        self.tecnicos = tecnicos
+        self.meses = meses
+
+    @staticmethod
+    def limite(meses):
+        """Inicio de los últimos `meses` meses (como CURRENT_DATE - INTERVAL)"""
+        return pd.Timestamp.today().normalize() - pd.DateOffset(months=meses)
+
+    def inicio(self):
+        """Primer día que cubre el historial cargado"""
+        return HistorialIncidentes.limite(self.meses)
+
+    def desde(self, meses):
+        """Incidentes reportados en los últimos `meses` meses"""
+        return self.incidentes[self.incidentes['fecha_reporte'] >= HistorialIncidentes.limite(meses)]
+
 
 class ControlPredicciones:
     
+    # Meses que carga el historial compartido (el máximo que usan las predicciones por defecto)
+    MESES_HISTORIAL = 3
+
+    # Semanas completas con las que se estima la carga por día de la semana (caben en MESES_HISTORIAL)
+    SEMANAS_CARGA = 8
+
     @staticmethod
-    def obtener_datos_historicos(meses=6):
-        """Obtiene datos históricos de incidentes para análisis"""
+    def cargar_historial(meses=MESES_HISTORIAL):
+        """
+        Carga el historial de incidentes, sus técnicos (vista ASIGNACION_TECNICO)
+        y los técnicos activos en una sola consulta (tres tipos de fila unidas
+        con UNION ALL).
+
+        Returns:
+            HistorialIncidentes o None si no se pudo consultar
+        """
         try:
             conexion = get_connection()
             if not conexion:
                 return None
             
             sql = """
-                SELECT 
-                    i.id_incidente,
-                    i.id_categoria,
-                    c.nombre as categoria,
-                    i.nivel,
-                    i.estado,
-                    i.fecha_reporte,
-                    i.fecha_resolucion,
-                    EXTRACT(EPOCH FROM i.tiempo_reparacion) / 3600 as horas_resolucion,
-                    EXTRACT(DOW FROM i.fecha_reporte) as dia_semana,
-                    EXTRACT(HOUR FROM i.fecha_reporte) as hora_dia,
-                    u.id_rol,
-                    r.id_area
+                WITH recientes AS (
+                    SELECT i.id_incidente, i.id_categoria, i.nivel, i.estado,
+                           i.fecha_reporte, i.horas_reparacion
+                    FROM INCIDENTE i
+                    WHERE i.fecha_reporte >= CURRENT_DATE - make_interval(months => %s)
+                )
+                SELECT 'I' AS tipo, r.id_incidente, c.nombre, r.nivel, r.estado,
+                       r.fecha_reporte, r.horas_reparacion, NULL::integer
+                FROM recientes r
+                LEFT JOIN CATEGORIA c ON r.id_categoria = c.id_categoria
+                UNION ALL
+                SELECT 'A', a.id_incidente, NULL, NULL, NULL, NULL, NULL, a.id_usuario
+                FROM ASIGNACION_TECNICO a
+                JOIN recientes r ON r.id_incidente = a.id_incidente
+                UNION ALL
+                SELECT 'T', NULL, u.nombre || ' ' || u.ape_pat, NULL, NULL, NULL, NULL, u.id_usuario
+                FROM USUARIO u
+                JOIN ROL ro ON u.id_rol = ro.id_rol
+                WHERE ro.tipo = 'T' AND u.estado = TRUE;
+            """
+            
+            meses = max(int(meses), ControlPredicciones.MESES_HISTORIAL)
+            with conexion.cursor() as cursor:
+                cursor.execute(sql, (meses,))
+                filas = cursor.fetchall()
+            
+            conexion.close()
+            
+            columnas = ['tipo', 'id_incidente', 'nombre', 'nivel', 'estado',
+                        'fecha_reporte', 'horas_reparacion', 'id_usuario']
+            frame = pd.DataFrame(filas, columns=columnas)
+
+            incidentes = frame[frame['tipo'] == 'I'].rename(columns={'nombre': 'categoria'})
+            incidentes = incidentes.assign(
+                categoria=incidentes['categoria'].fillna('Sin categoría'),
+                fecha_reporte=pd.to_datetime(incidentes['fecha_reporte']),
+                horas_reparacion=pd.to_numeric(incidentes['horas_reparacion'], errors='coerce').astype(float)
+            )
+
+            # Técnico asignado + miembros del equipo (vista ASIGNACION_TECNICO), sin repetir
+            asignaciones = frame.loc[frame['tipo'] == 'A', ['id_incidente', 'id_usuario']] \
+                .astype('int64').drop_duplicates()
+
+            tecnicos = frame.loc[frame['tipo'] == 'T', ['id_usuario', 'nombre']].astype({'id_usuario': 'int64'})
+
+            return HistorialIncidentes(
+                incidentes.drop(columns=['tipo', 'id_usuario']).reset_index(drop=True),
+                asignaciones.reset_index(drop=True),
+                tecnicos.reset_index(drop=True),
+                meses
+            )
+            
+        except Exception as e:
+            print(f"Error al cargar historial de incidentes => {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+    
+    @staticmethod
+    def obtener_series_diarias(meses=24):
+        """
+        Incidentes por día y categoría (días completos, hasta ayer), con ceros en
+        los días sin incidentes. Es la entrada del entrenamiento de pronósticos.
+
+        Returns:
+            dict: {categoria: (lista de date, lista de conteos)} o None si hubo un error
+        """
+        try:
+            conexion = get_connection()
+            if not conexion:
+                return None
+            
+            sql = """
+                SELECT COALESCE(c.nombre, 'Sin categoría'), DATE(i.fecha_reporte), COUNT(*)
                 FROM INCIDENTE i
                 LEFT JOIN CATEGORIA c ON i.id_categoria = c.id_categoria
-                LEFT JOIN USUARIO u ON i.id_usuario = u.id_usuario
-                LEFT JOIN ROL r ON u.id_rol = r.id_rol
-                WHERE i.fecha_reporte >= CURRENT_DATE - INTERVAL '%s months'
-                ORDER BY i.fecha_reporte DESC;
+                WHERE i.fecha_reporte >= CURRENT_DATE - make_interval(months => %s)
+                  AND i.fecha_reporte < CURRENT_DATE
+                GROUP BY 1, 2;
             """
             
             with conexion.cursor() as cursor:
@@ -45,100 +155,88 @@ class ControlPredicciones:
             
             conexion.close()
             
-            datos = []
-            for r in resultados:
-                datos.append({
-                    'id_incidente': r[0],
-                    'id_categoria': r[1],
-                    'categoria': r[2] or 'Sin categoría',
-                    'nivel': r[3],
-                    'estado': r[4],
-                    'fecha_reporte': r[5],
-                    'fecha_resolucion': r[6],
-                    'horas_resolucion': float(r[7]) if r[7] else None,
-                    'dia_semana': int(r[8]) if r[8] is not None else None,
-                    'hora_dia': int(r[9]) if r[9] is not None else None,
-                    'id_rol': r[10],
-                    'id_area': r[11]
-                })
+            if not resultados:
+                return {}
             
-            return datos
+            # Mismo calendario para todas las categorías: del primer día con datos hasta ayer
+            inicio = min(r[1] for r in resultados)
+            fechas = [inicio + timedelta(days=d) for d in range((date.today() - inicio).days)]
+            posicion = {fecha: i for i, fecha in enumerate(fechas)}
+            series = {}
+            for categoria, fecha, cantidad in resultados:
+                conteos = series.setdefault(categoria, [0] * len(fechas))
+                conteos[posicion[fecha]] = int(cantidad)
+            return {categoria: (fechas, conteos) for categoria, conteos in series.items()}
             
         except Exception as e:
-            print(f"Error al obtener datos históricos => {e}")
+            print(f"Error al obtener series diarias => {e}")
             import traceback
             traceback.print_exc()
             return None
     
     @staticmethod
-    def predecir_incidentes_por_categoria(meses_historico=3, meses_prediccion=1):
+    def predecir_incidentes_por_categoria(meses_historico=3, meses_prediccion=1, historial=None):
         """
-        Predice la cantidad de incidentes por categoría para el próximo período
-        Usa promedio móvil ponderado con tendencia
+        Predice la cantidad de incidentes por categoría para el próximo mes
+        Usa el modelo Holt-Winters entrenado de la categoría (ver pronostico.py) y,
+        si no lo hay, promedio móvil ponderado con tendencia
         """
         try:
-            datos = ControlPredicciones.obtener_datos_historicos(meses_historico)
-            if not datos:
+            historial = historial or ControlPredicciones.cargar_historial(meses_historico)
+            if historial is None:
+                return []
+            datos = historial.desde(meses_historico)
+            if datos.empty:
                 return []
             
-            # Agrupar por categoría y mes
-            incidentes_por_mes = {}
-            
-            for incidente in datos:
-                fecha = incidente['fecha_reporte']
-                categoria = incidente['categoria']
-                mes_key = f"{fecha.year}-{fecha.month:02d}"
-                
-                if categoria not in incidentes_por_mes:
-                    incidentes_por_mes[categoria] = {}
-                
-                if mes_key not in incidentes_por_mes[categoria]:
-                    incidentes_por_mes[categoria][mes_key] = 0
-                
-                incidentes_por_mes[categoria][mes_key] += 1
-            
-            # Calcular predicciones
-            predicciones = []
-            
-            for categoria, meses_data in incidentes_por_mes.items():
-                valores = list(meses_data.values())
-                
-                # Inicializar variables
-                tendencia = 0
-                
-                if len(valores) < 2:
-                    # No hay suficientes datos para predecir
-                    prediccion = valores[0] if valores else 0
-                    tendencia = 0
-                else:
-                    # Promedio móvil ponderado (más peso a datos recientes)
-                    pesos = [i+1 for i in range(len(valores))]
-                    promedio_ponderado = sum(v * w for v, w in zip(valores, pesos)) / sum(pesos)
-                    
-                    # Calcular tendencia
-                    tendencia = (valores[-1] - valores[0]) / len(valores)
-                    
-                    # Predicción = promedio ponderado + tendencia
-                    prediccion = promedio_ponderado + tendencia
-                
-                # Calcular nivel de confianza basado en variabilidad
-                if len(valores) >= 2:
-                    desviacion = np.std(valores)
-                    promedio = np.mean(valores)
-                    coef_variacion = (desviacion / promedio * 100) if promedio > 0 else 100
-                    confianza = max(0, min(100, 100 - coef_variacion))
-                else:
-                    confianza = 50
-                
-                predicciones.append({
-                    'categoria': categoria,
-                    'prediccion': round(prediccion, 1),
-                    'historico_promedio': round(np.mean(valores), 1) if valores else 0,
-                    'mes_anterior': valores[-1] if valores else 0,
-                    'tendencia': 'Alza' if tendencia > 0.5 else 'Baja' if tendencia < -0.5 else 'Estable',
-                    'confianza': round(confianza, 1),
-                    'datos_historicos': len(valores)
-                })
+            # Matriz categoría x mes (en orden cronológico); NaN = mes sin incidentes
+            conteos = datos.groupby(['categoria', datos['fecha_reporte'].dt.to_period('M')]).size()
+            matriz = conteos.unstack().sort_index(axis=1)
+            categorias = matriz.index.to_numpy()
+            valores = matriz.to_numpy(dtype=float)
+            presentes = ~np.isnan(valores)
+            cantidad_meses = presentes.sum(axis=1)
+            filas = np.arange(len(valores))
+
+            primero = valores[filas, presentes.argmax(axis=1)]
+            ultimo = valores[filas, valores.shape[1] - 1 - presentes[:, ::-1].argmax(axis=1)]
+
+            # Promedio móvil ponderado (más peso a los meses recientes)
+            pesos = np.where(presentes, np.cumsum(presentes, axis=1), 0)
+            promedio_ponderado = np.nansum(valores * pesos, axis=1) / pesos.sum(axis=1)
+            hay_serie = cantidad_meses >= 2
+            tendencia = np.where(hay_serie, (ultimo - primero) / cantidad_meses, 0.0)
+            prediccion = np.where(hay_serie, promedio_ponderado + tendencia, primero)
+
+            # Nivel de confianza basado en la variabilidad
+            promedio = np.nanmean(valores, axis=1)
+            desviacion = np.nanstd(valores, axis=1)
+            coef_variacion = np.where(promedio > 0, desviacion / np.where(promedio > 0, promedio, 1) * 100, 100)
+            confianza = np.where(hay_serie, np.clip(100 - coef_variacion, 0, 100), 50)
+
+            predicciones = [{
+                'categoria': categorias[i],
+                'prediccion': round(float(prediccion[i]), 1),
+                'historico_promedio': round(float(promedio[i]), 1),
+                'mes_anterior': int(ultimo[i]),
+                'tendencia': 'Alza' if tendencia[i] > 0.5 else 'Baja' if tendencia[i] < -0.5 else 'Estable',
+                'confianza': round(float(confianza[i]), 1),
+                'datos_historicos': int(cantidad_meses[i]),
+                'modelo': 'Promedio ponderado'
+            } for i in range(len(categorias))]
+            
+            # Con modelo entrenado: pronóstico estacional del próximo mes calendario
+            hoy = date.today()
+            anio_siguiente, mes_siguiente = (hoy.year + 1, 1) if hoy.month == 12 else (hoy.year, hoy.month + 1)
+            for item in predicciones:
+                modelo = PronosticoService.modelo(item['categoria'])
+                total = PronosticoService.pronosticar_mes(modelo, anio_siguiente, mes_siguiente) if modelo else None
+                if total is None:
+                    continue
+                item['prediccion'] = round(total, 1)
+                item['modelo'] = 'Holt-Winters'
+                if modelo.get('error_backtest_pct') is not None:
+                    item['confianza'] = round(max(0.0, min(100.0, 100 - modelo['error_backtest_pct'])), 1)
             
             # Ordenar por predicción descendente
             predicciones.sort(key=lambda x: x['prediccion'], reverse=True)
@@ -162,7 +260,8 @@ class ControlPredicciones:
                 return None
             
             # Consulta con filtros opcionales
-            where_conditions = ["i.estado IN ('T', 'C')", "i.tiempo_reparacion IS NOT NULL"]
+            # Coincide con el índice parcial idx_incidente_horas_cerrados
+            where_conditions = ["i.estado IN ('T', 'C')", "i.horas_reparacion IS NOT NULL"]
             params = []
             
             if id_categoria:
@@ -177,10 +276,10 @@ class ControlPredicciones:
             
             sql = f"""
                 SELECT 
-                    ROUND(AVG(EXTRACT(EPOCH FROM tiempo_reparacion) / 3600), 2) as promedio_horas,
-                    ROUND(MIN(EXTRACT(EPOCH FROM tiempo_reparacion) / 3600), 2) as min_horas,
-                    ROUND(MAX(EXTRACT(EPOCH FROM tiempo_reparacion) / 3600), 2) as max_horas,
-                    ROUND(STDDEV(EXTRACT(EPOCH FROM tiempo_reparacion) / 3600), 2) as desviacion,
+                    ROUND(AVG(horas_reparacion), 2) as promedio_horas,
+                    ROUND(MIN(horas_reparacion), 2) as min_horas,
+                    ROUND(MAX(horas_reparacion), 2) as max_horas,
+                    ROUND(STDDEV(horas_reparacion), 2) as desviacion,
                     COUNT(*) as total_casos
                 FROM INCIDENTE i
                 WHERE {where_clause}
@@ -230,66 +329,54 @@ class ControlPredicciones:
             return None
     
     @staticmethod
-    def analizar_patrones_temporales(meses=3):
+    def analizar_patrones_temporales(meses=3, historial=None):
         """
         Analiza patrones temporales de incidentes (día de semana, hora del día)
         """
         try:
-            datos = ControlPredicciones.obtener_datos_historicos(meses)
-            if not datos:
+            historial = historial or ControlPredicciones.cargar_historial(meses)
+            if historial is None:
                 return None
+            datos = historial.desde(meses)
+            if datos.empty:
+                return None
+            total = len(datos)
             
-            # Análisis por día de semana (0=Domingo, 6=Sábado en PostgreSQL)
-            dias_semana = {
-                0: 'Domingo', 1: 'Lunes', 2: 'Martes', 
-                3: 'Miércoles', 4: 'Jueves', 5: 'Viernes', 6: 'Sábado'
-            }
-            
-            contador_dias = Counter()
-            contador_horas = Counter()
-            
-            for incidente in datos:
-                if incidente['dia_semana'] is not None:
-                    contador_dias[incidente['dia_semana']] += 1
-                if incidente['hora_dia'] is not None:
-                    contador_horas[incidente['hora_dia']] += 1
+            # Día de la semana como EXTRACT(DOW): pandas usa 0=Lunes
+            fechas = datos['fecha_reporte'].dt
+            por_dia = np.bincount((fechas.dayofweek.to_numpy() + 1) % 7, minlength=7)
+            por_hora = np.bincount(fechas.hour.to_numpy(), minlength=24)
+
+            def mas_frecuentes(conteos, limite):
+                orden = np.argsort(-conteos, kind='stable')[:limite]
+                return [(int(i), int(conteos[i])) for i in orden if conteos[i] > 0]
             
             # Top 3 días con más incidentes
-            dias_criticos = []
-            for dia, cantidad in contador_dias.most_common(3):
-                dias_criticos.append({
-                    'dia': dias_semana.get(dia, 'Desconocido'),
-                    'cantidad': cantidad,
-                    'porcentaje': round((cantidad / len(datos)) * 100, 1)
-                })
+            dias_criticos = [{
+                'dia': DIAS_SEMANA[dia],
+                'cantidad': cantidad,
+                'porcentaje': round((cantidad / total) * 100, 1)
+            } for dia, cantidad in mas_frecuentes(por_dia, 3)]
             
             # Top 3 horas con más incidentes
-            horas_criticas = []
-            for hora, cantidad in contador_horas.most_common(3):
-                horas_criticas.append({
-                    'hora': f"{hora:02d}:00 - {hora:02d}:59",
-                    'cantidad': cantidad,
-                    'porcentaje': round((cantidad / len(datos)) * 100, 1)
-                })
+            horas_criticas = [{
+                'hora': f"{hora:02d}:00 - {hora:02d}:59",
+                'cantidad': cantidad,
+                'porcentaje': round((cantidad / total) * 100, 1)
+            } for hora, cantidad in mas_frecuentes(por_hora, 3)]
             
             # Análisis por categoría
-            contador_categorias = Counter()
-            for incidente in datos:
-                contador_categorias[incidente['categoria']] += 1
-            
-            categorias_riesgo = []
-            for categoria, cantidad in contador_categorias.most_common(5):
-                categorias_riesgo.append({
-                    'categoria': categoria,
-                    'cantidad': cantidad,
-                    'porcentaje': round((cantidad / len(datos)) * 100, 1)
-                })
+            categorias_riesgo = [{
+                'categoria': categoria,
+                'cantidad': int(cantidad),
+                'porcentaje': round((cantidad / total) * 100, 1)
+            } for categoria, cantidad in datos['categoria'].value_counts().head(5).items()]
             
             return {
                 'dias_criticos': dias_criticos,
                 'horas_criticas': horas_criticas,
                 'categorias_riesgo': categorias_riesgo,
-                'total_incidentes': len(datos),
+                'total_incidentes': total,
                 'periodo_analisis': f'Últimos {meses} meses'
             }
             
@@ -300,151 +387,153 @@ class ControlPredicciones:
             return None
     
     @staticmethod
-    def detectar_anomalias(threshold=2.0):
+    def detectar_anomalias(threshold=2.0, historial=None):
+        """Lista de anomalías en el volumen de incidentes (ver analizar_anomalias)"""
+        return ControlPredicciones.analizar_anomalias(threshold, historial)['anomalias']
+    
+    @staticmethod
+    def analizar_anomalias(threshold=2.0, historial=None):
         """
         Detecta anomalías en el volumen de incidentes
-        Usa desviación estándar para identificar picos inusuales
+        Lee los picos que registró el detector en línea (ControlAnomalias, por
+        categoría y día); si aún no tiene estado, o si el threshold es menor que
+        el puntaje desde el que guarda eventos, usa la desviación estándar del
+        volumen diario de los últimos 3 meses
+        
+        Returns:
+            dict: {'modo', 'anomalias'}; modo 'detector' (picos por categoría:
+            cantidad y promedio de la categoría) o 'historial' (volumen diario
+            total: picos y bajas)
         """
         try:
-            conexion = get_connection()
-            if not conexion:
-                return []
-            
-            # Obtener conteo de incidentes por día en los últimos 3 meses
-            sql = """
-                SELECT 
-                    DATE(fecha_reporte) as fecha,
-                    COUNT(*) as cantidad,
-                    STRING_AGG(DISTINCT c.nombre, ', ') as categorias
-                FROM INCIDENTE i
-                LEFT JOIN CATEGORIA c ON i.id_categoria = c.id_categoria
-                WHERE fecha_reporte >= CURRENT_DATE - INTERVAL '3 months'
-                GROUP BY DATE(fecha_reporte)
-                ORDER BY fecha DESC;
-            """
-            
-            with conexion.cursor() as cursor:
-                cursor.execute(sql)
-                resultados = cursor.fetchall()
+            eventos = None
+            if threshold >= ControlAnomalias.PUNTAJE_REGISTRO:
+                eventos = ControlAnomalias.obtener_eventos(dias=30, puntaje_minimo=threshold)
+            if eventos is not None:
+                return {'modo': 'detector', 'anomalias': [{
+                    'fecha': evento['dia'].strftime('%Y-%m-%d'),
+                    'cantidad': evento['cantidad'],
+                    'promedio': round(evento['media'], 1),
+                    'desviacion': round(evento['puntaje_z'], 2),
+                    'tipo': 'Pico inusual',
+                    'categorias_afectadas': evento['categoria'],
+                    'severidad': 'Alta' if evento['puntaje_z'] >= threshold + 1 else 'Media'
+                } for evento in eventos]}
+
+            historial = historial or ControlPredicciones.cargar_historial(3)
+            if historial is None:
+                return {'modo': 'historial', 'anomalias': []}
+            datos = historial.desde(3)
             
-            conexion.close()
+            # Conteo de incidentes por día en los últimos 3 meses (más reciente primero)
+            por_dia = datos.groupby(datos['fecha_reporte'].dt.normalize()).agg(
+                cantidad=('id_incidente', 'size'),
+                categorias=('categoria', lambda nombres: ', '.join(sorted(nombres.unique())))
+            ).sort_index(ascending=False)
             
-            if not resultados or len(resultados) < 7:
-                return []
+            if len(por_dia) < 7:
+                return {'modo': 'historial', 'anomalias': []}
             
             # Calcular estadísticas
-            cantidades = [r[1] for r in resultados]
-            promedio = np.mean(cantidades)
-            desviacion = np.std(cantidades)
+            cantidades = por_dia['cantidad'].to_numpy()
+            promedio = float(cantidades.mean())
+            desviacion = float(cantidades.std())
             
             # Detectar anomalías (días con cantidad > promedio + threshold * desviación)
-            anomalias = []
             umbral_superior = promedio + (threshold * desviacion)
             umbral_inferior = max(0, promedio - (threshold * desviacion))
             
-            for resultado in resultados[:30]:  # Solo últimos 30 días
-                fecha = resultado[0]
-                cantidad = resultado[1]
-                categorias = resultado[2] or 'Sin categoría'
-                
-                if cantidad > umbral_superior:
-                    anomalias.append({
-                        'fecha': fecha.strftime('%Y-%m-%d'),
-                        'cantidad': cantidad,
-                        'promedio': round(promedio, 1),
-                        'desviacion': round((cantidad - promedio) / desviacion, 2),
-                        'tipo': 'Pico inusual',
-                        'categorias_afectadas': categorias,
-                        'severidad': 'Alta' if cantidad > promedio + (3 * desviacion) else 'Media'
-                    })
-                elif cantidad < umbral_inferior and cantidad > 0:
-                    anomalias.append({
-                        'fecha': fecha.strftime('%Y-%m-%d'),
-                        'cantidad': cantidad,
-                        'promedio': round(promedio, 1),
-                        'desviacion': round((cantidad - promedio) / desviacion, 2),
-                        'tipo': 'Baja inusual',
-                        'categorias_afectadas': categorias,
-                        'severidad': 'Baja'
-                    })
+            recientes = por_dia.head(30)  # Solo últimos 30 días
+            picos = recientes['cantidad'].to_numpy() > umbral_superior
+            bajas = (recientes['cantidad'].to_numpy() < umbral_inferior) & (recientes['cantidad'].to_numpy() > 0)
             
-            return anomalias
+            anomalias = []
+            for (fecha, fila), es_pico, es_baja in zip(recientes.iterrows(), picos, bajas):
+                if not (es_pico or es_baja):
+                    continue
+                cantidad = int(fila['cantidad'])
+                anomalias.append({
+                    'fecha': fecha.strftime('%Y-%m-%d'),
+                    'cantidad': cantidad,
+                    'promedio': round(promedio, 1),
+                    'desviacion': round((cantidad - promedio) / desviacion, 2),
+                    'tipo': 'Pico inusual' if es_pico else 'Baja inusual',
+                    'categorias_afectadas': fila['categorias'] or 'Sin categoría',
+                    'severidad': ('Alta' if cantidad > promedio + (3 * desviacion) else 'Media') if es_pico else 'Baja'
+                })
+            
+            return {'modo': 'historial', 'anomalias': anomalias}
             
         except Exception as e:
-            print(f"Error en detectar_anomalias => {e}")
+            print(f"Error en analizar_anomalias => {e}")
             import traceback
             traceback.print_exc()
-            return []
+            return {'modo': 'historial', 'anomalias': []}
     
     @staticmethod
-    def predecir_carga_tecnicos(dias_adelante=7):
+    def predecir_carga_tecnicos(dias_adelante=7, historial=None):
         """
         Predice la carga de trabajo de los técnicos basada en patrones históricos
+        Cada técnico tiene una tasa de llegada por día de la semana (incidentes
+        de las últimas SEMANAS_CARGA semanas completas); la predicción suma la
+        tasa de cada uno de los próximos días
         """
         try:
-            conexion = get_connection()
-            if not conexion:
+            historial = historial or ControlPredicciones.cargar_historial()
+            if historial is None:
                 return []
             
-            # Obtener promedio de incidentes asignados por técnico por día
-            sql = """
-                SELECT 
-                    u.id_usuario,
-                    u.nombre || ' ' || u.ape_pat as nombre_tecnico,
-                    COUNT(DISTINCT DATE(i.fecha_reporte)) as dias_trabajados,
-                    COUNT(*) as total_incidentes,
-                    ROUND(COUNT(*) * 1.0 / NULLIF(COUNT(DISTINCT DATE(i.fecha_reporte)), 0), 2) as incidentes_por_dia,
-                    ROUND(AVG(EXTRACT(EPOCH FROM i.tiempo_reparacion) / 3600), 2) as promedio_horas_resolucion
-                FROM USUARIO u
-                JOIN ROL r ON u.id_rol = r.id_rol
-                LEFT JOIN INCIDENTE i ON (i.id_tecnico_asignado = u.id_usuario OR 
-                                          EXISTS (SELECT 1 FROM EQUIPO_TECNICO et 
-                                                  WHERE et.id_incidente = i.id_incidente 
-                                                  AND et.id_usuario = u.id_usuario))
-                    AND i.fecha_reporte >= CURRENT_DATE - INTERVAL '1 month'
-                WHERE r.tipo = 'T' AND u.estado = TRUE
-                GROUP BY u.id_usuario, nombre_tecnico
-                ORDER BY incidentes_por_dia DESC;
-            """
-            
-            with conexion.cursor() as cursor:
-                cursor.execute(sql)
-                resultados = cursor.fetchall()
-            
-            conexion.close()
-            
-            predicciones_tecnicos = []
-            
-            for r in resultados:
-                incidentes_por_dia = float(r[4]) if r[4] else 0
-                prediccion_semanal = round(incidentes_por_dia * dias_adelante, 1)
-                
-                # Determinar nivel de carga
-                if prediccion_semanal >= 15:
-                    nivel_carga = 'Muy Alta'
-                    color = 'red'
-                elif prediccion_semanal >= 10:
-                    nivel_carga = 'Alta'
-                    color = 'orange'
-                elif prediccion_semanal >= 5:
-                    nivel_carga = 'Media'
-                    color = 'yellow'
-                else:
-                    nivel_carga = 'Baja'
-                    color = 'green'
-                
-                predicciones_tecnicos.append({
-                    'id_tecnico': r[0],
-                    'nombre': r[1],
-                    'incidentes_actuales': r[3],
-                    'promedio_diario': float(r[4]) if r[4] else 0,
-                    'prediccion_proximos_dias': prediccion_semanal,
-                    'nivel_carga': nivel_carga,
-                    'color': color,
-                    'promedio_horas_resolucion': float(r[5]) if r[5] else 0
-                })
-            
-            return predicciones_tecnicos
+            hoy = pd.Timestamp.today().normalize()
+            incidentes = historial.incidentes[['id_incidente', 'fecha_reporte', 'horas_reparacion']]
+            
+            # Ventana de SEMANAS_CARGA semanas, recortada a lo que cubre el historial cargado
+            inicio = max(hoy - pd.Timedelta(weeks=ControlPredicciones.SEMANAS_CARGA), historial.inicio())
+            ventana = incidentes[(incidentes['fecha_reporte'] >= inicio)
+                                 & (incidentes['fecha_reporte'] < hoy)]
+            
+            # Tasa por técnico y día de la semana (0=Lunes): conteo / veces que ese día cae en la ventana
+            dias_ventana = np.bincount(pd.date_range(inicio, hoy - pd.Timedelta(days=1)).dayofweek, minlength=7)
+            trabajo = historial.asignaciones.merge(ventana, on='id_incidente')
+            tasas = pd.crosstab(trabajo['id_usuario'], trabajo['fecha_reporte'].dt.dayofweek) \
+                .reindex(columns=range(7), fill_value=0) / np.maximum(dias_ventana, 1)
+            
+            # Veces que aparece cada día de la semana en los próximos días
+            proximos = pd.date_range(hoy + pd.Timedelta(days=1), periods=dias_adelante).dayofweek
+            veces = np.bincount(proximos, minlength=7)
+            por_tecnico = pd.DataFrame({
+                'incidentes_por_dia': tasas.mean(axis=1),
+                'prediccion': tasas.to_numpy() @ veces
+            }, index=tasas.index)
+            
+            # Incidentes del último mes de cada técnico (asignado o en el equipo)
+            ultimo_mes = historial.asignaciones.merge(historial.desde(1), on='id_incidente')
+            por_tecnico = por_tecnico.join(ultimo_mes.groupby('id_usuario').agg(
+                total_incidentes=('id_incidente', 'size'),
+                promedio_horas_resolucion=('horas_reparacion', 'mean')
+            ), how='outer')
+            
+            carga = historial.tecnicos.merge(por_tecnico, left_on='id_usuario', right_index=True, how='left')
+            carga['total_incidentes'] = carga['total_incidentes'].fillna(0).astype(int)
+            carga['incidentes_por_dia'] = carga['incidentes_por_dia'].round(2).fillna(0)
+            carga['prediccion'] = carga['prediccion'].round(1).fillna(0)
+            carga['promedio_horas_resolucion'] = carga['promedio_horas_resolucion'].round(2).fillna(0)
+            carga = carga.sort_values('prediccion', ascending=False, kind='stable')
+            
+            # Determinar nivel de carga
+            umbrales = [carga['prediccion'] >= 15, carga['prediccion'] >= 10, carga['prediccion'] >= 5]
+            carga['nivel_carga'] = np.select(umbrales, ['Muy Alta', 'Alta', 'Media'], default='Baja')
+            carga['color'] = np.select(umbrales, ['red', 'orange', 'yellow'], default='green')
+            
+            return [{
+                'id_tecnico': int(fila.id_usuario),
+                'nombre': fila.nombre,
+                'incidentes_actuales': int(fila.total_incidentes),
+                'promedio_diario': float(fila.incidentes_por_dia),
+                'prediccion_proximos_dias': float(fila.prediccion),
+                'nivel_carga': fila.nivel_carga,
+                'color': fila.color,
+                'promedio_horas_resolucion': float(fila.promedio_horas_resolucion)
+            } for fila in carga.itertuples()]
             
         except Exception as e:
             print(f"Error en predecir_carga_tecnicos => {e}")
@@ -453,15 +542,19 @@ class ControlPredicciones:
             return []
     
     @staticmethod
-    def obtener_recomendaciones():
+    def obtener_recomendaciones(historial=None):
         """
         Genera recomendaciones basadas en análisis predictivo
+        Todas las predicciones se calculan sobre el mismo historial (una consulta)
         """
         try:
             recomendaciones = []
+            historial = historial or ControlPredicciones.cargar_historial()
+            if historial is None:
+                return []
             
             # 1. Análisis de categorías con predicción alta
-            predicciones = ControlPredicciones.predecir_incidentes_por_categoria()
+            predicciones = ControlPredicciones.predecir_incidentes_por_categoria(historial=historial)
             if predicciones:
                 top_categoria = predicciones[0]
                 if top_categoria['prediccion'] > top_categoria['mes_anterior']:
@@ -474,7 +567,7 @@ class ControlPredicciones:
                     })
             
             # 2. Análisis de patrones temporales
-            patrones = ControlPredicciones.analizar_patrones_temporales()
+            patrones = ControlPredicciones.analizar_patrones_temporales(historial=historial)
             if patrones and patrones['dias_criticos']:
                 dia_critico = patrones['dias_criticos'][0]
                 recomendaciones.append({
@@ -485,7 +578,7 @@ class ControlPredicciones:
                 })
             
             # 3. Análisis de anomalías
-            anomalias = ControlPredicciones.detectar_anomalias()
+            anomalias = ControlPredicciones.detectar_anomalias(historial=historial)
             anomalias_altas = [a for a in anomalias if a['severidad'] == 'Alta']
             if anomalias_altas:
                 recomendaciones.append({
@@ -496,7 +589,7 @@ class ControlPredicciones:
                 })
             
             # 4. Análisis de carga de técnicos
-            carga_tecnicos = ControlPredicciones.predecir_carga_tecnicos()
+            carga_tecnicos = ControlPredicciones.predecir_carga_tecnicos(historial=historial)
             tecnicos_sobrecargados = [t for t in carga_tecnicos if t['nivel_carga'] in ['Alta', 'Muy Alta']]
             if tecnicos_sobrecargados:
                 nombres = ', '.join([t['nombre'] for t in tecnicos_sobrecargados[:2]])
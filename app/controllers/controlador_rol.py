@@ -1,7 +1,12 @@
 from ConexionBD import get_connection
+from services.cache_service import CacheTTL
+
+# Los roles casi nunca cambian: se cachean en memoria (ver insertar_rol)
+cache_roles = CacheTTL('roles', ttl=600, max_entradas=256)
+
 class ControlRol:
     @staticmethod
-
+    @cache_roles.memorizar
     def buscar_por_IDRol(id_rol):
         try:
             sql = """
@@ -45,6 +50,7 @@ class ControlRol:
                 conexion.commit()
 
             conexion.close()
+            cache_roles.invalidar()
             return True
 
         except Exception as e:
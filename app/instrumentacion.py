@@ -0,0 +1,184 @@
+"""
+Instrumentación de consultas SQL
+
+Todas las conexiones del pool usan CursorInstrumentado (ver ConexionBD), que mide
+cada consulta y registra:
+- latencia, filas devueltas y el método del controlador que la ejecutó
+- consultas lentas (por encima de CONSULTA_LENTA_MS) con los parámetros ocultos
+- cuántas consultas hace cada petición de Flask; al terminar, si se pasa del
+  presupuesto o repite la misma sentencia muchas veces (patrón N+1), avisa
+  indicando la sentencia repetida y desde dónde se llamó
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+import psycopg2.extensions
+from flask import g, has_app_context, request, has_request_context
+
+# Configuración (variables de entorno)
+CONSULTA_LENTA_MS = float(os.environ.get('DB_CONSULTA_LENTA_MS', 200))
+PRESUPUESTO_CONSULTAS = int(os.environ.get('DB_PRESUPUESTO_CONSULTAS', 25))
+REPETICIONES_N_MAS_1 = int(os.environ.get('DB_REPETICIONES_N_MAS_1', 5))
+MAX_SENTENCIAS_REGISTRADAS = 300
+
+_RUTA_APP = os.path.dirname(os.path.abspath(__file__))
+_CARPETAS_ORIGEN = (
+    os.path.join(_RUTA_APP, 'controllers') + os.sep,
+    os.path.join(_RUTA_APP, 'services') + os.sep,
+)
+_ARCHIVO_RUN = os.path.join(_RUTA_APP, 'run.py')
+
+_lock = threading.Lock()
+_por_sentencia = {}     # sentencia normalizada -> estadísticas acumuladas del proceso
+_totales = {'consultas': 0, 'lentas': 0, 'tiempo_ms': 0.0, 'peticiones_excedidas': 0}
+
+
+def normalizar_sentencia(sql):
+    """Sentencia en una sola línea y recortada, para agrupar y mostrar"""
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', errors='replace')
+    sql = re.sub(r'\s+', ' ', str(sql)).strip()
+    return sql[:200] + ('…' if len(sql) > 200 else '')
+
+
+def ocultar_parametros(params):
+    """Reemplaza los valores por su tipo (no se registran datos de usuarios ni contraseñas)"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {clave: _ocultar(valor) for clave, valor in params.items()}
+    try:
+        return [_ocultar(valor) for valor in params]
+    except TypeError:
+        return _ocultar(params)
+
+
+def _ocultar(valor):
+    if valor is None:
+        return None
+    if isinstance(valor, (str, bytes, bytearray, memoryview)):
+        return f"<{type(valor).__name__}:{len(valor)}>"
+    if isinstance(valor, (list, tuple)):
+        return f"<{type(valor).__name__}:{len(valor)}>"
+    return f"<{type(valor).__name__}>"
+
+
+def _origen():
+    """Primer método de un controlador/servicio (o ruta de run.py) en la pila de llamadas"""
+    marco = sys._getframe(2)
+    ruta_respaldo = None
+    while marco is not None:
+        archivo = marco.f_code.co_filename
+        if archivo.startswith(_CARPETAS_ORIGEN):
+            return getattr(marco.f_code, 'co_qualname', marco.f_code.co_name)
+        if ruta_respaldo is None and archivo == _ARCHIVO_RUN:
+            ruta_respaldo = f"run.{marco.f_code.co_name}"
+        marco = marco.f_back
+    return ruta_respaldo or '-'
+
+
+def _registrar(sql, params, duracion_ms, filas):
+    sentencia = normalizar_sentencia(sql)
+    origen = _origen()
+
+    with _lock:
+        _totales['consultas'] += 1
+        _totales['tiempo_ms'] += duracion_ms
+        datos = _por_sentencia.get(sentencia)
+        if datos is None:
+            if len(_por_sentencia) >= MAX_SENTENCIAS_REGISTRADAS:
+                # Descartar la sentencia menos usada para acotar la memoria
+                menos_usada = min(_por_sentencia, key=lambda s: _por_sentencia[s]['ejecuciones'])
+                del _por_sentencia[menos_usada]
+            datos = {'ejecuciones': 0, 'tiempo_total_ms': 0.0, 'tiempo_max_ms': 0.0,
+                     'filas': 0, 'lentas': 0, 'origen': origen}
+            _por_sentencia[sentencia] = datos
+        datos['ejecuciones'] += 1
+        datos['tiempo_total_ms'] += duracion_ms
+        datos['tiempo_max_ms'] = max(datos['tiempo_max_ms'], duracion_ms)
+        datos['filas'] += max(filas, 0)
+        if duracion_ms >= CONSULTA_LENTA_MS:
+            datos['lentas'] += 1
+            _totales['lentas'] += 1
+
+    if duracion_ms >= CONSULTA_LENTA_MS:
+        print(f"🐢 Consulta lenta ({duracion_ms:.1f} ms, {filas} filas) en {origen}: "
+              f"{sentencia} | params={ocultar_parametros(params)}")
+
+    if has_app_context():
+        estado = g.get('_consultas_peticion')
+        if estado is None:
+            estado = {'total': 0, 'tiempo_ms': 0.0, 'sentencias': Counter(), 'origenes': {}}
+            g._consultas_peticion = estado
+        estado['total'] += 1
+        estado['tiempo_ms'] += duracion_ms
+        estado['sentencias'][sentencia] += 1
+        estado['origenes'].setdefault(sentencia, origen)
+
+
+class CursorInstrumentado(psycopg2.extensions.cursor):
+    """Cursor de psycopg2 que mide cada execute/executemany"""
+
+    def execute(self, sql, params=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            _registrar(sql, params, (time.perf_counter() - inicio) * 1000, self.rowcount)
+
+    def executemany(self, sql, lista_params):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, lista_params)
+        finally:
+            _registrar(sql, None, (time.perf_counter() - inicio) * 1000, self.rowcount)
+
+
+def finalizar_peticion(excepcion=None):
+    """
+    Revisa las consultas de la petición (registrar en teardown_request).
+    Avisa si se pasó del presupuesto o si una sentencia se repitió (N+1).
+    """
+    if not has_app_context():
+        return
+    estado = g.pop('_consultas_peticion', None)
+    if not estado:
+        return
+
+    sentencia, repeticiones = estado['sentencias'].most_common(1)[0]
+    if estado['total'] <= PRESUPUESTO_CONSULTAS and repeticiones < REPETICIONES_N_MAS_1:
+        return
+
+    with _lock:
+        _totales['peticiones_excedidas'] += 1
+
+    ruta = f"{request.method} {request.path}" if has_request_context() else '-'
+    print(f"⚠️ {ruta}: {estado['total']} consultas en {estado['tiempo_ms']:.1f} ms "
+          f"(presupuesto: {PRESUPUESTO_CONSULTAS}). Más repetida x{repeticiones} "
+          f"desde {estado['origenes'].get(sentencia, '-')}: {sentencia}")
+
+
+def metricas_consultas(limite=20):
+    """Totales del proceso y las sentencias con más tiempo acumulado"""
+    with _lock:
+        sentencias = [
+            dict(datos, sentencia=sentencia,
+                 tiempo_promedio_ms=round(datos['tiempo_total_ms'] / datos['ejecuciones'], 2))
+            for sentencia, datos in _por_sentencia.items()
+        ]
+        totales = dict(_totales)
+    sentencias.sort(key=lambda d: d['tiempo_total_ms'], reverse=True)
+    for datos in sentencias:
+        datos['tiempo_total_ms'] = round(datos['tiempo_total_ms'], 2)
+        datos['tiempo_max_ms'] = round(datos['tiempo_max_ms'], 2)
+    totales['tiempo_ms'] = round(totales['tiempo_ms'], 2)
+    return {
+        'totales': totales,
+        'umbral_lenta_ms': CONSULTA_LENTA_MS,
+        'presupuesto_por_peticion': PRESUPUESTO_CONSULTAS,
+        'sentencias': sentencias[:limite]
+    }
@@ -0,0 +1,150 @@
+"""
+Migraciones versionadas del esquema de la base de datos
+
+Cada archivo scripts_sql/migraciones/NNN_descripcion.sql es una migración.
+Se aplican en orden, una sola vez, y quedan registradas en SCHEMA_MIGRACION.
+Toda la DDL (tablas e índices) vive aquí y no en los controladores.
+
+Uso:
+    python migraciones.py            # aplica las pendientes
+    python migraciones.py --estado   # lista aplicadas y pendientes
+    flask --app run migrar           # igual, desde la CLI de Flask
+"""
+import hashlib
+import os
+import re
+import sys
+from ConexionBD import get_connection
+
+DIRECTORIO_MIGRACIONES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'scripts_sql', 'migraciones'
+)
+
+# Llave del advisory lock: evita que dos procesos migren a la vez
+LLAVE_BLOQUEO = 720905
+
+_PATRON_ARCHIVO = re.compile(r'^(\d{3})_(.+)\.sql$')
+
+
+def listar_migraciones():
+    """Retorna [(version, descripcion, ruta)] ordenadas por versión"""
+    migraciones = []
+    if not os.path.isdir(DIRECTORIO_MIGRACIONES):
+        return migraciones
+    for nombre in sorted(os.listdir(DIRECTORIO_MIGRACIONES)):
+        coincidencia = _PATRON_ARCHIVO.match(nombre)
+        if coincidencia:
+            version, descripcion = coincidencia.groups()
+            migraciones.append((version, descripcion.replace('_', ' '), os.path.join(DIRECTORIO_MIGRACIONES, nombre)))
+    return migraciones
+
+
+def _crear_tabla_control(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS SCHEMA_MIGRACION (
+            version VARCHAR(10) PRIMARY KEY,
+            descripcion VARCHAR(200) NOT NULL,
+            checksum VARCHAR(64) NOT NULL,
+            fecha_aplicacion TIMESTAMP DEFAULT NOW()
+        )
+    """)
+
+
+def _versiones_aplicadas(cursor):
+    cursor.execute("SELECT version, checksum FROM SCHEMA_MIGRACION")
+    return dict(cursor.fetchall())
+
+
+def estado_migraciones():
+    """Retorna {'aplicadas': [...], 'pendientes': [...]} con las versiones"""
+    conexion = get_connection()
+    if not conexion:
+        return None
+    try:
+        with conexion.cursor() as cursor:
+            _crear_tabla_control(cursor)
+            aplicadas = _versiones_aplicadas(cursor)
+        conexion.commit()
+        todas = [version for version, _, _ in listar_migraciones()]
+        return {
+            'aplicadas': [v for v in todas if v in aplicadas],
+            'pendientes': [v for v in todas if v not in aplicadas]
+        }
+    finally:
+        conexion.close()
+
+
+def aplicar_migraciones():
+    """
+    Aplica las migraciones pendientes, cada una en su propia transacción.
+    Se detiene en la primera que falle (las siguientes pueden depender de ella).
+
+    Returns:
+        list: versiones aplicadas en esta ejecución, o None si hubo un error
+    """
+    conexion = get_connection()
+    if not conexion:
+        print("❌ Migraciones: no se pudo conectar a la base de datos")
+        return None
+
+    aplicadas_ahora = []
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s)", (LLAVE_BLOQUEO,))
+            _crear_tabla_control(cursor)
+            conexion.commit()
+            aplicadas = _versiones_aplicadas(cursor)
+
+            for version, descripcion, ruta in listar_migraciones():
+                with open(ruta, 'r', encoding='utf-8') as archivo:
+                    sql = archivo.read()
+                checksum = hashlib.sha256(sql.encode('utf-8')).hexdigest()
+
+                if version in aplicadas:
+                    if aplicadas[version] != checksum:
+                        print(f"⚠️ Migración {version} fue modificada después de aplicarse ({os.path.basename(ruta)})")
+                    continue
+
+                try:
+                    cursor.execute(sql)
+                    cursor.execute(
+                        "INSERT INTO SCHEMA_MIGRACION (version, descripcion, checksum) VALUES (%s, %s, %s)",
+                        (version, descripcion, checksum)
+                    )
+                    conexion.commit()
+                    aplicadas_ahora.append(version)
+                    print(f"✅ Migración {version} aplicada: {descripcion}")
+                except Exception as e:
+                    conexion.rollback()
+                    print(f"❌ Error en la migración {version} ({descripcion}) => {e}")
+                    return None
+
+        return aplicadas_ahora
+    except Exception as e:
+        print(f"❌ Error al aplicar migraciones => {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+    finally:
+        try:
+            conexion.rollback()
+            with conexion.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (LLAVE_BLOQUEO,))
+            conexion.commit()
+        except Exception:
+            pass
+        conexion.close()
+
+
+if __name__ == '__main__':
+    if '--estado' in sys.argv:
+        estado = estado_migraciones()
+        if estado is None:
+            sys.exit(1)
+        print(f"Aplicadas: {', '.join(estado['aplicadas']) or '-'}")
+        print(f"Pendientes: {', '.join(estado['pendientes']) or '-'}")
+    else:
+        resultado = aplicar_migraciones()
+        if resultado is None:
+            sys.exit(1)
+        print(f"Migraciones aplicadas: {len(resultado)}")
@@ -0,0 +1,241 @@
+"""
+Precálculo de las predicciones (módulo de IA)
+
+Las predicciones se calculan fuera de las peticiones y se guardan en
+PREDICCION_SNAPSHOT (migración 007), una fila por endpoint y opción de la
+página (meses de histórico, días de predicción). Las rutas de
+/api/predicciones/* sirven la última instantánea y su antigüedad; si no hay
+una para los parámetros pedidos, calculan en vivo. Las anomalías no se
+precalculan: las mantiene al día el detector en línea (ControlAnomalias).
+
+Formas de ejecutarlo:
+- Hilo en el proceso web: iniciar_planificador() (lo hace run.py al arrancar)
+- Trabajador aparte:
+    python precalculo.py              # genera una vez
+    python precalculo.py --continuo   # genera cada PRECALCULO_INTERVALO segundos
+    flask --app run precalcular [--continuo]
+
+Varios procesos pueden tener el planificador activo: un advisory lock hace
+que solo uno genere a la vez.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from ConexionBD import get_connection
+from services.cache_service import CacheTTL
+
+# Segundos entre generaciones (0 desactiva el hilo del proceso web)
+INTERVALO_SEGUNDOS = int(os.environ.get('PRECALCULO_INTERVALO', 900))
+
+# Llave del advisory lock (distinta de la de migraciones)
+LLAVE_BLOQUEO = 720906
+
+# Opciones que ofrece la página predicciones_ia.html
+MESES_OPCIONES = (1, 3, 6, 12)
+DIAS_OPCIONES = (7, 14, 30)
+
+# Lectura de instantáneas: evita una consulta por petición
+cache_snapshots = CacheTTL('prediccion_snapshot', ttl=30, max_entradas=64)
+
+_hilo = None
+_hilo_lock = threading.Lock()
+_detener = threading.Event()
+
+
+def clave_snapshot(endpoint, **params):
+    """Clave de la instantánea: 'endpoint:param=valor,...' con los parámetros ordenados"""
+    return endpoint + ':' + ','.join(f"{nombre}={valor}" for nombre, valor in sorted(params.items()))
+
+
+def _tareas(historial):
+    """(clave, función) de cada respuesta a precalcular, todas sobre el mismo historial"""
+    from controllers.control_predicciones import ControlPredicciones
+
+    tareas = []
+    for meses in MESES_OPCIONES:
+        tareas.append((clave_snapshot('categorias', meses=meses), lambda meses=meses: {
+            'success': True,
+            'predicciones': ControlPredicciones.predecir_incidentes_por_categoria(meses, historial=historial)
+        }))
+        tareas.append((clave_snapshot('patrones', meses=meses), lambda meses=meses: {
+            'success': True,
+            'patrones': ControlPredicciones.analizar_patrones_temporales(meses, historial=historial)
+        }))
+    for dias in DIAS_OPCIONES:
+        tareas.append((clave_snapshot('carga_tecnicos', dias=dias), lambda dias=dias: {
+            'success': True,
+            'predicciones': ControlPredicciones.predecir_carga_tecnicos(dias, historial=historial)
+        }))
+    tareas.append((clave_snapshot('recomendaciones'), lambda: {
+        'success': True,
+        'recomendaciones': ControlPredicciones.obtener_recomendaciones(historial=historial)
+    }))
+    return tareas
+
+
+def generar_snapshot():
+    """
+    Recalcula todas las predicciones y reemplaza las instantáneas en una
+    sola transacción.
+
+    Returns:
+        dict: {'generado', 'duracion_ms', 'instantaneas'}; {'en_curso': True}
+        si otro proceso está generando; None si hubo un error
+    """
+    from controllers.control_predicciones import ControlPredicciones
+
+    conexion = get_connection()
+    if not conexion:
+        print("❌ Precálculo: no se pudo conectar a la base de datos")
+        return None
+
+    bloqueado = False
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", (LLAVE_BLOQUEO,))
+            bloqueado = cursor.fetchone()[0]
+        if not bloqueado:
+            return {'en_curso': True}
+
+        inicio = time.perf_counter()
+        historial = ControlPredicciones.cargar_historial(max(MESES_OPCIONES))
+        if historial is None:
+            return None
+
+        filas = []
+        for clave, calcular in _tareas(historial):
+            comienzo = time.perf_counter()
+            datos = calcular()
+            filas.append((clave, json.dumps(datos, default=str), int((time.perf_counter() - comienzo) * 1000)))
+
+        with conexion.cursor() as cursor:
+            cursor.executemany("""
+                INSERT INTO PREDICCION_SNAPSHOT (clave, datos, fecha_generacion, duracion_ms)
+                VALUES (%s, %s::jsonb, NOW(), %s)
+                ON CONFLICT (clave) DO UPDATE
+                SET datos = EXCLUDED.datos,
+                    fecha_generacion = EXCLUDED.fecha_generacion,
+                    duracion_ms = EXCLUDED.duracion_ms
+            """, filas)
+        conexion.commit()
+        cache_snapshots.invalidar()
+
+        duracion_ms = int((time.perf_counter() - inicio) * 1000)
+        print(f"✅ Predicciones precalculadas: {len(filas)} instantáneas en {duracion_ms} ms")
+        return {'generado': datetime.now().isoformat(), 'duracion_ms': duracion_ms, 'instantaneas': len(filas)}
+
+    except Exception as e:
+        conexion.rollback()
+        print(f"❌ Error al precalcular predicciones => {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+    finally:
+        if bloqueado:
+            try:
+                with conexion.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_unlock(%s)", (LLAVE_BLOQUEO,))
+                conexion.commit()
+            except Exception:
+                pass
+        conexion.close()
+
+
+def _leer_snapshot(clave):
+    try:
+        conexion = get_connection()
+        if not conexion:
+            return None
+        try:
+            with conexion.cursor() as cursor:
+                cursor.execute("""
+                    SELECT datos, fecha_generacion, EXTRACT(EPOCH FROM NOW() - fecha_generacion)
+                    FROM PREDICCION_SNAPSHOT
+                    WHERE clave = %s
+                """, (clave,))
+                fila = cursor.fetchone()
+        finally:
+            conexion.close()
+        if not fila:
+            return None
+        datos = fila[0] if isinstance(fila[0], dict) else json.loads(fila[0])
+        # La antigüedad se mide con el reloj de la BD (quien escribió fecha_generacion)
+        return {'datos': datos, 'generado': fila[1], 'antiguedad': float(fila[2]), 'leido': time.monotonic()}
+    except Exception as e:
+        print(f"⚠️ Error al leer instantánea {clave} => {e}")
+        return None
+
+
+def obtener_snapshot(clave):
+    """
+    Última instantánea de una clave con su antigüedad.
+
+    Returns:
+        dict: {'datos', 'generado' (ISO), 'antiguedad_segundos'} o None si no existe
+    """
+    instantanea = cache_snapshots.obtener(clave, lambda: _leer_snapshot(clave))
+    if not instantanea:
+        return None
+    # Antigüedad al leerla más el tiempo que lleva en cache_snapshots
+    antiguedad = instantanea['antiguedad'] + time.monotonic() - instantanea['leido']
+    return {
+        'datos': instantanea['datos'],
+        'generado': instantanea['generado'].isoformat(),
+        'antiguedad_segundos': max(0, int(antiguedad))
+    }
+
+
+def _ciclo(intervalo):
+    while not _detener.is_set():
+        generar_snapshot()
+        _detener.wait(intervalo)
+
+
+def iniciar_planificador(intervalo=INTERVALO_SEGUNDOS, usa_reloader=False):
+    """
+    Inicia (una sola vez por proceso) el hilo que regenera las instantáneas.
+    Con el reloader de Flask solo arranca en el proceso hijo que atiende las
+    peticiones (WERKZEUG_RUN_MAIN), no en el que vigila los archivos.
+
+    Returns:
+        bool: True si el hilo quedó en marcha
+    """
+    global _hilo
+
+    if intervalo <= 0:
+        return False
+    if usa_reloader and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        return False
+
+    with _hilo_lock:
+        if _hilo is not None and _hilo.is_alive():
+            return True
+        _detener.clear()
+        _hilo = threading.Thread(target=_ciclo, args=(intervalo,), name='precalculo-predicciones', daemon=True)
+        _hilo.start()
+    print(f"⏱️ Planificador de predicciones activo (cada {intervalo} s)")
+    return True
+
+
+def detener_planificador():
+    _detener.set()
+
+
+def ejecutar_trabajador(continuo=False, intervalo=INTERVALO_SEGUNDOS):
+    """Trabajador fuera del proceso web. Retorna False si la generación falló (modo único)"""
+    if not continuo:
+        return generar_snapshot() is not None
+    try:
+        _ciclo(max(intervalo, 1))
+    except KeyboardInterrupt:
+        pass
+    return True
+
+
+if __name__ == '__main__':
+    if not ejecutar_trabajador(continuo='--continuo' in sys.argv):
+        sys.exit(1)
@@ -0,0 +1,130 @@
+"""
+Entrenamiento y evaluación de los modelos de pronóstico de incidentes
+
+Ajusta un modelo Holt-Winters por categoría (ver services/pronostico_service.py)
+con la serie diaria de los últimos meses y lo guarda como un nuevo artefacto
+versionado en app/modelos. Las predicciones lo cargan una vez por proceso; los
+demás procesos lo toman al reiniciarse.
+
+Uso:
+    python pronostico.py entrenar    # ajusta y guarda una nueva versión
+    python pronostico.py backtest    # solo evalúa, no guarda
+    flask --app run entrenar-modelos / backtest-modelos
+"""
+import sys
+
+import numpy as np
+
+from controllers.control_predicciones import ControlPredicciones
+from services.pronostico_service import PronosticoService
+
+MESES_HISTORIA = 24
+DIAS_PRUEBA = 28
+
+
+def _evaluar(fechas, valores, dias_prueba):
+    """
+    Ajusta sin los últimos `dias_prueba` días y compara el pronóstico con lo
+    observado. Referencia: el promedio diario de las 4 semanas previas.
+
+    Returns:
+        dict con errores, o None si la serie no alcanza
+    """
+    valores = np.asarray(valores, dtype=float)
+    entrenamiento, prueba = valores[:-dias_prueba], valores[-dias_prueba:]
+    modelo = PronosticoService.ajustar(fechas[:-dias_prueba], entrenamiento)
+    if modelo is None:
+        return None
+
+    _, pronostico = PronosticoService.pronosticar(modelo, dias_prueba)
+    referencia = np.full(dias_prueba, entrenamiento[-28:].mean())
+    total_real = prueba.sum()
+
+    def error_total(estimado):
+        return float(abs(estimado.sum() - total_real) / total_real * 100) if total_real > 0 else None
+
+    return {
+        'total_real': int(total_real),
+        'total_pronosticado': round(float(pronostico.sum()), 1),
+        'mae_diario': round(float(np.abs(pronostico - prueba).mean()), 3),
+        'mae_diario_referencia': round(float(np.abs(referencia - prueba).mean()), 3),
+        'error_total_pct': error_total(pronostico),
+        'error_total_referencia_pct': error_total(referencia)
+    }
+
+
+def backtest(meses=MESES_HISTORIA, dias_prueba=DIAS_PRUEBA, mostrar=True):
+    """
+    Evalúa el modelo de cada categoría sobre las últimas `dias_prueba` jornadas.
+
+    Returns:
+        dict: {categoria: métricas} o None si no se pudo leer la historia
+    """
+    series = ControlPredicciones.obtener_series_diarias(meses)
+    if series is None:
+        return None
+
+    resultados = {}
+    for categoria, (fechas, valores) in sorted(series.items()):
+        metricas = _evaluar(fechas, valores, dias_prueba)
+        if metricas:
+            resultados[categoria] = metricas
+
+    if mostrar:
+        print(f"Backtest: últimos {dias_prueba} días, historia de {meses} meses")
+        print(f"{'Categoría':<30} {'Real':>6} {'Pron.':>7} {'MAE':>7} {'MAE ref':>8} {'Err %':>7} {'Ref %':>7}")
+        for categoria, m in resultados.items():
+            err = '-' if m['error_total_pct'] is None else f"{m['error_total_pct']:.1f}"
+            ref = '-' if m['error_total_referencia_pct'] is None else f"{m['error_total_referencia_pct']:.1f}"
+            print(f"{categoria[:30]:<30} {m['total_real']:>6} {m['total_pronosticado']:>7} "
+                  f"{m['mae_diario']:>7} {m['mae_diario_referencia']:>8} {err:>7} {ref:>7}")
+        if not resultados:
+            print("Sin categorías con historia suficiente")
+    return resultados
+
+
+def entrenar(meses=MESES_HISTORIA, dias_prueba=DIAS_PRUEBA):
+    """
+    Ajusta y guarda los modelos de todas las categorías con historia suficiente.
+    Cada modelo guarda su error de backtest (se usa como confianza).
+
+    Returns:
+        str: ruta del artefacto guardado, o None si no se entrenó nada
+    """
+    series = ControlPredicciones.obtener_series_diarias(meses)
+    if series is None:
+        return None
+
+    metricas = backtest(meses, dias_prueba, mostrar=False) or {}
+    modelos = {}
+    for categoria, (fechas, valores) in series.items():
+        modelo = PronosticoService.ajustar(fechas, valores)
+        if modelo is None:
+            continue
+        evaluacion = metricas.get(categoria, {})
+        modelo['error_backtest_pct'] = evaluacion.get('error_total_pct')
+        modelos[categoria] = modelo
+
+    if not modelos:
+        print("⚠️ Ninguna categoría tiene historia suficiente para entrenar")
+        return None
+
+    ruta = PronosticoService.guardar(modelos, metricas={
+        'meses_historia': meses,
+        'dias_prueba': dias_prueba,
+        'backtest': metricas
+    })
+    print(f"✅ {len(modelos)} modelos guardados en {ruta}")
+    return ruta
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('entrenar', 'backtest'):
+        print("Uso: python pronostico.py entrenar|backtest")
+        sys.exit(2)
+    if sys.argv[1] == 'entrenar':
+        resultado = entrenar()
+    else:
+        resultado = backtest()
+    if resultado is None:
+        sys.exit(1)
@@ -1,6 +1,6 @@
 from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory
 from controllers.control_Usuarios import controlUsuarios
-from controllers.control_incidentes import ControlIncidentes
+from controllers.control_incidentes import ControlIncidentes, cache_respuestas
 from controllers.control_categorias import controlCategorias
 from controllers.control_diagnostico import ControlDiagnosticos
 from controllers.control_notificaciones import ControlNotificaciones
@@ -10,16 +10,46 @@ from controllers.control_biometria_opencv import ControlBiometriaOpenCV
 from controllers.control_predicciones import ControlPredicciones
 from controllers.control_contratos import ControlContratos
 from services.sello_service import SelloService
+from services.perfil_service import PerfilService
+from ConexionBD import liberar_conexion_peticion, obtener_metricas_pool
+from instrumentacion import finalizar_peticion, metricas_consultas
+from precalculo import clave_snapshot, obtener_snapshot, generar_snapshot
+from services.cache_service import CacheTTL
+from services.pronostico_service import PronosticoService
+from services.motor_biometrico import MotorBiometrico
+from services.sesion_verificacion import SesionesVerificacion
+from services.canal_frames import CanalFrames
 from datetime import datetime
+import click
+import json
+import threading
 import os
 from werkzeug.utils import secure_filename
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
 
+# Canal WebSocket del login facial (opcional): sin flask-sock el navegador usa HTTP
+try:
+    from flask_sock import Sock, ConnectionClosed
+except ImportError:
+    Sock = None
+
 app = Flask(__name__, template_folder="./templates")
+sock = Sock(app) if Sock is not None else None
 app.secret_key = 'tu_clave_secreta_aqui'
 
+# Devuelve al pool la conexión de una transaccion() que no llegó a cerrarse
+app.teardown_appcontext(liberar_conexion_peticion)
+# Aviso de peticiones con demasiadas consultas o consultas repetidas (N+1)
+app.teardown_request(finalizar_peticion)
+
+# Modelos de pronóstico entrenados (app/modelos): se leen una sola vez al arrancar
+PronosticoService.artefacto()
+
+# Detectores de rostro precargados y probados antes de la primera verificación
+MotorBiometrico.calentar()
+
 # Configurar encoding UTF-8 para Flask
 import sys
 if sys.platform == 'win32':
@@ -296,7 +326,8 @@ def api_estado_biometria(id_usuario):
 def api_iniciar_verificacion_streaming():
     """
     Inicia la verificación por video streaming.
-    Obtiene el encoding del usuario y lo guarda en la sesión.
+    Guarda la plantilla del usuario en el servidor y retorna el token que
+    identifica la verificación en cada frame.
     """
     try:
         data = request.get_json()
@@ -306,29 +337,24 @@ def api_iniciar_verificacion_streaming():
         if not correo or not contrasena:
             return jsonify({'exito': False, 'mensaje': 'Credenciales incompletas'})
         
-        # Obtener rostro del usuario
+        # Obtener plantilla facial del usuario
         resultado = ControlBiometriaOpenCV.obtener_rostro_usuario(correo, contrasena)
         
         if resultado['exito']:
-            # Guardar el rostro en la sesión temporalmente
-            import pickle
-            import base64
-            
-            rostro_serializado = base64.b64encode(pickle.dumps(resultado['rostro'])).decode('utf-8')
-            
-            session['temp_rostro'] = rostro_serializado
-            session['temp_usuario'] = resultado['usuario']
-            session['match_count'] = 0  # Contador de matches
-            session['total_frames'] = 0  # Total de frames procesados
+            token = SesionesVerificacion.crear(resultado['plantilla'], resultado['usuario'])
+            if not token:
+                return jsonify({'exito': False, 'mensaje': 'No se pudo iniciar la verificación'}), 500
             
             return jsonify({
                 'exito': True,
                 'mensaje': 'Verificación iniciada',
+                'token': token,
+                'canal_ws': '/ws/biometria/verificacion' if sock is not None else None,
                 'frames_requeridos': ControlBiometriaOpenCV.FRAMES_REQUERIDOS,
                 'usuario': resultado['usuario']
             })
         else:
-            return jsonify(resultado)
+            return jsonify({'exito': False, 'mensaje': resultado['mensaje']})
         
     except Exception as e:
         print(f"❌ Error en api_iniciar_verificacion_streaming: {e}")
@@ -336,94 +362,96 @@ def api_iniciar_verificacion_streaming():
         traceback.print_exc()
         return jsonify({'exito': False, 'mensaje': f'Error: {str(e)}'}), 500
 
+def verificar_frame_sesion(token, frame):
+    """
+    Verifica un frame (JPEG en bytes o base64) de la verificación `token` y
+    actualiza sus contadores. Lo usan la ruta HTTP y el canal WebSocket.
+
+    Returns:
+        dict: respuesta para el navegador; 'alcanzado' indica que ya se
+        cumplieron los frames requeridos ('reiniciar' si la sesión no existe)
+    """
+    verificacion = SesionesVerificacion.obtener(token)
+    if verificacion is None:
+        return {
+            'exito': False,
+            'mensaje': 'No hay sesión de verificación activa',
+            'reiniciar': True
+        }
+    
+    if not frame:
+        return {'exito': False, 'mensaje': 'Imagen no proporcionada'}
+    
+    # Verificar el frame
+    resultado = ControlBiometriaOpenCV.verificar_frame(verificacion['plantilla'], frame, verificacion['seguimiento'])
+    
+    # Actualizar contadores
+    contadores = SesionesVerificacion.registrar_frame(token, resultado['coincide'])
+    if contadores is None:
+        return {
+            'exito': False,
+            'mensaje': 'La sesión de verificación venció',
+            'reiniciar': True
+        }
+    
+    match_count, total_frames = contadores
+    frames_requeridos = ControlBiometriaOpenCV.FRAMES_REQUERIDOS
+    alcanzado = match_count >= frames_requeridos
+    
+    return {
+        'exito': True,
+        'alcanzado': alcanzado,
+        'login_exitoso': False,
+        'coincide': resultado['coincide'],
+        'match_count': match_count,
+        'total_frames': total_frames,
+        'frames_requeridos': frames_requeridos,
+        'progreso': 100 if alcanzado else int((match_count / frames_requeridos) * 100),
+        'mensaje': resultado['mensaje'],
+        'distancia': resultado.get('distancia', 0),
+        'face_location': resultado.get('face_location')
+    }
+
+def completar_verificacion(token):
+    """Inicia la sesión del usuario si su verificación alcanzó los frames requeridos"""
+    usuario = SesionesVerificacion.completar(token, ControlBiometriaOpenCV.FRAMES_REQUERIDOS)
+    if usuario is None:
+        return False
+    
+    # Establecer sesión de usuario
+    session['user_id'] = str(usuario['id_usuario'])
+    session['user_name'] = f"{usuario['nombre']} {usuario['ape_pat']} {usuario['ape_mat']}"
+    session['user_role'] = usuario['id_rol']
+    return True
+
 @app.route('/api/biometria/verificar-frame', methods=['POST'])
 def api_verificar_frame():
     """
-    Verifica un frame del video contra el encoding almacenado en la sesión.
+    Verifica un frame del video contra la plantilla de la verificación (token).
     Cuenta los matches consecutivos.
+    Acepta JSON {token, imagen_facial (base64)} o el JPEG como cuerpo binario
+    (Content-Type image/jpeg) con el token en el encabezado X-Verificacion-Token.
     """
     try:
-        # Verificar que hay una sesión activa
-        if 'temp_rostro' not in session:
-            return jsonify({
-                'exito': False,
-                'mensaje': 'No hay sesión de verificación activa',
-                'reiniciar': True
-            })
-        
-        data = request.get_json()
-        imagen_base64 = data.get('imagen_facial')
-        
-        if not imagen_base64:
-            return jsonify({'exito': False, 'mensaje': 'Imagen no proporcionada'})
-        
-        # Deserializar el rostro de la sesión
-        import pickle
-        import base64
-        
-        rostro_bytes = base64.b64decode(session['temp_rostro'])
-        rostro_guardado = pickle.loads(rostro_bytes)
-        
-        # Verificar el frame
-        resultado = ControlBiometriaOpenCV.verificar_frame(rostro_guardado, imagen_base64)
-        
-        # Actualizar contadores
-        session['total_frames'] = session.get('total_frames', 0) + 1
-        
-        if resultado['coincide']:
-            session['match_count'] = session.get('match_count', 0) + 1
+        if request.mimetype in ('image/jpeg', 'application/octet-stream'):
+            token = request.headers.get('X-Verificacion-Token')
+            frame = request.get_data()
         else:
-            # Reiniciar contador si no coincide
-            session['match_count'] = 0
+            data = request.get_json()
+            token = data.get('token')
+            frame = data.get('imagen_facial')
         
-        match_count = session['match_count']
-        total_frames = session['total_frames']
-        frames_requeridos = ControlBiometriaOpenCV.FRAMES_REQUERIDOS
+        respuesta = verificar_frame_sesion(token, frame)
         
         # Verificar si se alcanzó el umbral
-        if match_count >= frames_requeridos:
-            # Login exitoso
-            usuario = session['temp_usuario']
-            
-            # Establecer sesión de usuario
-            session['user_id'] = str(usuario['id_usuario'])
-            session['user_name'] = f"{usuario['nombre']} {usuario['ape_pat']} {usuario['ape_mat']}"
-            session['user_role'] = usuario['id_rol']
-            
-            # Limpiar datos temporales
-            session.pop('temp_rostro', None)
-            session.pop('temp_usuario', None)
-            session.pop('match_count', None)
-            session.pop('total_frames', None)
-            
-            return jsonify({
-                'exito': True,
-                'login_exitoso': True,
-                'coincide': True,
-                'match_count': match_count,
-                'total_frames': total_frames,
-                'frames_requeridos': frames_requeridos,
-                'progreso': 100,
-                'mensaje': f'¡Login exitoso! {match_count} frames coincidentes',
-                'distancia': resultado.get('distancia', 0),
-                'face_location': resultado.get('face_location')
-            })
+        if respuesta.get('alcanzado'):
+            if completar_verificacion(token):
+                respuesta['login_exitoso'] = True
+                respuesta['mensaje'] = f"¡Login exitoso! {respuesta['match_count']} frames coincidentes"
+            else:
+                respuesta = {'exito': False, 'mensaje': 'La sesión de verificación venció', 'reiniciar': True}
         
-        # Calcular progreso
-        progreso = int((match_count / frames_requeridos) * 100)
-        
-        return jsonify({
-            'exito': True,
-            'login_exitoso': False,
-            'coincide': resultado['coincide'],
-            'match_count': match_count,
-            'total_frames': total_frames,
-            'frames_requeridos': frames_requeridos,
-            'progreso': progreso,
-            'mensaje': resultado['mensaje'],
-            'distancia': resultado.get('distancia', 0),
-            'face_location': resultado.get('face_location')
-        })
+        return jsonify(respuesta)
         
     except Exception as e:
         print(f"❌ Error en api_verificar_frame: {e}")
@@ -431,14 +459,89 @@ def api_verificar_frame():
         traceback.print_exc()
         return jsonify({'exito': False, 'mensaje': f'Error: {str(e)}'}), 500
 
+@app.route('/api/biometria/completar-verificacion', methods=['POST'])
+def api_completar_verificacion():
+    """Inicia la sesión tras una verificación hecha por el canal WebSocket"""
+    try:
+        data = request.get_json(silent=True) or {}
+        if completar_verificacion(data.get('token')):
+            return jsonify({'exito': True, 'login_exitoso': True, 'mensaje': '¡Login exitoso!'})
+        return jsonify({'exito': False, 'mensaje': 'La verificación no está completa', 'reiniciar': True})
+        
+    except Exception as e:
+        print(f"❌ Error en api_completar_verificacion: {e}")
+        return jsonify({'exito': False, 'mensaje': str(e)}), 500
+
+if sock is not None:
+    @sock.route('/ws/biometria/verificacion')
+    def ws_verificacion_facial(ws):
+        """
+        Canal de frames del login facial: el navegador envía cada frame como
+        mensaje binario (JPEG) y recibe un JSON por frame verificado, igual a
+        la respuesta de /api/biometria/verificar-frame más 'descartados'.
+        Si la verificación no alcanza a la cámara se descartan los frames más
+        viejos. Al llegar a los frames requeridos se envía 'alcanzado' y el
+        navegador inicia la sesión con /api/biometria/completar-verificacion
+        (el WebSocket no puede escribir la cookie).
+        """
+        token = request.args.get('token')
+        if SesionesVerificacion.obtener(token) is None:
+            ws.send(json.dumps({'exito': False, 'mensaje': 'No hay sesión de verificación activa', 'reiniciar': True}))
+            return
+        
+        canal = CanalFrames(capacidad=2)
+        
+        def verificar():
+            while True:
+                elemento = canal.tomar()
+                if elemento is None:
+                    return
+                frame, descartados = elemento
+                respuesta = verificar_frame_sesion(token, frame)
+                respuesta['descartados'] = descartados
+                try:
+                    ws.send(json.dumps(respuesta))
+                except Exception:
+                    canal.cerrar()
+                    return
+                if respuesta.get('alcanzado') or respuesta.get('reiniciar'):
+                    canal.cerrar()
+                    return
+        
+        hilo = threading.Thread(target=verificar, name='verificacion-facial', daemon=True)
+        hilo.start()
+        try:
+            while canal.abierto:
+                mensaje = ws.receive(timeout=1)
+                if mensaje is None:
+                    continue
+                if isinstance(mensaje, str):
+                    # Mensaje de control: {"accion": "cancelar"}; lo demás se ignora
+                    try:
+                        control = json.loads(mensaje)
+                    except ValueError:
+                        continue
+                    if isinstance(control, dict) and control.get('accion') == 'cancelar':
+                        SesionesVerificacion.eliminar(token)
+                        break
+                    continue
+                canal.poner(mensaje)
+        except ConnectionClosed:
+            pass
+        except Exception as e:
+            print(f"❌ Error en canal de verificación facial: {e}")
+        finally:
+            canal.cerrar()
+            hilo.join(timeout=5)
+            if canal.total_descartados:
+                print(f"ℹ️ Verificación facial: {canal.total_descartados} frames descartados por atraso")
+
 @app.route('/api/biometria/cancelar-verificacion', methods=['POST'])
 def api_cancelar_verificacion():
-    """Cancela la verificación en curso y limpia la sesión"""
+    """Cancela la verificación en curso y libera su sesión en el servidor"""
     try:
-        session.pop('temp_rostro', None)
-        session.pop('temp_usuario', None)
-        session.pop('match_count', None)
-        session.pop('total_frames', None)
+        data = request.get_json(silent=True) or {}
+        SesionesVerificacion.eliminar(data.get('token'))
         
         return jsonify({'exito': True, 'mensaje': 'Verificación cancelada'})
         
@@ -455,31 +558,16 @@ def dashboard():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    # Obtener estadísticas para el dashboard
-    try:
-        incidentes = ControlIncidentes.listar_incidentes()
-        total_incidentes = len(incidentes)
-        incidentes_abiertos = len([i for i in incidentes if i['estado'] == 'Abierto'])
-        incidentes_proceso = len([i for i in incidentes if i['estado'] == 'En Progreso'])
-        incidentes_resueltos = len([i for i in incidentes if i['estado'] == 'Resuelto'])
-        
-        # Incidentes recientes (últimos 5)
-        incidentes_recientes = incidentes[:5] if incidentes else []
-        
-        stats = {
-            'total_incidentes': total_incidentes,
-            'incidentes_abiertos': incidentes_abiertos,
-            'incidentes_proceso': incidentes_proceso,
-            'incidentes_resueltos': incidentes_resueltos,
-            'incidentes_recientes': incidentes_recientes
-        }
-    except Exception as e:
-        print(f"Error obteniendo estadísticas: {e}")
+    # Obtener estadísticas para el dashboard (conteos agregados en la BD, cacheados unos segundos)
+    stats = ControlIncidentes.obtener_estadisticas_dashboard()
+    if not stats:
+        print("Error obteniendo estadísticas del dashboard")
         stats = {
             'total_incidentes': 0,
             'incidentes_abiertos': 0,
             'incidentes_proceso': 0,
             'incidentes_resueltos': 0,
+            'incidentes_cancelados': 0,
             'incidentes_recientes': []
         }
     
@@ -488,6 +576,9 @@ def dashboard():
                          user_role=session.get('user_role'),
                          stats=stats)
 
+# Incidentes por página en la gestión de incidentes
+TAMANO_PAGINA_INCIDENTES = 20
+
 @app.route('/gestion_incidentes')
 def gestion_incidentes():
     """Ruta para gestión de incidentes con filtros - Adaptado según rol"""
@@ -505,79 +596,42 @@ def gestion_incidentes():
     rol = ControlRol.buscar_por_IDRol(usuario['id_rol'])
     tipo_rol = rol.get('tipo') if rol else None
     
-    # Obtener parámetros de filtro
+    # Obtener parámetros de filtro (se aplican en la consulta SQL)
     filtros = {
-        'buscar': request.args.get('buscar', '').strip().lower(),
+        'buscar': request.args.get('buscar', '').strip(),
         'fecha_desde': request.args.get('fecha_desde', '').strip(),
         'fecha_hasta': request.args.get('fecha_hasta', '').strip(),
         'categoria': request.args.get('categoria', '').strip().lower(),
         'estado': request.args.get('estado', '').strip().lower()
     }
+    cursor_pagina = request.args.get('cursor', type=int)
+    total_incidentes = 0
+    siguiente_cursor = None
 
     try:
-        # Obtener incidentes según el rol usando el método simplificado
+        # Obtener una página de incidentes según el rol y los filtros
         id_rol_usuario = usuario.get('id_rol')
-        todos = ControlIncidentes.listar_incidentes(id_usuario=usuario_id, id_rol=id_rol_usuario)
-        
-        if not todos:
-            todos = []
-
-        incidentes = []
-        for inc in todos:
-            cumple = True
-
-            # Normalizar campos
-            titulo = str(inc.get('titulo', '')).lower()
-            categoria = str(inc.get('categoria', '')).lower()
-            estado = str(inc.get('estado', '')).lower()
-
-            # Manejar fecha correctamente
-            fecha = inc.get('fecha_reporte', '')
-            if isinstance(fecha, datetime):
-                fecha = fecha.strftime('%Y-%m-%d')
-            else:
-                fecha = str(fecha)
-
-            # Buscar texto en ID o título
-            if filtros['buscar']:
-                id_str = str(inc.get('id_incidente', '')).lower()
-                if filtros['buscar'] not in titulo and filtros['buscar'] not in id_str:
-                    cumple = False
-
-            # Filtrar por categoría
-            if filtros['categoria'] and filtros['categoria'] != categoria:
-                cumple = False
-
-            # Filtrar por estado (normalizar para comparación)
-            if filtros['estado']:
-                estado_filtro = filtros['estado'].lower()
-                estado_normalizado = estado.lower()
-                # Mapear estados del filtro a estados de BD
-                estado_map_filtro = {
-                    'pendiente': 'pendiente',
-                    'activo': 'activo',
-                    'cancelado': 'cancelado',
-                    'terminado': 'terminado'
-                }
-                estado_filtro_normalizado = estado_map_filtro.get(estado_filtro, estado_filtro)
-                if estado_filtro_normalizado != estado_normalizado:
-                    cumple = False
-
-            # Filtrar por fechas
-            if filtros['fecha_desde'] and fecha < filtros['fecha_desde']:
-                cumple = False
-            if filtros['fecha_hasta'] and fecha > filtros['fecha_hasta']:
-                cumple = False
-
-            if cumple:
-                incidentes.append(inc)
+        pagina = ControlIncidentes.listar_incidentes(
+            id_usuario=usuario_id,
+            id_rol=id_rol_usuario,
+            filtros=filtros,
+            cursor_pagina=cursor_pagina,
+            tamano_pagina=TAMANO_PAGINA_INCIDENTES
+        )
+        incidentes = pagina['incidentes']
+        total_incidentes = pagina['total']
+        siguiente_cursor = pagina['siguiente_cursor']
 
         #  Si no hay incidentes, se envía una lista vacía (evita datos falsos)
         if not incidentes:
             incidentes_obj = []
         else:
-            # Importar ControlDiagnosticos para verificar diagnósticos pendientes
+            # Diagnósticos pendientes del usuario para toda la página en una sola consulta
             from controllers.control_diagnostico import ControlDiagnosticos
+            pendientes = ControlDiagnosticos.tiene_diagnosticos_pendientes(
+                [inc.get('id_incidente') for inc in incidentes],
+                usuario_id
+            )
             
             class IncidenteObj:
                 def __init__(self, data):
@@ -589,13 +643,7 @@ def gestion_incidentes():
                     self.nivel = data.get('nivel', 'M')
                     
                     # Verificar si el usuario actual tiene diagnóstico pendiente para este incidente
-                    if 'user_id' in session:
-                        self.tiene_diagnostico_pendiente = ControlDiagnosticos.tiene_diagnostico_pendiente(
-                            self.id_incidente, 
-                            int(session['user_id'])
-                        )
-                    else:
-                        self.tiene_diagnostico_pendiente = False
+                    self.tiene_diagnostico_pendiente = self.id_incidente in pendientes
 
                     # Manejar fecha_creacion
                     fecha_reporte = data.get('fecha_reporte')
@@ -623,6 +671,9 @@ def gestion_incidentes():
     
     return render_template('gestionIncidente.html',
                            incidentes=incidentes_obj,
+                           total_incidentes=total_incidentes,
+                           siguiente_cursor=siguiente_cursor,
+                           cursor_actual=cursor_pagina,
                            categorias=categorias,
                            user_role=session.get('user_role'),
                            tipo_rol=tipo_rol,
@@ -1216,41 +1267,28 @@ def inject_user():
     puede_crear_contratos = False
     tipo_rol = None
     notificaciones_no_leidas = 0
+    id_rol_usuario = None
     
     if user_id and user_role:
         try:
-            usuario = controlUsuarios.buscar_por_ID(int(user_id))
-            if usuario:
-                from controllers.controlador_rol import ControlRol
-                rol = ControlRol.buscar_por_IDRol(usuario['id_rol'])
-                if rol:
-                    tipo_rol = rol.get('tipo')
-                    es_jefe = tipo_rol == 'J'
-                    es_jefe_ti = controlUsuarios.es_jefe_ti(int(user_id))
-                    es_jefe_ti_rol_1 = controlUsuarios.es_jefe_ti_rol_1(int(user_id))
-                    es_tecnico = tipo_rol == 'T'
-                    es_tecnico_area_1 = controlUsuarios.es_tecnico_area_1(int(user_id))
-                    es_rol_firmante = controlUsuarios.es_rol_firmante(int(user_id))
-                    puede_crear_contratos = controlUsuarios.puede_crear_contratos(int(user_id))
+            # Un solo perfil por petición (cacheado también en la sesión)
+            perfil = PerfilService.obtener(int(user_id))
+            if perfil:
+                id_rol_usuario = perfil['id_rol']
+                if perfil['tipo_rol']:
+                    tipo_rol = perfil['tipo_rol']
+                    es_jefe = perfil['es_jefe']
+                    es_jefe_ti = perfil['es_jefe_ti']
+                    es_jefe_ti_rol_1 = perfil['es_jefe_ti_rol_1']
+                    es_tecnico = perfil['es_tecnico']
+                    es_tecnico_area_1 = perfil['es_tecnico_area_1']
+                    es_rol_firmante = perfil['es_rol_firmante']
+                    puede_crear_contratos = perfil['puede_crear_contratos']
                 
-                # Contar notificaciones no leídas
-                notificaciones_no_leidas = ControlNotificaciones.contar_no_leidas(int(user_id))
-                
-                # Obtener id_rol para el sidebar
-                current_user_role = usuario.get('id_rol')
+                notificaciones_no_leidas = perfil['notificaciones_no_leidas']
         except Exception as e:
             print(f"Error en context processor: {e}")
     
-    # Obtener id_rol para el sidebar
-    id_rol_usuario = None
-    if user_id and user_role:
-        try:
-            usuario = controlUsuarios.buscar_por_ID(int(user_id))
-            if usuario:
-                id_rol_usuario = usuario.get('id_rol')
-        except:
-            pass
-    
     return dict(
         current_user_id=user_id,
         current_user_name=session.get('user_name'),
@@ -1275,12 +1313,11 @@ def gestion_mttr():
         
         control_incidentes = ControlIncidentes()
         
-        # Obtener datos reales de MTTR
-        mttr_data = control_incidentes.obtener_mttr_completo_por_categoria()
+        # Obtener datos reales de MTTR y sus estadísticas en una sola consulta
+        resultado = control_incidentes.calcular_mttr()
+        mttr_data = resultado['mttr_data']
+        estadisticas = resultado['estadisticas']
         print(f"✅ Datos MTTR obtenidos: {len(mttr_data)} categorías")
-        
-        # Obtener estadísticas reales
-        estadisticas = control_incidentes.obtener_estadisticas_mttr()
         print(f"✅ Estadísticas calculadas: MTTR global = {estadisticas.get('mttr_global', 0)}")
         
         # Obtener categorías disponibles directamente de la BD
@@ -1324,6 +1361,26 @@ def gestion_mttr():
             distribucion_data=[]
         )
 
+def respuesta_cacheada(params, construir):
+    """
+    Respuesta JSON de un endpoint de solo lectura, guardada en cache_respuestas.
+    Clave: endpoint + parámetros ya normalizados + rol de quien consulta.
+    La caché se descarta cuando un incidente cambia de estado.
+    """
+    alcance = 'anonimo'
+    if 'user_id' in session:
+        perfil = PerfilService.obtener(int(session['user_id']))
+        alcance = perfil['id_rol'] if perfil else None
+    clave = (request.endpoint, tuple(sorted(params.items())), alcance)
+    return jsonify(cache_respuestas.obtener(clave, construir, guardar_si=respuesta_con_datos))
+
+def respuesta_con_datos(respuesta):
+    """
+    Los controladores devuelven None, [] o {} cuando la BD no responde: una
+    respuesta con algún campo vacío se envía pero no se guarda en caché.
+    """
+    return all(valor for campo, valor in respuesta.items() if campo != 'success')
+
 # Tu ruta API también se mantiene igual, ya funciona correctamente
 @app.route('/api/mttr/filtrar')
 def api_filtrar_mttr():
@@ -1333,50 +1390,17 @@ def api_filtrar_mttr():
         categoria = request.args.get('categoria', '').strip()
         periodo = int(request.args.get('periodo', 6))
         
-        control_incidentes = ControlIncidentes()
-        
-        # Obtener datos filtrados de la BD
-        if categoria and categoria != 'Todas':
-            mttr_data = control_incidentes.obtener_mttr_filtrado(
-                categoria=categoria, 
-                periodo_meses=periodo
-            )
-        else:
-            mttr_data = control_incidentes.obtener_mttr_filtrado(
-                periodo_meses=periodo
-            )
-        
-        # Calcular estadísticas de los datos filtrados
-        if mttr_data:
-            mttr_global = sum(float(item['mttr_horas']) for item in mttr_data) / len(mttr_data)
-            total_incidentes = sum(item['total_incidentes'] for item in mttr_data)
-            
-            mejor = min(mttr_data, key=lambda x: float(x['mttr_horas']))
-            critica = max(mttr_data, key=lambda x: float(x['mttr_horas']))
-            
-            estadisticas = {
-                'mttr_global': round(mttr_global, 2),
-                'total_incidentes': total_incidentes,
-                'mejor_categoria': mejor['categoria'],
-                'mejor_mttr': mejor['mttr_horas'],
-                'categoria_critica': critica['categoria'],
-                'crit_mttr': critica['mttr_horas']
-            }
-        else:
-            estadisticas = {
-                'mttr_global': 0,
-                'total_incidentes': 0,
-                'mejor_categoria': 'N/A',
-                'mejor_mttr': 0,
-                'categoria_critica': 'N/A',
-                'crit_mttr': 0
+        def construir():
+            # Datos por categoría y estadísticas salen de la misma consulta
+            resultado = ControlIncidentes().calcular_mttr(categoria=categoria, periodo_meses=periodo)
+            return {
+                'success': True,
+                'mttr_data': resultado['mttr_data'],
+                'estadisticas': resultado['estadisticas'],
+                'percentiles_nivel': resultado['percentiles_nivel']
             }
         
-        return jsonify({
-            'success': True,
-            'mttr_data': mttr_data,
-            'estadisticas': estadisticas
-        })
+        return respuesta_cacheada({'categoria': categoria, 'periodo': periodo}, construir)
    
     except Exception as e:
         print(f"Error en API filtrar MTTR => {e}")
@@ -1923,8 +1947,45 @@ def api_marcar_todas_leidas():
     else:
         return jsonify({'success': False, 'message': 'Error al marcar notificaciones'}), 500
 
+# ========== MÉTRICAS DE RENDIMIENTO ==========
+
+@app.route('/api/metricas', methods=['GET'])
+def api_metricas():
+    """Métricas del proceso: pool de conexiones, cachés, biometría y consultas más costosas (solo Jefe de TI)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    if not controlUsuarios.es_jefe_ti(int(session['user_id'])):
+        return jsonify({'error': 'No tiene permisos'}), 403
+    
+    try:
+        limite = int(request.args.get('limite', 20))
+        return jsonify({
+            'success': True,
+            'pool': obtener_metricas_pool(),
+            'caches': CacheTTL.metricas_todas(),
+            'motor_biometrico': MotorBiometrico.metricas(),
+            'sesiones_verificacion': SesionesVerificacion.metricas(),
+            'consultas': metricas_consultas(limite)
+        })
+    except Exception as e:
+        print(f"Error en API métricas => {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # ========== MÓDULO DE PREDICCIONES CON IA ==========
 
+def respuesta_prediccion(clave, params, construir):
+    """
+    Sirve la última instantánea precalculada (ver precalculo.py) con su
+    antigüedad; si no hay una para estos parámetros, calcula en vivo.
+    """
+    instantanea = obtener_snapshot(clave)
+    if instantanea:
+        return jsonify(dict(instantanea['datos'],
+                            generado=instantanea['generado'],
+                            antiguedad_segundos=instantanea['antiguedad_segundos']))
+    return respuesta_cacheada(params, construir)
+
 @app.route('/predicciones_ia')
 def predicciones_ia():
     """Vista principal del módulo de predicciones con IA"""
@@ -1950,11 +2011,11 @@ def api_predicciones_categorias():
     
     try:
         meses_historico = int(request.args.get('meses', 3))
-        predicciones = ControlPredicciones.predecir_incidentes_por_categoria(meses_historico)
         
-        return jsonify({
+        clave = clave_snapshot('categorias', meses=meses_historico)
+        return respuesta_prediccion(clave, {'meses': meses_historico}, lambda: {
             'success': True,
-            'predicciones': predicciones
+            'predicciones': ControlPredicciones.predecir_incidentes_por_categoria(meses_historico)
         })
     except Exception as e:
         print(f"Error en API predicciones categorías => {e}")
@@ -1970,14 +2031,12 @@ def api_predicciones_tiempo():
         return jsonify({'error': 'No tiene permisos'}), 403
     
     try:
-        id_categoria = request.args.get('categoria', None)
-        nivel = request.args.get('nivel', 'M')
+        id_categoria = request.args.get('categoria', '').strip() or None
+        nivel = request.args.get('nivel', 'M').strip().upper()
         
-        prediccion = ControlPredicciones.predecir_tiempo_resolucion(id_categoria, nivel)
-        
-        return jsonify({
+        return respuesta_cacheada({'categoria': id_categoria, 'nivel': nivel}, lambda: {
             'success': True,
-            'prediccion': prediccion
+            'prediccion': ControlPredicciones.predecir_tiempo_resolucion(id_categoria, nivel)
         })
     except Exception as e:
         print(f"Error en API predicción tiempo => {e}")
@@ -1994,11 +2053,11 @@ def api_patrones_temporales():
     
     try:
         meses = int(request.args.get('meses', 3))
-        patrones = ControlPredicciones.analizar_patrones_temporales(meses)
         
-        return jsonify({
+        clave = clave_snapshot('patrones', meses=meses)
+        return respuesta_prediccion(clave, {'meses': meses}, lambda: {
             'success': True,
-            'patrones': patrones
+            'patrones': ControlPredicciones.analizar_patrones_temporales(meses)
         })
     except Exception as e:
         print(f"Error en API patrones temporales => {e}")
@@ -2015,12 +2074,13 @@ def api_detectar_anomalias():
     
     try:
         threshold = float(request.args.get('threshold', 2.0))
-        anomalias = ControlPredicciones.detectar_anomalias(threshold)
         
-        return jsonify({
-            'success': True,
-            'anomalias': anomalias
-        })
+        # Lectura de los eventos del detector en línea: no se precalcula
+        # ('modo' indica si los datos son por categoría o del volumen diario total)
+        return respuesta_cacheada({'threshold': threshold}, lambda: dict(
+            ControlPredicciones.analizar_anomalias(threshold),
+            success=True
+        ))
     except Exception as e:
         print(f"Error en API detección anomalías => {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -2036,11 +2096,11 @@ def api_carga_tecnicos():
     
     try:
         dias = int(request.args.get('dias', 7))
-        predicciones = ControlPredicciones.predecir_carga_tecnicos(dias)
         
-        return jsonify({
+        clave = clave_snapshot('carga_tecnicos', dias=dias)
+        return respuesta_prediccion(clave, {'dias': dias}, lambda: {
             'success': True,
-            'predicciones': predicciones
+            'predicciones': ControlPredicciones.predecir_carga_tecnicos(dias)
         })
     except Exception as e:
         print(f"Error en API carga técnicos => {e}")
@@ -2056,16 +2116,30 @@ def api_recomendaciones():
         return jsonify({'error': 'No tiene permisos'}), 403
     
     try:
-        recomendaciones = ControlPredicciones.obtener_recomendaciones()
-        
-        return jsonify({
+        return respuesta_prediccion(clave_snapshot('recomendaciones'), {}, lambda: {
             'success': True,
-            'recomendaciones': recomendaciones
+            'recomendaciones': ControlPredicciones.obtener_recomendaciones()
         })
     except Exception as e:
         print(f"Error en API recomendaciones => {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/predicciones/actualizar', methods=['POST'])
+def api_actualizar_predicciones():
+    """Regenera ahora las instantáneas de predicciones (solo jefe de TI)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    if not controlUsuarios.es_jefe_ti(int(session['user_id'])):
+        return jsonify({'error': 'No tiene permisos'}), 403
+    
+    resultado = generar_snapshot()
+    if resultado is None:
+        return jsonify({'success': False, 'error': 'No se pudieron generar las predicciones'}), 500
+    if resultado.get('en_curso'):
+        return jsonify({'success': False, 'error': 'Ya se están generando las predicciones, intente en unos segundos'}), 409
+    return jsonify(dict(resultado, success=True))
+
 # ============================================
 # RUTAS PARA GESTIÓN DE CONTRATOS Y FIRMAS
 # ============================================
@@ -2506,6 +2580,58 @@ def api_obtener_sello():
         print(f"Error al obtener sello: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.cli.command('migrar')
+def comando_migrar():
+    """Aplica las migraciones pendientes del esquema (flask --app run migrar)"""
+    import migraciones
+    resultado = migraciones.aplicar_migraciones()
+    if resultado is None:
+        raise SystemExit(1)
+    print(f"Migraciones aplicadas: {len(resultado)}")
+
+@app.cli.command('reconstruir-mttr')
+def comando_reconstruir_mttr():
+    """Recalcula el resumen MTTR_RESUMEN desde INCIDENTE (flask --app run reconstruir-mttr)"""
+    from controllers.control_mttr import ControlMTTR
+    if not ControlMTTR.reconstruir_resumen():
+        raise SystemExit(1)
+
+@app.cli.command('reconstruir-anomalias')
+@click.option('--dias', default=90, show_default=True, help='Días de historia a recorrer')
+def comando_reconstruir_anomalias(dias):
+    """Recalcula el estado del detector de anomalías (flask --app run reconstruir-anomalias)"""
+    from controllers.control_anomalias import ControlAnomalias
+    if not ControlAnomalias.reconstruir_estado(dias):
+        raise SystemExit(1)
+
+@app.cli.command('precalcular')
+@click.option('--continuo', is_flag=True, help='Regenerar cada PRECALCULO_INTERVALO segundos')
+def comando_precalcular(continuo):
+    """Genera las instantáneas de predicciones (flask --app run precalcular [--continuo])"""
+    import precalculo
+    if not precalculo.ejecutar_trabajador(continuo=continuo):
+        raise SystemExit(1)
+
+@app.cli.command('entrenar-modelos')
+def comando_entrenar_modelos():
+    """Ajusta y guarda los modelos de pronóstico (flask --app run entrenar-modelos)"""
+    import pronostico
+    if pronostico.entrenar() is None:
+        raise SystemExit(1)
+
+@app.cli.command('backtest-modelos')
+def comando_backtest_modelos():
+    """Reporta el error de pronóstico sobre las últimas 4 semanas (flask --app run backtest-modelos)"""
+    import pronostico
+    if pronostico.backtest() is None:
+        raise SystemExit(1)
+
 if __name__ == '__main__':
+    # Aplicar migraciones pendientes antes de atender peticiones (la DDL no se ejecuta en las rutas)
+    import migraciones
+    migraciones.aplicar_migraciones()
+    # Predicciones precalculadas en segundo plano (solo en el proceso hijo del reloader)
+    import precalculo
+    precalculo.iniciar_planificador(usa_reloader=True)
     # host='0.0.0.0' permite acceso desde otros dispositivos en la red
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
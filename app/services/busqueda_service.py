@@ -0,0 +1,64 @@
+"""
+Servicio de búsqueda de texto en incidentes y diagnósticos
+Arma las condiciones y el ranking SQL sobre las columnas tsvector `busqueda`
+(ver scripts_sql/migraciones/003_busqueda_texto.sql) con respaldo de trigramas para palabras
+incompletas
+"""
+import re
+
+
+class BusquedaService:
+    """Fragmentos SQL parametrizados para búsqueda con ranking"""
+
+    CONFIGURACION = 'spanish'
+    LONGITUD_MAXIMA = 200
+
+    @staticmethod
+    def normalizar(texto):
+        """Limpia el texto ingresado por el usuario (espacios y longitud)"""
+        texto = re.sub(r'\s+', ' ', str(texto or '')).strip()
+        return texto[:BusquedaService.LONGITUD_MAXIMA]
+
+    @staticmethod
+    def patron_like(texto):
+        """Patrón '%texto%' con los comodines de LIKE escapados"""
+        escapado = texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return f"%{escapado}%"
+
+    @staticmethod
+    def _consulta():
+        return f"websearch_to_tsquery('{BusquedaService.CONFIGURACION}', %s)"
+
+    @staticmethod
+    def condicion(texto, columna_vector, columnas_parciales=()):
+        """
+        Condición de búsqueda: coincide por texto completo (índice GIN sobre
+        columna_vector) o por coincidencia parcial en columnas_parciales
+        (índice de trigramas).
+
+        Returns:
+            tuple: (sql, params)
+        """
+        partes = [f"{columna_vector} @@ {BusquedaService._consulta()}"]
+        params = [texto]
+        patron = BusquedaService.patron_like(texto)
+        for columna in columnas_parciales:
+            partes.append(f"{columna} ILIKE %s")
+            params.append(patron)
+        return "(" + " OR ".join(partes) + ")", params
+
+    @staticmethod
+    def ranking(texto, columna_vector, columna_similitud=None):
+        """
+        Expresión de relevancia para ORDER BY: ts_rank_cd del texto completo más
+        la similitud de trigramas (si se indica una columna).
+
+        Returns:
+            tuple: (sql, params)
+        """
+        expresion = f"ts_rank_cd({columna_vector}, {BusquedaService._consulta()})"
+        params = [texto]
+        if columna_similitud:
+            expresion += f" + COALESCE(similarity({columna_similitud}, %s), 0)"
+            params.append(texto)
+        return expresion, params
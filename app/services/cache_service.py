@@ -0,0 +1,135 @@
+"""
+Caché en memoria del proceso para tablas de referencia (ROL, AREA, CATEGORIA)
+Estas tablas cambian muy pocas veces, así que se leen de la BD una vez y se
+reutilizan hasta que vence el TTL o una escritura invalida la caché
+"""
+import copy
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheTTL:
+    """Caché LRU con tiempo de vida, segura entre hilos y con contadores de aciertos/fallos"""
+
+    _registro = {}
+    _registro_lock = threading.Lock()
+
+    def __init__(self, nombre, ttl=600, max_entradas=256):
+        self.nombre = nombre
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()     # clave -> (expira, valor)
+        self._lock = threading.Lock()
+        self._generacion = 0            # sube con cada invalidar()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        with CacheTTL._registro_lock:
+            CacheTTL._registro[nombre] = self
+
+    def obtener(self, clave, cargar, guardar_si=bool):
+        """
+        Retorna el valor de la clave; si no está o venció, lo carga con cargar().
+        Solo se guardan los valores para los que guardar_si(valor) es verdadero:
+        por defecto los vacíos (None, [], False) no se guardan para no fijar en
+        caché el resultado de un error de conexión. Tampoco se guarda si la
+        caché se invalidó mientras se cargaba (el valor puede ser anterior al cambio).
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada and entrada[0] > ahora:
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return copy.deepcopy(entrada[1])
+            self.fallos += 1
+            generacion = self._generacion
+
+        valor = cargar()
+        if not guardar_si(valor):
+            return valor
+
+        with self._lock:
+            if self._generacion != generacion:
+                return copy.deepcopy(valor)
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self.expulsiones += 1
+        # Copia para que quien llama no modifique el valor guardado
+        return copy.deepcopy(valor)
+
+    def invalidar(self, clave=None):
+        """Elimina una clave o, sin argumentos, toda la caché"""
+        with self._lock:
+            self._generacion += 1
+            if clave is None:
+                self._datos.clear()
+            else:
+                self._datos.pop(clave, None)
+
+    def memorizar(self, funcion):
+        """Decorador: cachea el resultado de la función según sus argumentos"""
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            clave = (funcion.__qualname__, args, tuple(sorted(kwargs.items())))
+            return self.obtener(clave, lambda: funcion(*args, **kwargs))
+        return envoltura
+
+    def metricas(self):
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._datos),
+                'max_entradas': self.max_entradas,
+                'ttl': self.ttl,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'expulsiones': self.expulsiones,
+                'tasa_aciertos': round(self.aciertos / total, 3) if total else 0.0
+            }
+
+    @staticmethod
+    def metricas_todas():
+        """Métricas de todas las cachés creadas en el proceso"""
+        with CacheTTL._registro_lock:
+            caches = list(CacheTTL._registro.values())
+        return {cache.nombre: cache.metricas() for cache in caches}
+
+    @staticmethod
+    def invalidar_todas():
+        with CacheTTL._registro_lock:
+            caches = list(CacheTTL._registro.values())
+        for cache in caches:
+            cache.invalidar()
+
+
+class CacheVersionada(CacheTTL):
+    """
+    CacheTTL cuyas claves incluyen un número de versión de los datos.
+    incrementar_version() descarta todo lo guardado; además, un resultado que
+    empezó a calcularse antes del cambio queda guardado con la versión vieja y
+    ya no se sirve.
+    """
+
+    def __init__(self, nombre, ttl=600, max_entradas=256):
+        super().__init__(nombre, ttl, max_entradas)
+        self.version = 0
+
+    def obtener(self, clave, cargar, guardar_si=bool):
+        with self._lock:
+            version = self.version
+        return super().obtener((version, clave), cargar, guardar_si)
+
+    def incrementar_version(self):
+        with self._lock:
+            self.version += 1
+        self.invalidar()
+
+    def metricas(self):
+        metricas = super().metricas()
+        metricas['version'] = self.version
+        return metricas
@@ -0,0 +1,60 @@
+"""
+Buffer de frames del login facial por WebSocket
+Quien recibe del socket deja cada frame con poner() y el hilo que verifica los
+toma con tomar(). Si la verificación va más lenta que la cámara el buffer se
+llena y se descarta el frame más viejo: siempre se verifica lo más reciente y
+la memoria no crece.
+"""
+import threading
+from collections import deque
+
+
+class CanalFrames:
+    """Cola acotada con descarte del más antiguo, segura entre dos hilos"""
+
+    def __init__(self, capacidad=2):
+        self._frames = deque()
+        self._capacidad = capacidad
+        self._condicion = threading.Condition()
+        self._cerrado = False
+        self._descartados = 0       # desde la última vez que se tomó un frame
+        self.total_descartados = 0
+
+    @property
+    def abierto(self):
+        return not self._cerrado
+
+    def poner(self, frame):
+        """Agrega un frame; si el buffer está lleno descarta el más viejo"""
+        with self._condicion:
+            if self._cerrado:
+                return
+            if len(self._frames) >= self._capacidad:
+                self._frames.popleft()
+                self._descartados += 1
+                self.total_descartados += 1
+            self._frames.append(frame)
+            self._condicion.notify()
+
+    def tomar(self, espera=None):
+        """
+        Espera el siguiente frame.
+
+        Returns:
+            tuple: (frame, descartados desde el frame anterior), o None si el
+            canal se cerró o venció la espera
+        """
+        with self._condicion:
+            while not self._frames and not self._cerrado:
+                if not self._condicion.wait(espera):
+                    return None
+            if self._cerrado:
+                return None
+            descartados, self._descartados = self._descartados, 0
+            return self._frames.popleft(), descartados
+
+    def cerrar(self):
+        with self._condicion:
+            self._cerrado = True
+            self._frames.clear()
+            self._condicion.notify_all()
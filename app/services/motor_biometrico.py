@@ -0,0 +1,111 @@
+"""
+Motor biométrico compartido
+Carga una sola vez por proceso el clasificador Haar de rostros, el detector
+ORB y el matcher que usan los controladores de biometría (leer el XML de la
+cascada en cada frame era lo más costoso del login por video).
+
+Los objetos de OpenCV no son seguros para usarse desde varios hilos a la vez:
+cada hilo toma un juego propio de un pool y lo devuelve al terminar. El pool
+sobrevive a los hilos, así que el servidor (un hilo por petición) reutiliza
+los juegos ya cargados en lugar de crear uno por petición.
+"""
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+ARCHIVO_CASCADA = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+
+
+class _Detectores:
+    """Juego de detectores de uso exclusivo mientras un hilo lo tiene prestado"""
+
+    def __init__(self):
+        self.cascada = cv2.CascadeClassifier(ARCHIVO_CASCADA)
+        if self.cascada.empty():
+            raise RuntimeError(f"No se pudo cargar la cascada {ARCHIVO_CASCADA}")
+        self.orb = cv2.ORB_create(nfeatures=MotorBiometrico.CARACTERISTICAS_ORB)
+        self.matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+
+
+class MotorBiometrico:
+    """Detección de rostros y características ORB con detectores precargados"""
+
+    CARACTERISTICAS_ORB = 500
+
+    _libres = queue.LifoQueue()
+    _creados = 0
+    _lock = threading.Lock()
+    _calentado = False
+
+    @staticmethod
+    @contextmanager
+    def detectores():
+        """Presta un juego de detectores al hilo actual (se crea uno si no hay libres)"""
+        try:
+            juego = MotorBiometrico._libres.get_nowait()
+        except queue.Empty:
+            juego = _Detectores()
+            with MotorBiometrico._lock:
+                MotorBiometrico._creados += 1
+        try:
+            yield juego
+        finally:
+            MotorBiometrico._libres.put(juego)
+
+    @staticmethod
+    def detectar_rostros(gris, **parametros):
+        """detectMultiScale de la cascada de rostros sobre una imagen en grises"""
+        with MotorBiometrico.detectores() as juego:
+            return juego.cascada.detectMultiScale(gris, **parametros)
+
+    @staticmethod
+    def caracteristicas(gris):
+        """(keypoints, descriptores) ORB de una imagen en grises"""
+        with MotorBiometrico.detectores() as juego:
+            return juego.orb.detectAndCompute(gris, None)
+
+    @staticmethod
+    def emparejar(descriptores1, descriptores2):
+        """Coincidencias de descriptores ORB (Hamming con verificación cruzada)"""
+        with MotorBiometrico.detectores() as juego:
+            return juego.matcher.match(descriptores1, descriptores2)
+
+    @staticmethod
+    def calentar():
+        """
+        Carga el primer juego de detectores y hace una inferencia de prueba para
+        que la primera verificación no pague la inicialización. Se llama al
+        arrancar la aplicación; las siguientes llamadas no hacen nada.
+
+        Returns:
+            bool: False si OpenCV no pudo cargar los detectores
+        """
+        if MotorBiometrico._calentado:
+            return True
+        try:
+            inicio = time.perf_counter()
+            generador = np.random.default_rng(0)
+            imagen = generador.integers(0, 256, (240, 320), dtype=np.uint8)
+            MotorBiometrico.detectar_rostros(imagen, scaleFactor=1.1, minNeighbors=5, minSize=(100, 100))
+            _, descriptores = MotorBiometrico.caracteristicas(cv2.resize(imagen, (200, 200)))
+            if descriptores is not None:
+                MotorBiometrico.emparejar(descriptores, descriptores)
+            MotorBiometrico._calentado = True
+            print(f"🙂 Motor biométrico listo ({(time.perf_counter() - inicio) * 1000:.0f} ms)")
+            return True
+        except Exception as e:
+            print(f"⚠️ No se pudo preparar el motor biométrico => {e}")
+            return False
+
+    @staticmethod
+    def metricas():
+        """Juegos de detectores creados y libres en el pool"""
+        return {
+            'creados': MotorBiometrico._creados,
+            'libres': MotorBiometrico._libres.qsize(),
+            'calentado': MotorBiometrico._calentado
+        }
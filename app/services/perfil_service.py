@@ -0,0 +1,93 @@
+"""
+Servicio de perfil del usuario logueado
+Guarda en caché (por petición y en la sesión) los permisos del rol y el
+contador de notificaciones que usan todas las plantillas
+"""
+import os
+import threading
+import time
+from flask import g, session, has_app_context, has_request_context
+
+
+class PerfilService:
+    """Caché del perfil con invalidación explícita por usuario"""
+
+    # Tiempo máximo que un perfil guardado en la sesión se considera válido.
+    # Acota el desfase cuando el cambio ocurre en otro proceso del servidor.
+    TTL_SEGUNDOS = 60
+
+    # Identifica este proceso: un perfil guardado por otro proceso o antes de
+    # un reinicio no coincide y se vuelve a consultar
+    _epoca = f"{os.getpid()}-{int(time.time())}"
+    _version_global = 0
+    _versiones = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _version(id_usuario):
+        with PerfilService._lock:
+            return f"{PerfilService._epoca}:{PerfilService._version_global}:{PerfilService._versiones.get(id_usuario, 0)}"
+
+    @staticmethod
+    def obtener(id_usuario):
+        """
+        Retorna el perfil del usuario (ver controlUsuarios.obtener_perfil)
+
+        Orden de búsqueda: caché de la petición -> sesión -> base de datos.
+
+        Returns:
+            dict: perfil o None si no se pudo obtener
+        """
+        from controllers.control_Usuarios import controlUsuarios
+
+        id_usuario = int(id_usuario)
+
+        if has_app_context():
+            perfil = g.get('_perfil_usuario')
+            if perfil and perfil['id_usuario'] == id_usuario:
+                return perfil
+
+        version = PerfilService._version(id_usuario)
+
+        if has_request_context():
+            guardado = session.get('perfil_usuario')
+            if guardado and guardado.get('id_usuario') == id_usuario \
+                    and guardado.get('version') == version \
+                    and guardado.get('expira', 0) > time.time():
+                perfil = guardado['datos']
+                g._perfil_usuario = perfil
+                return perfil
+
+        perfil = controlUsuarios.obtener_perfil(id_usuario)
+        if perfil is None:
+            return None
+
+        if has_app_context():
+            g._perfil_usuario = perfil
+        if has_request_context():
+            session['perfil_usuario'] = {
+                'id_usuario': id_usuario,
+                'version': version,
+                'expira': time.time() + PerfilService.TTL_SEGUNDOS,
+                'datos': perfil
+            }
+        return perfil
+
+    @staticmethod
+    def invalidar(id_usuario=None):
+        """
+        Marca como obsoleto el perfil de un usuario (cambio de rol, nueva
+        notificación, notificación leída). Sin id_usuario invalida todos.
+        """
+        with PerfilService._lock:
+            if id_usuario is None:
+                PerfilService._version_global += 1
+                PerfilService._versiones.clear()
+            else:
+                id_usuario = int(id_usuario)
+                PerfilService._versiones[id_usuario] = PerfilService._versiones.get(id_usuario, 0) + 1
+
+        if has_app_context():
+            perfil = g.get('_perfil_usuario')
+            if perfil and (id_usuario is None or perfil['id_usuario'] == id_usuario):
+                g.pop('_perfil_usuario', None)
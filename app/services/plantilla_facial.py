@@ -0,0 +1,97 @@
+"""
+Plantilla facial precalculada
+Al enrolar se extraen una vez los keypoints y descriptores ORB del rostro y
+su histograma HSV; eso es lo que se guarda en USUARIO.encoding_facial. Al
+verificar solo se procesa el frame recibido.
+
+Formato binario (little-endian):
+    cabecera  '<4sBHHH': MAGIA, versión, n keypoints, bytes por descriptor, largo del histograma
+    keypoints float32 (n, 6): x, y, size, angle, response, octave
+    descriptores uint8 (n, bytes por descriptor)
+    histograma float32 (largo)
+
+Los registros anteriores (imagen 200x200 BGR serializada con pickle) se siguen
+leyendo: se convierten a plantilla al cargarlos.
+"""
+import pickle
+import struct
+
+import cv2
+import numpy as np
+
+from services.motor_biometrico import MotorBiometrico
+
+MAGIA = b'PGFT'
+VERSION = 1
+CABECERA = struct.Struct('<4sBHHH')
+CAMPOS_KEYPOINT = 6
+
+
+class PlantillaFacial:
+    """Características de un rostro enrolado: keypoints, descriptores ORB e histograma"""
+
+    def __init__(self, keypoints, descriptores, histograma):
+        self.keypoints = keypoints          # float32 (n, 6)
+        self.descriptores = descriptores    # uint8 (n, 32) o None si no hubo características
+        self.histograma = histograma        # float32 (512,) normalizado
+
+    @staticmethod
+    def calcular_histograma(rostro, conversion=cv2.COLOR_BGR2HSV):
+        """Histograma HSV 8x8x8 normalizado (conversion indica si el rostro es BGR o RGB)"""
+        hsv = cv2.cvtColor(rostro, conversion)
+        hist = cv2.calcHist([hsv], [0, 1, 2], None, [8, 8, 8], [0, 180, 0, 256, 0, 256])
+        return cv2.normalize(hist, hist).flatten()
+
+    @staticmethod
+    def desde_rostro(rostro_bgr):
+        """Extrae la plantilla de un rostro recortado (BGR, 200x200)"""
+        gris = cv2.cvtColor(rostro_bgr, cv2.COLOR_BGR2GRAY)
+        keypoints, descriptores = MotorBiometrico.caracteristicas(gris)
+        puntos = np.array([(k.pt[0], k.pt[1], k.size, k.angle, k.response, k.octave) for k in keypoints],
+                          dtype=np.float32).reshape(-1, CAMPOS_KEYPOINT)
+        return PlantillaFacial(puntos, descriptores, PlantillaFacial.calcular_histograma(rostro_bgr))
+
+    def empaquetar(self):
+        """Bytes de la plantilla en el formato versionado"""
+        descriptores = self.descriptores if self.descriptores is not None else np.empty((0, 32), np.uint8)
+        histograma = np.asarray(self.histograma, dtype=np.float32)
+        return b''.join([
+            CABECERA.pack(MAGIA, VERSION, len(descriptores), descriptores.shape[1], len(histograma)),
+            np.ascontiguousarray(self.keypoints[:len(descriptores)], dtype='<f4').tobytes(),
+            np.ascontiguousarray(descriptores, dtype=np.uint8).tobytes(),
+            histograma.astype('<f4').tobytes()
+        ])
+
+    @staticmethod
+    def desempaquetar(datos):
+        """
+        Lee una plantilla guardada (formato actual o imagen serializada con pickle).
+
+        Returns:
+            PlantillaFacial o None si los datos no son válidos
+        """
+        try:
+            datos = bytes(datos)
+            if not datos.startswith(MAGIA):
+                # Registro anterior: imagen del rostro serializada
+                rostro = pickle.loads(datos)
+                return PlantillaFacial.desde_rostro(rostro)
+
+            _, version, cantidad, ancho, largo_hist = CABECERA.unpack_from(datos)
+            if version != VERSION:
+                print(f"⚠️ Versión de plantilla facial no soportada: {version}")
+                return None
+
+            inicio = CABECERA.size
+            fin = inicio + cantidad * CAMPOS_KEYPOINT * 4
+            keypoints = np.frombuffer(datos[inicio:fin], dtype='<f4').reshape(cantidad, CAMPOS_KEYPOINT)
+            inicio, fin = fin, fin + cantidad * ancho
+            descriptores = np.frombuffer(datos[inicio:fin], dtype=np.uint8).reshape(cantidad, ancho)
+            inicio, fin = fin, fin + largo_hist * 4
+            histograma = np.frombuffer(datos[inicio:fin], dtype='<f4')
+
+            return PlantillaFacial(keypoints, descriptores if cantidad else None, histograma)
+
+        except Exception as e:
+            print(f"❌ Error al leer plantilla facial: {e}")
+            return None
@@ -0,0 +1,212 @@
+"""
+Servicio de pronóstico de incidentes por categoría
+Holt-Winters aditivo (nivel, tendencia amortiguada y estacionalidad semanal)
+sobre la serie diaria, después de quitar un factor por mes del año. Los
+modelos se ajustan fuera de línea (ver pronostico.py), se guardan como JSON
+versionado en app/modelos y se cargan una sola vez por proceso; pronosticar
+con un modelo cargado es aritmética sobre unos pocos números.
+"""
+import glob
+import json
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+DIRECTORIO_MODELOS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'modelos')
+PREFIJO_ARCHIVO = 'pronostico_incidentes_'
+
+# Versión del formato del archivo; uno con otro formato se ignora
+FORMATO = 1
+
+
+class PronosticoService:
+    """Ajuste, pronóstico y persistencia de los modelos por categoría"""
+
+    TEMPORADA = 7                   # estacionalidad semanal (días)
+    MINIMO_DIAS = 4 * 7             # historia mínima para ajustar un modelo
+
+    # Rejilla de parámetros de suavizado que se prueba al ajustar
+    ALFAS = (0.05, 0.1, 0.2, 0.35, 0.5)
+    BETAS = (0.01, 0.05, 0.15)
+    GAMMAS = (0.05, 0.15, 0.3)
+    AMORTIGUACIONES = (0.9, 0.98)
+
+    _modelos = None
+    _lock = threading.Lock()
+
+    # ---------- Ajuste ----------
+
+    @staticmethod
+    def factores_mensuales(fechas, valores):
+        """
+        Factor por mes del año (1-12): promedio diario del mes / promedio general,
+        acercado a 1 cuando hay pocos años observados de ese mes.
+        """
+        meses = np.array([f.month for f in fechas])
+        anios = np.array([f.year for f in fechas])
+        promedio = valores.mean() if len(valores) else 0.0
+        factores = {}
+        for mes in range(1, 13):
+            en_mes = meses == mes
+            if not en_mes.any() or promedio <= 0:
+                factores[mes] = 1.0
+                continue
+            observados = len(np.unique(anios[en_mes]))
+            crudo = valores[en_mes].mean() / promedio
+            factores[mes] = float(1 + (crudo - 1) * observados / (observados + 1))
+        return factores
+
+    @staticmethod
+    def _suavizar(y, alfa, beta, gamma, phi):
+        """Recorre la serie; retorna (error cuadrático de un paso, nivel, tendencia, estacionalidad)"""
+        m = PronosticoService.TEMPORADA
+        nivel = y[:m].mean()
+        tendencia = (y[m:2 * m].mean() - y[:m].mean()) / m
+        estacional = y[:m] - nivel
+        error = 0.0
+        for t in range(m, len(y)):
+            i = t % m
+            prediccion = nivel + phi * tendencia + estacional[i]
+            error += (y[t] - prediccion) ** 2
+            nivel_anterior = nivel
+            nivel = alfa * (y[t] - estacional[i]) + (1 - alfa) * (nivel + phi * tendencia)
+            tendencia = beta * (nivel - nivel_anterior) + (1 - beta) * phi * tendencia
+            estacional[i] = gamma * (y[t] - nivel) + (1 - gamma) * estacional[i]
+        return error, nivel, tendencia, estacional
+
+    @staticmethod
+    def ajustar(fechas, valores):
+        """
+        Ajusta un modelo a una serie diaria consecutiva.
+
+        Args:
+            fechas: lista de date consecutivas
+            valores: conteos diarios (mismo largo)
+
+        Returns:
+            dict: parámetros y estado del modelo, o None si la serie es muy corta
+        """
+        valores = np.asarray(valores, dtype=float)
+        if len(valores) < PronosticoService.MINIMO_DIAS:
+            return None
+
+        factores = PronosticoService.factores_mensuales(fechas, valores)
+        ajustada = valores / np.array([factores[f.month] for f in fechas])
+
+        mejor = None
+        for alfa in PronosticoService.ALFAS:
+            for beta in PronosticoService.BETAS:
+                for gamma in PronosticoService.GAMMAS:
+                    for phi in PronosticoService.AMORTIGUACIONES:
+                        resultado = PronosticoService._suavizar(ajustada, alfa, beta, gamma, phi)
+                        if mejor is None or resultado[0] < mejor[0][0]:
+                            mejor = (resultado, (alfa, beta, gamma, phi))
+
+        (error, nivel, tendencia, estacional), (alfa, beta, gamma, phi) = mejor
+        # Alinear la estacionalidad para que el índice 0 sea el día siguiente al último observado
+        siguiente = len(ajustada) % PronosticoService.TEMPORADA
+        estacional = np.roll(estacional, -siguiente)
+
+        return {
+            'alfa': alfa, 'beta': beta, 'gamma': gamma, 'phi': phi,
+            'nivel': float(nivel),
+            'tendencia': float(tendencia),
+            'estacional': [float(v) for v in estacional],
+            'factores_mes': {str(mes): factor for mes, factor in factores.items()},
+            'ultima_fecha': fechas[-1].isoformat(),
+            'dias_historia': len(valores),
+            'rmse_un_paso': float(np.sqrt(error / max(1, len(valores) - PronosticoService.TEMPORADA)))
+        }
+
+    # ---------- Pronóstico ----------
+
+    @staticmethod
+    def pronosticar(modelo, dias):
+        """
+        Conteos diarios pronosticados para los `dias` días siguientes a la última
+        fecha del modelo.
+
+        Returns:
+            tuple: (lista de date, np.array de valores >= 0)
+        """
+        ultima = date.fromisoformat(modelo['ultima_fecha'])
+        pasos = np.arange(1, dias + 1)
+        phi = modelo['phi']
+        # Tendencia amortiguada: suma de phi^1..phi^h
+        amortiguada = phi * (1 - phi ** pasos) / (1 - phi) if phi < 1 else pasos.astype(float)
+        estacional = np.array(modelo['estacional'])[(pasos - 1) % PronosticoService.TEMPORADA]
+        fechas = [ultima + timedelta(days=int(h)) for h in pasos]
+        factores = np.array([modelo['factores_mes'][str(f.month)] for f in fechas])
+        valores = (modelo['nivel'] + amortiguada * modelo['tendencia'] + estacional) * factores
+        return fechas, np.clip(valores, 0, None)
+
+    @staticmethod
+    def pronosticar_mes(modelo, anio, mes):
+        """Total pronosticado para un mes calendario (posterior a la última fecha del modelo)"""
+        ultima = date.fromisoformat(modelo['ultima_fecha'])
+        inicio = date(anio, mes, 1)
+        fin = date(anio + (mes == 12), mes % 12 + 1, 1)
+        if fin <= ultima:
+            return None
+        fechas, valores = PronosticoService.pronosticar(modelo, (fin - ultima).days - 1)
+        en_mes = np.array([inicio <= f < fin for f in fechas])
+        return float(valores[en_mes].sum())
+
+    # ---------- Persistencia ----------
+
+    @staticmethod
+    def guardar(modelos, metricas=None):
+        """
+        Guarda un nuevo artefacto versionado y lo deja como el activo del proceso.
+
+        Returns:
+            str: ruta del archivo
+        """
+        os.makedirs(DIRECTORIO_MODELOS, exist_ok=True)
+        version = datetime.now().strftime('%Y%m%d%H%M%S')
+        artefacto = {
+            'formato': FORMATO,
+            'version': version,
+            'generado': datetime.now().isoformat(),
+            'metricas': metricas or {},
+            'categorias': modelos
+        }
+        ruta = os.path.join(DIRECTORIO_MODELOS, f"{PREFIJO_ARCHIVO}{version}.json")
+        temporal = ruta + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            json.dump(artefacto, archivo, ensure_ascii=False, indent=1)
+        os.replace(temporal, ruta)
+        with PronosticoService._lock:
+            PronosticoService._modelos = artefacto
+        return ruta
+
+    @staticmethod
+    def _leer_ultimo():
+        for ruta in sorted(glob.glob(os.path.join(DIRECTORIO_MODELOS, f"{PREFIJO_ARCHIVO}*.json")), reverse=True):
+            try:
+                with open(ruta, 'r', encoding='utf-8') as archivo:
+                    artefacto = json.load(archivo)
+                if artefacto.get('formato') == FORMATO:
+                    print(f"📈 Modelos de pronóstico cargados: versión {artefacto['version']} "
+                          f"({len(artefacto['categorias'])} categorías)")
+                    return artefacto
+                print(f"⚠️ {os.path.basename(ruta)} tiene otro formato de modelo, se ignora")
+            except Exception as e:
+                print(f"⚠️ No se pudo leer el modelo {os.path.basename(ruta)} => {e}")
+        return {}
+
+    @staticmethod
+    def artefacto():
+        """Artefacto activo (el más reciente de app/modelos), leído una sola vez; {} si no hay"""
+        if PronosticoService._modelos is None:
+            with PronosticoService._lock:
+                if PronosticoService._modelos is None:
+                    PronosticoService._modelos = PronosticoService._leer_ultimo()
+        return PronosticoService._modelos
+
+    @staticmethod
+    def modelo(categoria):
+        """Modelo de una categoría o None (se usa entonces el promedio ponderado)"""
+        return PronosticoService.artefacto().get('categorias', {}).get(categoria)
@@ -0,0 +1,270 @@
+"""
+Sesiones de verificación facial (login por video)
+Al iniciar la verificación se guarda la plantilla del usuario, ya leída, y
+los contadores de frames en el servidor; el navegador solo recibe un token
+opaco y lo envía con cada frame. Así la cookie no lleva la plantilla y cada
+frame no vuelve a decodificarla.
+
+Backends (variable de entorno VERIFICACION_BACKEND):
+- 'memoria' (por defecto): LRU con TTL en el proceso. Sirve con un solo
+  proceso web (o con afinidad de sesión).
+- 'postgres': tabla VERIFICACION_SESION (migración 010), compartida entre
+  procesos. Cada proceso conserva la plantilla ya leída en su LRU local.
+"""
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from ConexionBD import get_connection
+from services.plantilla_facial import PlantillaFacial
+
+BACKEND = os.environ.get('VERIFICACION_BACKEND', 'memoria')
+
+# Segundos sin frames tras los que vence una verificación
+TTL_SEGUNDOS = int(os.environ.get('VERIFICACION_TTL', 120))
+MAX_SESIONES = 512
+
+
+class SesionesVerificacion:
+    """Almacén de verificaciones en curso, identificadas por token"""
+
+    # token -> {'expira', 'plantilla', 'usuario', 'match_count', 'total_frames', 'seguimiento'}
+    # ('seguimiento': última caja del rostro en este proceso, ver ControlBiometriaOpenCV.detectar_rostro)
+    _sesiones = OrderedDict()
+    _lock = threading.Lock()
+    expulsiones = 0
+
+    # ---------- Memoria local ----------
+
+    @staticmethod
+    def _guardar_local(token, sesion):
+        with SesionesVerificacion._lock:
+            SesionesVerificacion._sesiones[token] = sesion
+            SesionesVerificacion._sesiones.move_to_end(token)
+            while len(SesionesVerificacion._sesiones) > MAX_SESIONES:
+                SesionesVerificacion._sesiones.popitem(last=False)
+                SesionesVerificacion.expulsiones += 1
+
+    @staticmethod
+    def _leer_local(token):
+        """Sesión local vigente (renueva su vencimiento) o None"""
+        ahora = time.monotonic()
+        with SesionesVerificacion._lock:
+            sesion = SesionesVerificacion._sesiones.get(token)
+            if sesion is None:
+                return None
+            if sesion['expira'] <= ahora:
+                del SesionesVerificacion._sesiones[token]
+                return None
+            sesion['expira'] = ahora + TTL_SEGUNDOS
+            SesionesVerificacion._sesiones.move_to_end(token)
+            return sesion
+
+    # ---------- Operaciones ----------
+
+    @staticmethod
+    def crear(plantilla, usuario):
+        """
+        Registra una verificación nueva.
+
+        Returns:
+            str: token de la sesión, o None si no se pudo guardar
+        """
+        token = secrets.token_urlsafe(32)
+        sesion = {
+            'expira': time.monotonic() + TTL_SEGUNDOS,
+            'plantilla': plantilla,
+            'usuario': usuario,
+            'match_count': 0,
+            'total_frames': 0,
+            'seguimiento': {}
+        }
+
+        if BACKEND == 'postgres':
+            try:
+                conexion = get_connection()
+                if not conexion:
+                    return None
+                with conexion.cursor() as cursor:
+                    # Limpieza de paso: sesiones abandonadas
+                    cursor.execute("DELETE FROM VERIFICACION_SESION WHERE expira < NOW()")
+                    cursor.execute("""
+                        INSERT INTO VERIFICACION_SESION (token, plantilla, usuario, expira)
+                        VALUES (%s, %s, %s::jsonb, NOW() + make_interval(secs => %s))
+                    """, (token, plantilla.empaquetar(), json.dumps(usuario), TTL_SEGUNDOS))
+                    conexion.commit()
+                conexion.close()
+            except Exception as e:
+                print(f"❌ Error al crear sesión de verificación => {e}")
+                return None
+
+        SesionesVerificacion._guardar_local(token, sesion)
+        return token
+
+    @staticmethod
+    def _leer_postgres(token):
+        try:
+            conexion = get_connection()
+            if not conexion:
+                return None
+            with conexion.cursor() as cursor:
+                cursor.execute("""
+                    SELECT plantilla, usuario, match_count, total_frames
+                    FROM VERIFICACION_SESION
+                    WHERE token = %s AND expira > NOW()
+                """, (token,))
+                fila = cursor.fetchone()
+            conexion.close()
+            if not fila:
+                return None
+            plantilla = PlantillaFacial.desempaquetar(fila[0])
+            if plantilla is None:
+                return None
+            return {
+                'expira': time.monotonic() + TTL_SEGUNDOS,
+                'plantilla': plantilla,
+                'usuario': fila[1] if isinstance(fila[1], dict) else json.loads(fila[1]),
+                'match_count': fila[2],
+                'total_frames': fila[3],
+                'seguimiento': {}
+            }
+        except Exception as e:
+            print(f"❌ Error al leer sesión de verificación => {e}")
+            return None
+
+    @staticmethod
+    def obtener(token):
+        """
+        Sesión vigente del token.
+
+        Returns:
+            dict: {'plantilla', 'usuario', 'match_count', 'total_frames'} o None si no existe o venció
+        """
+        if not token:
+            return None
+        sesion = SesionesVerificacion._leer_local(token)
+        if sesion is None and BACKEND == 'postgres':
+            # Iniciada en otro proceso: se lee una vez y queda en la memoria local
+            sesion = SesionesVerificacion._leer_postgres(token)
+            if sesion is not None:
+                SesionesVerificacion._guardar_local(token, sesion)
+        return sesion
+
+    @staticmethod
+    def registrar_frame(token, coincide):
+        """
+        Cuenta un frame verificado: suma al contador de coincidencias
+        consecutivas o lo reinicia.
+
+        Returns:
+            tuple: (match_count, total_frames), o None si la sesión no existe
+        """
+        if BACKEND == 'postgres':
+            try:
+                conexion = get_connection()
+                if not conexion:
+                    return None
+                with conexion.cursor() as cursor:
+                    cursor.execute("""
+                        UPDATE VERIFICACION_SESION
+                        SET match_count = CASE WHEN %s THEN match_count + 1 ELSE 0 END,
+                            total_frames = total_frames + 1,
+                            expira = NOW() + make_interval(secs => %s)
+                        WHERE token = %s AND expira > NOW()
+                        RETURNING match_count, total_frames
+                    """, (coincide, TTL_SEGUNDOS, token))
+                    fila = cursor.fetchone()
+                    conexion.commit()
+                conexion.close()
+                if not fila:
+                    return None
+                with SesionesVerificacion._lock:
+                    sesion = SesionesVerificacion._sesiones.get(token)
+                    if sesion is not None:
+                        sesion['match_count'], sesion['total_frames'] = fila
+                return tuple(fila)
+            except Exception as e:
+                print(f"❌ Error al actualizar sesión de verificación => {e}")
+                return None
+
+        with SesionesVerificacion._lock:
+            sesion = SesionesVerificacion._sesiones.get(token)
+            if sesion is None:
+                return None
+            sesion['match_count'] = sesion['match_count'] + 1 if coincide else 0
+            sesion['total_frames'] += 1
+            return sesion['match_count'], sesion['total_frames']
+
+    @staticmethod
+    def completar(token, frames_requeridos):
+        """
+        Cierra una verificación que alcanzó los frames requeridos (una sola vez
+        por token, aunque lleguen dos peticiones a la vez).
+
+        Returns:
+            dict: usuario verificado, o None si la sesión no existe o no alcanzó el umbral
+        """
+        if not token:
+            return None
+        if BACKEND == 'postgres':
+            with SesionesVerificacion._lock:
+                SesionesVerificacion._sesiones.pop(token, None)
+            try:
+                conexion = get_connection()
+                if not conexion:
+                    return None
+                with conexion.cursor() as cursor:
+                    cursor.execute("""
+                        DELETE FROM VERIFICACION_SESION
+                        WHERE token = %s AND match_count >= %s AND expira > NOW()
+                        RETURNING usuario
+                    """, (token, frames_requeridos))
+                    fila = cursor.fetchone()
+                    conexion.commit()
+                conexion.close()
+                if not fila:
+                    return None
+                return fila[0] if isinstance(fila[0], dict) else json.loads(fila[0])
+            except Exception as e:
+                print(f"❌ Error al completar sesión de verificación => {e}")
+                return None
+
+        with SesionesVerificacion._lock:
+            sesion = SesionesVerificacion._sesiones.get(token)
+            if sesion is None or sesion['match_count'] < frames_requeridos:
+                return None
+            del SesionesVerificacion._sesiones[token]
+            return sesion['usuario']
+
+    @staticmethod
+    def eliminar(token):
+        """Termina la verificación (login exitoso o cancelado)"""
+        if not token:
+            return
+        with SesionesVerificacion._lock:
+            SesionesVerificacion._sesiones.pop(token, None)
+        if BACKEND == 'postgres':
+            try:
+                conexion = get_connection()
+                if not conexion:
+                    return
+                with conexion.cursor() as cursor:
+                    cursor.execute("DELETE FROM VERIFICACION_SESION WHERE token = %s", (token,))
+                    conexion.commit()
+                conexion.close()
+            except Exception as e:
+                print(f"❌ Error al eliminar sesión de verificación => {e}")
+
+    @staticmethod
+    def metricas():
+        with SesionesVerificacion._lock:
+            return {
+                'backend': BACKEND,
+                'sesiones_locales': len(SesionesVerificacion._sesiones),
+                'max_sesiones': MAX_SESIONES,
+                'ttl': TTL_SEGUNDOS,
+                'expulsiones': SesionesVerificacion.expulsiones
+            }
@@ -0,0 +1,62 @@
+"""
+Servicio de cuantiles aproximados (DDSketch) para tiempos de reparación
+Cada valor se guarda como un contador en una cubeta logarítmica; las cubetas de
+varios meses o categorías se combinan sumando contadores (GROUP BY en SQL), y
+los cuantiles se leen de la combinación con un error relativo acotado por
+PRECISION, sin ordenar los incidentes uno a uno
+"""
+import math
+
+
+class SketchService:
+    """Cubetas DDSketch: índice en SQL y lectura de cuantiles en Python"""
+
+    # Error relativo máximo de cada cuantil (2%)
+    PRECISION = 0.02
+    GAMMA = (1 + PRECISION) / (1 - PRECISION)
+    # Valores menores (menos de ~36 segundos) caen en la misma cubeta
+    VALOR_MINIMO = 0.01
+
+    CUANTILES = {'p50': 0.50, 'p90': 0.90, 'p99': 0.99}
+
+    @staticmethod
+    def indice_sql(expresion):
+        """Expresión SQL con el índice de cubeta de un valor en horas (debe coincidir con indice())"""
+        return (f"CEIL(LN(GREATEST({expresion}, {SketchService.VALOR_MINIMO})) / "
+                f"LN({1 + SketchService.PRECISION}::float8 / {1 - SketchService.PRECISION}::float8))::int")
+
+    @staticmethod
+    def indice(valor):
+        return math.ceil(math.log(max(valor, SketchService.VALOR_MINIMO)) / math.log(SketchService.GAMMA))
+
+    @staticmethod
+    def valor(indice):
+        """Valor representativo de la cubeta (a menos de PRECISION de cualquier valor dentro de ella)"""
+        return 2 * SketchService.GAMMA ** indice / (SketchService.GAMMA + 1)
+
+    @staticmethod
+    def cuantiles(cubetas):
+        """
+        Cuantiles p50/p90/p99 de un sketch.
+
+        Args:
+            cubetas: dict {indice: cantidad}
+
+        Returns:
+            dict: {'p50': horas, 'p90': horas, 'p99': horas} o valores None si está vacío
+        """
+        total = sum(cubetas.values())
+        if total <= 0:
+            return {nombre: None for nombre in SketchService.CUANTILES}
+
+        ordenadas = sorted(cubetas.items())
+        resultado = {}
+        for nombre, probabilidad in SketchService.CUANTILES.items():
+            rango = probabilidad * (total - 1)
+            acumulado = 0
+            for indice, cantidad in ordenadas:
+                acumulado += cantidad
+                if acumulado > rango:
+                    resultado[nombre] = round(SketchService.valor(indice), 2)
+                    break
+        return resultado
@@ -0,0 +1,17 @@
+-- ============================================================
+-- MIGRACIÓN 001: Tabla de revisión (rechazos) de diagnósticos
+-- Antes se creaba en cada llamada desde ControlDiagnosticos
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS REVISION_DIAGNOSTICO (
+    id_revision SERIAL PRIMARY KEY,
+    id_diagnostico INTEGER NOT NULL,
+    fecha_rechazo TIMESTAMP DEFAULT NOW(),
+    id_usuario INTEGER,
+    FOREIGN KEY (id_diagnostico) REFERENCES DIAGNOSTICO(id_diagnosticos),
+    FOREIGN KEY (id_usuario) REFERENCES USUARIO(id_usuario)
+);
+
+-- Se une por id_diagnostico en todas las consultas de diagnósticos pendientes
+CREATE INDEX IF NOT EXISTS idx_revision_diagnostico_diagnostico
+ON REVISION_DIAGNOSTICO(id_diagnostico);
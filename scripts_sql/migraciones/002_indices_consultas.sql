@@ -0,0 +1,35 @@
+-- ============================================================
+-- MIGRACIÓN 002: Índices para las consultas más frecuentes
+-- ============================================================
+
+-- Notificaciones del usuario (contador de no leídas y listado por fecha)
+CREATE INDEX IF NOT EXISTS idx_notificacion_usuario_leida_fecha
+ON NOTIFICACION(id_usuario, leida, fecha DESC);
+
+-- Equipo técnico por incidente y verificación de pertenencia
+CREATE INDEX IF NOT EXISTS idx_equipo_tecnico_incidente_usuario
+ON EQUIPO_TECNICO(id_incidente, id_usuario);
+
+-- Incidentes en los que participa un técnico (listado y conteo de tickets)
+CREATE INDEX IF NOT EXISTS idx_equipo_tecnico_usuario
+ON EQUIPO_TECNICO(id_usuario);
+
+-- Diagnósticos de un usuario en un incidente
+CREATE INDEX IF NOT EXISTS idx_diagnostico_incidente_usuario
+ON DIAGNOSTICO(id_incidente, id_usuario);
+
+-- Filtros por estado/nivel y rangos de fecha (MTTR, predicciones, gestión)
+CREATE INDEX IF NOT EXISTS idx_incidente_estado_nivel_fecha
+ON INCIDENTE(estado, nivel, fecha_reporte);
+
+-- Incidentes reportados por un jefe
+CREATE INDEX IF NOT EXISTS idx_incidente_usuario
+ON INCIDENTE(id_usuario);
+
+-- Historial del incidente en orden cronológico
+CREATE INDEX IF NOT EXISTS idx_historial_incidente_fecha
+ON HISTORIAL_INCIDENTE(id_incidente, fecha);
+
+-- Firmas pendientes de un usuario
+CREATE INDEX IF NOT EXISTS idx_contrato_firma_usuario_firmado
+ON CONTRATO_FIRMA_PENDIENTE(id_usuario, firmado);
@@ -0,0 +1,57 @@
+-- ============================================================
+-- MIGRACIÓN 003: Búsqueda de texto completo en incidentes y diagnósticos
+-- Requiere PostgreSQL 12+ (columnas generadas)
+-- ============================================================
+
+-- 1. Extensión de trigramas (búsquedas parciales con ILIKE '%texto%')
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- 2. Vector de búsqueda del incidente (se mantiene solo: columna generada)
+-- El título pesa más (A) que la descripción (B)
+ALTER TABLE INCIDENTE
+ADD COLUMN IF NOT EXISTS busqueda tsvector
+GENERATED ALWAYS AS (
+    setweight(to_tsvector('spanish', COALESCE(titulo, '')), 'A') ||
+    setweight(to_tsvector('spanish', COALESCE(descripcion, '')), 'B')
+) STORED;
+
+-- 3. Vector de búsqueda del diagnóstico
+-- Causa raíz (A), solución propuesta (B) y descripción (C)
+ALTER TABLE DIAGNOSTICO
+ADD COLUMN IF NOT EXISTS busqueda tsvector
+GENERATED ALWAYS AS (
+    setweight(to_tsvector('spanish', COALESCE(causa_raiz, '')), 'A') ||
+    setweight(to_tsvector('spanish', COALESCE(solucion_propuesta, '')), 'B') ||
+    setweight(to_tsvector('spanish', COALESCE(descripcion, '')), 'C')
+) STORED;
+
+-- 4. Índices GIN para el texto completo
+CREATE INDEX IF NOT EXISTS idx_incidente_busqueda
+ON INCIDENTE USING GIN (busqueda);
+
+CREATE INDEX IF NOT EXISTS idx_diagnostico_busqueda
+ON DIAGNOSTICO USING GIN (busqueda);
+
+-- 5. Índices de trigramas para coincidencias parciales (ILIKE) y similitud
+CREATE INDEX IF NOT EXISTS idx_incidente_titulo_trgm
+ON INCIDENTE USING GIN (titulo gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_diagnostico_causa_trgm
+ON DIAGNOSTICO USING GIN (causa_raiz gin_trgm_ops);
+
+-- ============================================================
+-- VERIFICACIÓN
+-- ============================================================
+-- EXPLAIN ANALYZE
+-- SELECT id_incidente FROM INCIDENTE
+-- WHERE busqueda @@ websearch_to_tsquery('spanish', 'impresora red');
+
+-- ============================================================
+-- NOTA: Para revertir los cambios (si es necesario):
+-- ============================================================
+-- DROP INDEX IF EXISTS idx_incidente_busqueda;
+-- DROP INDEX IF EXISTS idx_diagnostico_busqueda;
+-- DROP INDEX IF EXISTS idx_incidente_titulo_trgm;
+-- DROP INDEX IF EXISTS idx_diagnostico_causa_trgm;
+-- ALTER TABLE INCIDENTE DROP COLUMN IF EXISTS busqueda;
+-- ALTER TABLE DIAGNOSTICO DROP COLUMN IF EXISTS busqueda;
@@ -0,0 +1,54 @@
+-- ============================================================
+-- MIGRACIÓN 004: Resumen de MTTR mantenido de forma incremental
+-- Una fila por (categoría, mes de resolución, nivel) con conteo, suma y
+-- suma de cuadrados de las horas de reparación. Las páginas de MTTR leen
+-- este resumen en vez de recorrer todos los incidentes cerrados.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS MTTR_RESUMEN (
+    id_categoria INTEGER NOT NULL,
+    mes DATE NOT NULL,                          -- primer día del mes de resolución
+    nivel CHAR(1) NOT NULL,
+    cantidad INTEGER NOT NULL DEFAULT 0,        -- incidentes cerrados (T o C)
+    cantidad_medida INTEGER NOT NULL DEFAULT 0, -- de ellos, con tiempo de reparación conocido
+    suma_horas DOUBLE PRECISION NOT NULL DEFAULT 0,
+    suma_cuadrados DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_categoria, mes, nivel)
+);
+
+-- Aporte de cada incidente al resumen: permite restarlo si el incidente
+-- se vuelve a cerrar o se reabre, sin contar dos veces
+CREATE TABLE IF NOT EXISTS MTTR_RESUMEN_INCIDENTE (
+    id_incidente INTEGER PRIMARY KEY REFERENCES INCIDENTE(id_incidente),
+    id_categoria INTEGER NOT NULL,
+    mes DATE NOT NULL,
+    nivel CHAR(1) NOT NULL,
+    horas DOUBLE PRECISION
+);
+
+CREATE INDEX IF NOT EXISTS idx_mttr_resumen_mes
+ON MTTR_RESUMEN(mes);
+
+-- Carga inicial con el histórico existente
+INSERT INTO MTTR_RESUMEN_INCIDENTE (id_incidente, id_categoria, mes, nivel, horas)
+SELECT
+    id_incidente,
+    id_categoria,
+    DATE_TRUNC('month', COALESCE(fecha_resolucion, fecha_reporte))::date,
+    nivel,
+    COALESCE(EXTRACT(EPOCH FROM tiempo_reparacion),
+             EXTRACT(EPOCH FROM (fecha_resolucion - fecha_reporte))) / 3600
+FROM INCIDENTE
+WHERE estado IN ('T', 'C')
+ON CONFLICT (id_incidente) DO NOTHING;
+
+INSERT INTO MTTR_RESUMEN (id_categoria, mes, nivel, cantidad, cantidad_medida, suma_horas, suma_cuadrados)
+SELECT
+    id_categoria, mes, nivel,
+    COUNT(*),
+    COUNT(horas),
+    COALESCE(SUM(horas), 0),
+    COALESCE(SUM(horas * horas), 0)
+FROM MTTR_RESUMEN_INCIDENTE
+GROUP BY id_categoria, mes, nivel
+ON CONFLICT (id_categoria, mes, nivel) DO NOTHING;
@@ -0,0 +1,30 @@
+-- ============================================================
+-- MIGRACIÓN 005: Sketches de percentiles de MTTR (DDSketch)
+-- Por (categoría, mes de resolución, nivel) se guarda un contador por cubeta
+-- logarítmica de horas de reparación (error relativo del 2%). Los percentiles
+-- de cualquier período se obtienen sumando las cubetas de sus meses.
+-- La fórmula del índice debe coincidir con SketchService.indice_sql().
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS MTTR_SKETCH (
+    id_categoria INTEGER NOT NULL,
+    mes DATE NOT NULL,                      -- primer día del mes de resolución
+    nivel CHAR(1) NOT NULL,
+    indice INTEGER NOT NULL,                -- cubeta: CEIL(LN(horas) / LN(1.02 / 0.98))
+    cantidad INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_categoria, mes, nivel, indice)
+);
+
+CREATE INDEX IF NOT EXISTS idx_mttr_sketch_mes
+ON MTTR_SKETCH(mes);
+
+-- Carga inicial desde los aportes ya registrados en el resumen (migración 004)
+INSERT INTO MTTR_SKETCH (id_categoria, mes, nivel, indice, cantidad)
+SELECT
+    id_categoria, mes, nivel,
+    CEIL(LN(GREATEST(horas, 0.01)) / LN(1.02::float8 / 0.98::float8))::int,
+    COUNT(*)
+FROM MTTR_RESUMEN_INCIDENTE
+WHERE horas IS NOT NULL
+GROUP BY 1, 2, 3, 4
+ON CONFLICT (id_categoria, mes, nivel, indice) DO NOTHING;
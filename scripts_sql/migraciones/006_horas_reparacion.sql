@@ -0,0 +1,19 @@
+-- ============================================================
+-- MIGRACIÓN 006: Horas de reparación persistidas en INCIDENTE
+-- Columna generada (se recalcula sola al cerrar o reabrir un incidente) con
+-- tiempo_reparacion o, si falta, fecha_resolucion - fecha_reporte, en horas.
+-- Las consultas de MTTR y predicciones agregan esta columna directamente.
+-- ============================================================
+
+ALTER TABLE INCIDENTE
+ADD COLUMN IF NOT EXISTS horas_reparacion NUMERIC
+GENERATED ALWAYS AS (
+    COALESCE(EXTRACT(EPOCH FROM tiempo_reparacion),
+             EXTRACT(EPOCH FROM (fecha_resolucion - fecha_reporte))) / 3600
+) STORED;
+
+-- Índice parcial: solo incidentes cerrados con tiempo conocido (los que usan
+-- las métricas), cubriendo los filtros por categoría y nivel
+CREATE INDEX IF NOT EXISTS idx_incidente_horas_cerrados
+ON INCIDENTE(id_categoria, nivel, horas_reparacion)
+WHERE estado IN ('T', 'C') AND horas_reparacion IS NOT NULL;
@@ -0,0 +1,13 @@
+-- ============================================================
+-- MIGRACIÓN 007: Instantáneas precalculadas de predicciones
+-- El planificador (app/precalculo.py) guarda aquí la respuesta de cada
+-- endpoint de /api/predicciones/* para las opciones de la página; las rutas
+-- las sirven directamente e informan su antigüedad.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS PREDICCION_SNAPSHOT (
+    clave VARCHAR(100) PRIMARY KEY,             -- endpoint y parámetros, p. ej. 'categorias:meses=3'
+    datos JSONB NOT NULL,
+    fecha_generacion TIMESTAMP NOT NULL DEFAULT NOW(),
+    duracion_ms INTEGER
+);
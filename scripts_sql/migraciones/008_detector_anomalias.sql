@@ -0,0 +1,32 @@
+-- ============================================================
+-- MIGRACIÓN 008: Detector de anomalías en línea (EWMA por categoría)
+-- ANOMALIA_ESTADO guarda, por categoría, la media y varianza exponenciales
+-- de incidentes por día y el conteo del día en curso; se actualiza en cada
+-- incidente registrado (ver ControlAnomalias). Cuando el conteo del día se
+-- aleja de la media se registra (o actualiza) un evento en ANOMALIA_EVENTO.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS ANOMALIA_ESTADO (
+    id_categoria INTEGER PRIMARY KEY REFERENCES CATEGORIA(id_categoria),
+    dia DATE NOT NULL,                          -- día del conteo en curso
+    cantidad_dia INTEGER NOT NULL DEFAULT 0,
+    media DOUBLE PRECISION NOT NULL DEFAULT 0,  -- EWMA de incidentes por día (días cerrados)
+    varianza DOUBLE PRECISION NOT NULL DEFAULT 0,
+    dias_observados INTEGER NOT NULL DEFAULT 0,
+    actualizado TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS ANOMALIA_EVENTO (
+    id_evento SERIAL PRIMARY KEY,
+    id_categoria INTEGER NOT NULL REFERENCES CATEGORIA(id_categoria),
+    dia DATE NOT NULL,
+    cantidad INTEGER NOT NULL,
+    media DOUBLE PRECISION NOT NULL,
+    desviacion DOUBLE PRECISION NOT NULL,
+    puntaje_z DOUBLE PRECISION NOT NULL,
+    fecha_deteccion TIMESTAMP NOT NULL DEFAULT NOW(),
+    UNIQUE (id_categoria, dia)
+);
+
+CREATE INDEX IF NOT EXISTS idx_anomalia_evento_dia
+ON ANOMALIA_EVENTO(dia DESC);
@@ -0,0 +1,29 @@
+-- ============================================================
+-- MIGRACIÓN 009: Vista de asignaciones de técnicos
+-- Un técnico trabaja un incidente por asignación directa
+-- (INCIDENTE.id_tecnico_asignado) o por ser miembro de EQUIPO_TECNICO.
+-- ASIGNACION_TECNICO une ambas fuentes (UNION ALL, columna origen) para
+-- consultar por técnico sin el "id_tecnico_asignado = x OR EXISTS (...)",
+-- que impide usar índices. Cada rama usa su propio índice.
+-- Un técnico asignado que también está en el equipo aparece dos veces
+-- (una por origen); usar COUNT(DISTINCT id_incidente) al contar.
+-- ============================================================
+
+CREATE OR REPLACE VIEW ASIGNACION_TECNICO AS
+SELECT i.id_incidente, i.id_tecnico_asignado AS id_usuario, 'A'::char(1) AS origen,
+       i.estado, i.fecha_reporte
+FROM INCIDENTE i
+WHERE i.id_tecnico_asignado IS NOT NULL
+UNION ALL
+SELECT et.id_incidente, et.id_usuario, 'E'::char(1),
+       i.estado, i.fecha_reporte
+FROM EQUIPO_TECNICO et
+JOIN INCIDENTE i ON i.id_incidente = et.id_incidente;
+
+-- Rama de asignación directa: incidentes de un técnico por estado
+CREATE INDEX IF NOT EXISTS idx_incidente_tecnico_estado
+ON INCIDENTE(id_tecnico_asignado, estado)
+WHERE id_tecnico_asignado IS NOT NULL;
+
+-- Rama de equipo: EQUIPO_TECNICO(id_usuario) e INCIDENTE(id_incidente) ya
+-- tienen índice (migración 002 y llave primaria)
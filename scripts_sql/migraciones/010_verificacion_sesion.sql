@@ -0,0 +1,20 @@
+-- ============================================================
+-- MIGRACIÓN 010: Sesiones de verificación facial en el servidor
+-- Solo se usa con VERIFICACION_BACKEND=postgres (varios procesos web): la
+-- plantilla facial y los contadores del login por video quedan aquí,
+-- identificados por un token opaco, en lugar de viajar en la cookie.
+-- Con el backend en memoria (por defecto) la tabla queda vacía.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS VERIFICACION_SESION (
+    token VARCHAR(64) PRIMARY KEY,
+    plantilla BYTEA NOT NULL,                   -- PlantillaFacial empaquetada
+    usuario JSONB NOT NULL,
+    match_count INTEGER NOT NULL DEFAULT 0,
+    total_frames INTEGER NOT NULL DEFAULT 0,
+    expira TIMESTAMP NOT NULL
+);
+
+-- Limpieza de sesiones vencidas
+CREATE INDEX IF NOT EXISTS idx_verificacion_sesion_expira
+ON VERIFICACION_SESION(expira);